@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+##
+# @file bench_engine.py
+# @brief 回测引擎基准测试，结果以JSON格式输出，用于跟踪版本间的性能变化。
+# @version 0.6
+#
+# 用法:
+#   python benchmarks/bench_engine.py --out bench.json
+#   python benchmarks/bench_engine.py --scale 0.1 --cases single,universe
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import timeit
+
+import six
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from quantdigger import Strategy, MA, __version__, set_config
+from quantdigger.digger import finance
+from quantdigger.engine.execute_unit import ExecuteUnit
+from synthetic import generate_dataset
+
+
+class MACrossStrategy(Strategy):
+    """ 单合约均线交叉策略，在on_bar中交易。 """
+
+    def on_init(self, ctx):
+        ctx.ma_fast = MA(ctx.close, 5)
+        ctx.ma_slow = MA(ctx.close, 20)
+
+    def on_bar(self, ctx):
+        if ctx.curbar <= 20:
+            return
+        if ctx.ma_fast[1] < ctx.ma_slow[1] and \
+                ctx.ma_fast[0] > ctx.ma_slow[0]:
+            if ctx.pos('short') > 0:
+                ctx.cover(ctx.close, ctx.pos('short'))
+            ctx.buy(ctx.close, 1)
+        elif ctx.ma_fast[1] > ctx.ma_slow[1] and \
+                ctx.ma_fast[0] < ctx.ma_slow[0]:
+            if ctx.pos('long') > 0:
+                ctx.sell(ctx.close, ctx.pos('long'))
+            ctx.short(ctx.close, 1)
+
+
+class LimitStrategy(Strategy):
+    """ 在收盘价上下挂限价单，未成交的订单逐根Bar撤销，用于比较
+    按Bar撮合和tick回放撮合。 """
+
+    def on_bar(self, ctx):
+        orders = ctx.open_orders
+        if orders:
+            # 每次只撤一单，按Bar撮合时同一批撤单之间可能先成交。
+            ctx.cancel(min(orders, key=lambda o: o.id))
+            return
+        if ctx.pos('long') > 0:
+            ctx.sell(ctx.close + 0.1, ctx.pos('long'))
+        else:
+            ctx.buy(ctx.close - 0.1, 1)
+        if ctx.pos('short') > 0:
+            ctx.cover(ctx.close - 0.1, ctx.pos('short'))
+        else:
+            ctx.short(ctx.close + 0.1, 1)
+
+
+class UniverseStrategy(Strategy):
+    """ 股票池策略，在on_symbol中选股，on_bar中统一下单。 """
+
+    def on_init(self, ctx):
+        ctx.ma = MA(ctx.close, 10)
+        self.to_buy = []
+        self.to_sell = []
+
+    def on_symbol(self, ctx):
+        if ctx.curbar <= 10:
+            return
+        if ctx.close[0] > ctx.ma[0] and ctx.close[1] <= ctx.ma[1]:
+            self.to_buy.append(ctx.symbol)
+        elif ctx.close[0] < ctx.ma[0]:
+            self.to_sell.append(ctx.symbol)
+
+    def on_bar(self, ctx):
+        for symbol in self.to_sell:
+            if ctx.pos(symbol=symbol) > 0:
+                ctx.sell(0, ctx.pos(symbol=symbol), symbol)
+        for symbol in self.to_buy:
+            if ctx.pos(symbol=symbol) == 0:
+                ctx.buy(0, 100, symbol)
+        self.to_buy = []
+        self.to_sell = []
+
+
+def _cases(scale):
+    bars = max(int(100000 * scale), 100)
+    stock_bars = max(int(1000 * scale), 50)
+    return [
+        {
+            'name': 'single',
+            'dataset': {'futures': 1, 'bars': bars},
+            'strategy': MACrossStrategy,
+            'strategies': 1,
+        },
+        {
+            'name': 'universe',
+            'dataset': {'futures': 0, 'stocks': max(int(500 * scale), 2),
+                        'bars': stock_bars},
+            'strategy': UniverseStrategy,
+            'strategies': 1,
+        },
+        {
+            'name': 'multi_period',
+            'dataset': {'futures': 1, 'bars': bars,
+                        'periods': ('1.Minute', '5.Minute')},
+            'strategy': MACrossStrategy,
+            'strategies': 1,
+        },
+        {
+            'name': 'many_strategies',
+            'dataset': {'futures': 1, 'bars': max(bars // 10, 100)},
+            'strategy': MACrossStrategy,
+            'strategies': 20,
+        },
+        # 同一份tick合成的数据，分别按Bar、合成路径和tick回放撮合。
+        {
+            'name': 'bar_match',
+            'dataset': {'futures': 1, 'bars': bars // 10,
+                        'ticks_per_bar': 60},
+            'strategy': LimitStrategy,
+            'strategies': 1,
+        },
+        {
+            'name': 'tick_synthetic',
+            'dataset': {'futures': 1, 'bars': bars // 10,
+                        'ticks_per_bar': 60},
+            'strategy': LimitStrategy,
+            'strategies': 1,
+            'ticks': 'synthetic',
+        },
+        {
+            'name': 'tick_replay',
+            'dataset': {'futures': 1, 'bars': bars // 10,
+                        'ticks_per_bar': 60},
+            'strategy': LimitStrategy,
+            'strategies': 1,
+            'ticks': 'file',
+        },
+    ]
+
+
+def run_case(root, case, seed):
+    """ 运行一个基准案例。
+
+    Returns:
+        dict. 各阶段耗时和吞吐量
+    """
+    path = os.path.join(root, case['name'])
+    dataset = generate_dataset(path, seed=seed, **case['dataset'])
+    pcontracts = dataset['futures'] + dataset['stocks']
+    ticks = {'synthetic': {}, 'file': dataset['ticks']}.get(case.get('ticks'))
+    set_config({'data_path': path})
+
+    start = timeit.default_timer()
+    unit = ExecuteUnit(pcontracts, ticks=ticks)
+    load_sec = timeit.default_timer() - start
+
+    start = timeit.default_timer()
+    profiles = list(unit.add_strategies([{
+        'strategy': case['strategy']('%s%d' % (case['name'], i)),
+        'capital': 100000000.0
+    } for i in range(case['strategies'])]))
+    unit.run()
+    run_sec = timeit.default_timer() - start
+
+    start = timeit.default_timer()
+    for profile in profiles:
+        finance.create_equity_curve(profile.all_holdings())
+        profile.deals()
+    post_sec = timeit.default_timer() - start
+
+    total_bars = sum(len(d) for d in six.itervalues(unit._all_data))
+    total_ticks = sum(len(t) for t in six.itervalues(ticks or {}))
+    return {
+        'name': case['name'],
+        'pcontracts': len(pcontracts),
+        'bars': total_bars,
+        'steps': len(unit._timeline),
+        'strategies': case['strategies'],
+        'load_sec': load_sec,
+        'run_sec': run_sec,
+        'post_sec': post_sec,
+        'bars_per_sec': total_bars * case['strategies'] / run_sec,
+        'ticks': total_ticks,
+        'ticks_per_sec': total_ticks * case['strategies'] / run_sec,
+        'transactions': sum(len(p.transactions()) for p in profiles),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='QuantDigger引擎基准测试')
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help='数据规模系数, 1.0为10万根分钟线/500只股票')
+    parser.add_argument('--cases', default='',
+                        help='逗号分隔的案例名，默认运行全部')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--data', default=None,
+                        help='数据生成目录，默认使用临时目录并在结束后删除')
+    parser.add_argument('--out', default=None, help='JSON结果文件')
+    args = parser.parse_args(argv)
+    set_config({'source': 'csv'})
+
+    root = args.data or tempfile.mkdtemp(prefix='qd_bench_')
+    names = [n for n in args.cases.split(',') if n]
+    results = []
+    try:
+        for case in _cases(args.scale):
+            if names and case['name'] not in names:
+                continue
+            results.append(run_case(root, case, args.seed))
+    finally:
+        if not args.data:
+            shutil.rmtree(root, ignore_errors=True)
+
+    report = {
+        'version': __version__,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'scale': args.scale,
+        'seed': args.seed,
+        'cases': results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(text)
+    six.print_(text)
+    return report
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+##
+# @file synthetic.py
+# @brief 生成基准测试用的模拟行情数据，目录结构和 CsvSource 一致。
+# @version 0.6
+
+import os
+import numpy as np
+import pandas as pd
+
+_CONTRACT_COLUMNS = [
+    'code', 'exchange', 'name', 'spell',
+    'long_margin_ratio', 'short_margin_ratio', 'price_tick',
+    'volume_multiple'
+]
+
+
+def generate_bars(n, start='2010-01-04 09:00', freq='1min', seed=0,
+                  price=100.0):
+    """ 几何随机游走生成OHLCV数据。
+
+    Args:
+        n (int): k线数目
+
+        start (str): 第一根k线时间
+
+        freq (str): pandas时间频率
+
+        seed (int): 随机种子, 相同的参数生成相同的数据
+
+        price (float): 初始价格
+
+    Returns:
+        pd.DataFrame. 以datetime为索引的 open, close, high, low, volume
+    """
+    rng = np.random.RandomState(seed)
+    close = price * np.exp(np.cumsum(rng.normal(0, 0.002, n)))
+    open_ = np.concatenate([[price], close[:-1]])
+    spread = np.abs(rng.normal(0, 0.001, n)) * close
+    data = pd.DataFrame({
+        'open': open_,
+        'close': close,
+        'high': np.maximum(open_, close) + spread,
+        'low': np.minimum(open_, close) - spread,
+        'volume': rng.randint(100, 10000, n)
+    }, index=pd.date_range(start, periods=n, freq=freq, name='datetime'))
+    return data.loc[:, ['open', 'close', 'high', 'low', 'volume']]
+
+
+def generate_ticks(n, start='2010-01-04 09:00', freq='5s', seed=0,
+                   price=100.0):
+    """ 随机游走生成tick价格。
+
+    Returns:
+        pd.Series. 以datetime为索引的价格
+    """
+    rng = np.random.RandomState(seed)
+    prices = price * np.exp(np.cumsum(rng.normal(0, 0.0005, n)))
+    return pd.Series(np.round(prices, 4), name='price',
+                     index=pd.date_range(start, periods=n, freq=freq,
+                                         name='datetime'))
+
+
+def ticks_to_bars(ticks, freq):
+    """ tick合成k线 """
+    rst = ticks.resample(freq, label='left', closed='left').ohlc().dropna()
+    rst['volume'] = ticks.resample(
+        freq, label='left', closed='left').count()
+    return rst.loc[:, ['open', 'close', 'high', 'low', 'volume']]
+
+
+def resample_bars(data, freq):
+    """ 把高频数据合成低频k线 """
+    rst = data.resample(freq, label='left', closed='left').agg({
+        'open': 'first',
+        'close': 'last',
+        'high': 'max',
+        'low': 'min',
+        'volume': 'sum'
+    }).dropna()
+    return rst.loc[:, ['open', 'close', 'high', 'low', 'volume']]
+
+
+def write_bars(root, strpcon, data):
+    """ 按 CsvSource 的目录结构写入数据, 如 root/1MINUTE/SHFE/IF.csv
+
+    Args:
+        strpcon (str): 周期合约，如'IF.SHFE-1.Minute'
+    """
+    contract, period = tuple(strpcon.upper().split('-'))
+    code, exch = tuple(contract.split('.'))
+    path = os.path.join(root, period.replace('.', ''), exch)
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    data.to_csv(os.path.join(path, code + '.csv'), float_format='%.4f')
+
+
+def write_contracts(root, contracts):
+    """ 写入合约基本信息CONTRACTS.csv。
+
+    Args:
+        contracts (list): ['IF.SHFE', '600000.SH', ..]
+    """
+    rows = []
+    for strcon in contracts:
+        code, exch = tuple(strcon.upper().split('.'))
+        is_stock = exch in ('SH', 'SZ')
+        rows.append({
+            'code': code,
+            'exchange': exch,
+            'name': code,
+            'spell': code,
+            'long_margin_ratio': 1.0 if is_stock else 0.1,
+            'short_margin_ratio': 1.0 if is_stock else 0.1,
+            'price_tick': 0.01 if is_stock else 0.2,
+            'volume_multiple': 1 if is_stock else 10
+        })
+    df = pd.DataFrame(rows)
+    if not os.path.isdir(root):
+        os.makedirs(root)
+    df.to_csv(os.path.join(root, 'CONTRACTS.csv'),
+              columns=_CONTRACT_COLUMNS, index=False)
+
+
+def generate_dataset(root, futures=1, stocks=0, bars=10000,
+                     periods=('1.Minute',), seed=0, ticks_per_bar=0):
+    """ 生成一套数据集。
+
+    期货以'F<i>.SHFE'命名，分钟级别；股票以6位代码'.SH'命名，日线。
+    periods中除第一个周期外的其它周期由第一个周期的数据合成。
+
+    Args:
+        root (str): 数据根目录
+
+        futures (int): 期货合约数目
+
+        stocks (int): 股票数目
+
+        bars (int): 每个合约的k线数目
+
+        periods (tuple): 期货的周期, 如('1.Minute', '5.Minute')
+
+        seed (int): 随机种子
+
+        ticks_per_bar (int): 大于0时期货的k线由每分钟ticks_per_bar个
+            tick合成
+
+    Returns:
+        dict. {'futures': [strpcon, ..], 'stocks': [strpcon, ..],
+            'ticks': {strcon: pd.Series}}
+    """
+    contracts = []
+    rst = {'futures': [], 'stocks': [], 'ticks': {}}
+    for i in range(futures):
+        strcon = 'F%d.SHFE' % i
+        contracts.append(strcon)
+        if ticks_per_bar:
+            ticks = generate_ticks(bars * ticks_per_bar, seed=seed + i,
+                                   freq='%dms' % (60000 // ticks_per_bar))
+            rst['ticks'][strcon] = ticks
+            data = ticks_to_bars(ticks, '1min')
+        else:
+            data = generate_bars(bars, seed=seed + i)
+        for j, period in enumerate(periods):
+            strpcon = '%s-%s' % (strcon, period)
+            if j > 0:
+                count, unit = period.split('.')
+                freq = {'MINUTE': 'min', 'HOUR': 'h',
+                        'DAY': 'D'}[unit.upper()]
+                write_bars(root, strpcon,
+                           resample_bars(data, '%s%s' % (count, freq)))
+            else:
+                write_bars(root, strpcon, data)
+            rst['futures'].append(strpcon)
+    for i in range(stocks):
+        strcon = '%06d.SH' % (600000 + i)
+        contracts.append(strcon)
+        strpcon = '%s-1.Day' % strcon
+        data = generate_bars(bars, start='2000-01-04 15:00', freq='B',
+                             seed=seed + futures + i, price=10.0)
+        write_bars(root, strpcon, data)
+        rst['stocks'].append(strpcon)
+    write_contracts(root, contracts)
+    return rst
@@ -5,6 +5,7 @@ from quantdigger.config import settings
 from quantdigger.configutil import ConfigUtil
 from quantdigger.engine.series import NumberSeries, DateTimeSeries
 from quantdigger.engine.profile import Profile
+from quantdigger.engine.sweep import ParameterSweep
 from quantdigger.technicals.common import *
 from quantdigger.util import log, deprecated
 
@@ -6,7 +6,13 @@ settings = {
     'data_path': './data',
     'stock_commission': 3 / 10000.0,
     'future_commission': 1 / 10000.0,
+    # 按Bar展开的tick路径撮合，见 ExecuteUnit 的ticks参数
     'tick_test': False,
+    # 统计回测各阶段耗时，见 Profile.phase_timings
+    'phase_timing': False,
+    # 预加载数据的并行数和方式('thread'/'process')，见 DataManager.load_many
+    'load_workers': 1,
+    'load_executor': 'thread',
 }
 
 
@@ -1,41 +1,145 @@
 # -*- coding: utf-8 -*-
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
 from quantdigger.datasource.source import DatasourceAbstract
 from quantdigger.util import log
 from quantdigger.infras.object import HashObject
 
 
 class CachedDatasource(DatasourceAbstract):
-    '''带缓存的数据源'''
+    '''带缓存的数据源
+
+    缓存缺失的时间范围在一个有界线程池中并发地从数据源补充，多个调用者
+    同时请求同一个周期合约的同一个缺失时间范围时只访问一次数据源。
+    线程池在第一次补充数据时创建，用完后调用 :meth:`close` 或用 with
+    语句关闭。
+    '''
 
-    def __init__(self, datasource, cache):
+    def __init__(self, datasource, cache, workers=4):
+        """
+        Args:
+            datasource (DatasourceAbstract): 被缓存的数据源
+
+            cache (CacheAbstract): 缓存
+
+            workers (int): 同时访问数据源的最大线程数
+        """
         self.datasource = datasource
         self.cache = cache
+        self.workers = max(workers, 1)
+        self._pool = None
+        self._lock = threading.Lock()  # 保护 _pool 和 _inflight
+        self._cache_lock = threading.Lock()  # 串行化缓存的读写
+        self._inflight = {}  # (周期合约, 开始, 结束) -> Future
 
     def get_bars(self, pcontract, dt_start, dt_end):
-        try:
-            log.info('trying to load from cache')
-            return self.cache.get_bars(pcontract, dt_start, dt_end)
-        except LoadCacheException as e:
+        return self.get_many([(pcontract, dt_start, dt_end)])[0]
+
+    def get_many(self, requests):
+        """ 读取多个周期合约的数据，所有缺失的时间范围并发地补充。
+
+        Args:
+            requests (list): [(pcontract, dt_start, dt_end), ..]
+
+        Returns:
+            list. 按请求顺序的 SourceWrapper
+        """
+        results = [None] * len(requests)
+        missing, futures = [], []
+        for i, (pcontract, dt_start, dt_end) in enumerate(requests):
+            try:
+                log.info('trying to load from cache')
+                with self._cache_lock:
+                    results[i] = self.cache.get_bars(pcontract,
+                                                     dt_start, dt_end)
+            except LoadCacheException as e:
+                log.info('missing range: {0}'.format(e.missing_range))
+                missing.append(i)
+                futures.extend(self._fill(pcontract, start, end)
+                               for start, end in e.missing_range)
+        if futures:
             log.info('updating cache')
-            missing_range = e.missing_range
-            log.info('missing range: {0}', missing_range)
-            missing_data = []
-            for start, end in missing_range:
-                wrapper = self.datasource.get_bars(pcontract, start, end)
-                missing_data.append(HashObject.new(data=wrapper.data,
-                                                   start=start,
-                                                   end=end))
-            self.cache.save_data(missing_data, pcontract)
+            for future in futures:
+                future.result()
+        for i in missing:
             log.info('loading cache')
-            return self.cache.get_bars(pcontract, dt_start, dt_end)
+            with self._cache_lock:
+                results[i] = self.cache.get_bars(*requests[i])
+        return results
 
     def get_last_bars(self, pcontract, n):
-        raise NotImplementedError
+        """ 最后n根Bar。
+
+        缓存中有足够的数据时直接从缓存读取，不访问数据源，返回的是已缓存的
+        最新数据，需要更新时先用 :meth:`get_bars` 补充缓存。
+        """
+        try:
+            with self._cache_lock:
+                return self.cache.get_last_bars(pcontract, n)
+        except LoadCacheException as e:
+            cached_data = e.cached_data
+        log.info('loading last {0} bars from datasource'.format(n))
+        wrapper = self.datasource.get_last_bars(pcontract, n)
+        data = wrapper.data
+        if cached_data is None and len(data):
+            # 缓存为空时，最后n根Bar是完整的一段，可以直接缓存。
+            with self._cache_lock:
+                self.cache.save_data([HashObject.new(
+                    data=data,
+                    start=pd.to_datetime(data.index[0]),
+                    end=pd.to_datetime(data.index[-1]))], pcontract)
+        return wrapper
 
     def get_contracts(self):
         # TODO:
         return self.datasource.get_contracts()
 
+    def close(self):
+        """ 等待正在补充的数据写入缓存，关闭访问数据源的线程池。
+        之后再有缺失的数据时会新建线程池。 """
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _fill(self, pcontract, start, end):
+        """ 提交从数据源补充缺失时间范围的任务，同一时间范围正在补充时
+        返回已有的任务。
+
+        Returns:
+            Future.
+        """
+        key = (str(pcontract), start, end)
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is None:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(self.workers)
+                future = self._inflight[key] = self._pool.submit(
+                    self._fetch, key, pcontract, start, end)
+            return future
+
+    def _fetch(self, key, pcontract, start, end):
+        try:
+            wrapper = self.datasource.get_bars(pcontract, start, end)
+            with self._cache_lock:
+                self.cache.save_data([HashObject.new(data=wrapper.data,
+                                                     start=start,
+                                                     end=end)], pcontract)
+        finally:
+            # 数据写入缓存后才移除，之后的请求直接从缓存读取。
+            with self._lock:
+                self._inflight.pop(key, None)
+
 
 class CacheAbstract(DatasourceAbstract):
     '''缓存抽象类'''
@@ -6,7 +6,13 @@
 # @version 0.3
 # @date 2016-05-26
 
+import timeit
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import pandas as pd
+
 from .dsutil import get_setting_datasource
+from quantdigger.config import settings
 from quantdigger.datastruct import PContract, Contract
 from quantdigger.util import log
 
@@ -23,7 +29,7 @@ class DataManager(object):
         self._src, type_ = get_setting_datasource()
         if Contract.source_type and Contract.source_type != type_:
             log.warn("数据源发生了切换！之前可能以另外一个数据源调用Contract.xxx")
-        Contract.info = self._src.get_contracts()
+        Contract.set_info(self._src.get_contracts())
         Contract.source_type = type_
 
     def get_bars(self, strpcon,
@@ -35,9 +41,83 @@ class DataManager(object):
         pcontract = PContract.from_string(strpcon)
         return self._src.get_last_bars(pcontract, n)
 
+    def iter_bars(self, strpcon, chunksize,
+                  dt_start=DEFAULT_DT_START, dt_end=DEFAULT_DT_END):
+        pcontract = PContract.from_string(strpcon)
+        return self._src.iter_bars(pcontract, dt_start, dt_end, chunksize)
+
+    def load_many(self, requests, workers=1, executor='thread'):
+        """ 并行读取多个周期合约的数据。
+
+        Args:
+            requests (list): [(strpcon, dt_start, dt_end, n), ..]，n不为
+                None时读取最后n根Bar
+
+            workers (int): 并行数，不大于1时顺序读取
+
+            executor (str): 'thread' 线程池，'process' 进程池。进程池在
+                子进程中解析数据，以数组形式传回。
+
+        Returns:
+            generator. 按请求顺序逐个返回 (strpcon, pd.DataFrame, 耗时秒数)
+        """
+        if workers <= 1:
+            for request in requests:
+                yield _timed_fetch(self, request)
+            return
+        if executor == 'process':
+            pool = ProcessPoolExecutor(workers, initializer=_init_worker,
+                                       initargs=(dict(settings),))
+            with pool:
+                for strpcon, arrays, seconds in pool.map(_fetch_arrays,
+                                                         requests):
+                    yield strpcon, _from_arrays(arrays), seconds
+        else:
+            assert executor == 'thread'
+            with ThreadPoolExecutor(workers) as pool:
+                for rst in pool.map(lambda r: _timed_fetch(self, r),
+                                    requests):
+                    yield rst
+
     def get_code2strpcon(self):
         return self._src.get_code2strpcon()
 
     def get_contracts(self):
         return self._src.get_contracts()
 
+
+
+def _timed_fetch(data_manager, request):
+    strpcon, dt_start, dt_end, n = request
+    start = timeit.default_timer()
+    if n:
+        data = data_manager.get_last_bars(strpcon, n)
+    else:
+        data = data_manager.get_bars(strpcon, dt_start, dt_end)
+    return strpcon, data, timeit.default_timer() - start
+
+
+_worker_manager = None  # 进程池子进程中的DataManager
+
+
+def _init_worker(config):
+    global _worker_manager
+    settings.update(config)
+    _worker_manager = DataManager()
+
+
+def _fetch_arrays(request):
+    strpcon, data, seconds = _timed_fetch(_worker_manager, request)
+    return strpcon, _to_arrays(data), seconds
+
+
+def _to_arrays(data):
+    """ DataFrame拆成数组，进程间传递比DataFrame快。 """
+    return (data.index.values, data.index.name, list(data.columns),
+            [data[c].values for c in data.columns])
+
+
+def _from_arrays(arrays):
+    index, name, columns, values = arrays
+    return pd.DataFrame(dict(zip(columns, values)),
+                        index=pd.Index(index, name=name), columns=columns)
@@ -12,14 +12,21 @@ class _DatasourceTrunk(IoCTrunk):
 
     def __init__(self, cls, args, kwargs):
         super(_DatasourceTrunk, self).__init__(cls, args, kwargs)
+        self._instance = None
+        self._config = None  # 构造实例时的配置参数
 
     def on_register(self, name):
         log.info('register datasource: {0} => {1}'.format(self.cls, name))
 
     def construct(self):
+        """ 配置参数(如 data_path)没变时复用已有的实例，变了重新构造。 """
         a = [ConfigUtil.get(k, None) for k in self.args]
         ka = {k: ConfigUtil.get(name, None) for k, name in six.iteritems(self.kwargs)}
-        return self.cls(*a, **ka)
+        config = (a, ka)
+        if self._instance is None or config != self._config:
+            self._instance = self.cls(*a, **ka)
+            self._config = config
+        return self._instance
 
 
 register_datasource = register_to(_ds_container, _DatasourceTrunk)
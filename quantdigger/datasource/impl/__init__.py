@@ -1,4 +1,5 @@
 from . import csv_source
+from . import mmap_source
 from . import tushare_source
 from . import mongodb_source
 from . import sqlite_source
@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 
+import io
 import os
+import numpy as np
 import pandas as pd
 
 from quantdigger.datasource.dsutil import *
@@ -10,25 +12,75 @@ from quantdigger.errors import FileDoesNotExist
 
 @register_datasource('csv', 'data_path')
 class CsvSource(DatasourceAbstract):
-    '''CSV数据源'''
+    '''CSV数据源
 
-    def __init__(self, root):
+    按时间范围和最后n根查询时使用每个数据文件旁的索引文件(xxx.csv.idx)，
+    只读取需要的字节范围，见 :class:`CsvIndex` 。
+    '''
+
+    def __init__(self, root, index_step=1000):
+        """
+        Args:
+            root (str): 数据根目录
+
+            index_step (int): 索引每隔多少行记录一次位置
+        """
         self._root = root
+        self._index_step = index_step
+        self._indexes = {}  # 数据文件 -> CsvIndex
 
     def get_bars(self, pcontract, dt_start, dt_end):
-        data = self._load_bars(pcontract)
         dt_start = pd.to_datetime(dt_start)
         dt_end = pd.to_datetime(dt_end)
+        fname = self._bars_file(pcontract)
+        index = self._get_index(fname)
+        if index is None:
+            data = self._load_bars(pcontract)
+        else:
+            begin, end = index.locate(dt_start, dt_end)
+            data = _read_span(fname, index, begin, end)
         data = data[(dt_start <= data.index) & (data.index <= dt_end)]
         assert data.index.is_unique
         return data
 
     def get_last_bars(self, pcontract, n):
-        data = self._load_bars(pcontract)
+        fname = self._bars_file(pcontract)
+        index = self._get_index(fname)
+        if index is None:
+            data = self._load_bars(pcontract)
+        else:
+            data = _read_span(fname, index, index.tail(n), index.size)
         data = data[-n:]
         assert data.index.is_unique
         return data
 
+    def iter_bars(self, pcontract, dt_start, dt_end, chunksize):
+        dt_start = pd.to_datetime(dt_start)
+        dt_end = pd.to_datetime(dt_end)
+        fname = self._bars_file(pcontract)
+        index = self._get_index(fname)
+        with open(fname, 'rb') as f:
+            if index is None:
+                reader = pd.read_csv(f, index_col=0, parse_dates=True,
+                                     chunksize=chunksize)
+            else:
+                begin = index.locate(dt_start, dt_end)[0]
+                if begin >= index.size:
+                    return
+                f.seek(begin)
+                reader = pd.read_csv(f, header=None, names=index.columns,
+                                     index_col=0, parse_dates=True,
+                                     chunksize=chunksize)
+            for chunk in reader:
+                if len(chunk) == 0 or chunk.index[-1] < dt_start:
+                    continue
+                if chunk.index[0] > dt_end:
+                    break
+                chunk = chunk[(dt_start <= chunk.index) &
+                              (chunk.index <= dt_end)]
+                if len(chunk):
+                    yield chunk
+
     def get_contracts(self):
         """ 获取所有合约的基本信息
 
@@ -36,18 +88,42 @@ class CsvSource(DatasourceAbstract):
             pd.DataFrame
         """
         fname = os.path.join(self._root, "CONTRACTS.csv")
-        df = pd.read_csv(fname)
+        # 股票代码按字符串读取，保留前导0
+        df = pd.read_csv(fname, dtype={'code': str})
         df.index = df['code'] + '.' + df['exchange']
         df.index = map(lambda x: x.upper(), df.index)
         return df
 
-    def _load_bars(self, pcontract):
+    def _bars_file(self, pcontract):
         # TODO:  不要字符串转来转去的
         strpcon = str(pcontract).upper()
         contract, period = tuple(strpcon.split('-'))
         code, exch = tuple(contract.split('.'))
         period = period.replace('.', '')
         fname = os.path.join(self._root, period, exch, code + ".csv")
+        if not os.path.exists(fname):
+            raise FileDoesNotExist(file=fname)
+        return fname
+
+    def _get_index(self, fname):
+        """ 数据文件的索引，数据文件的修改时间或大小变化后重建。
+
+        Returns:
+            CsvIndex. 数据不是按时间排序时返回None
+        """
+        stat = os.stat(fname)
+        index = self._indexes.get(fname)
+        if index is None or not index.matches(stat):
+            index = CsvIndex.load(fname + '.idx')
+            if index is None or not index.matches(stat) or \
+                    index.step != self._index_step:
+                index = CsvIndex.build(fname, self._index_step)
+                index.save(fname + '.idx')
+            self._indexes[fname] = index
+        return index if index.sorted else None
+
+    def _load_bars(self, pcontract):
+        fname = self._bars_file(pcontract)
         try:
             data = pd.read_csv(fname, index_col=0, parse_dates=True)
         except IOError:
@@ -117,3 +193,138 @@ class CsvSource(DatasourceAbstract):
                         t.append(rst)
                         strpcons.append(rst)
         return symbols, period_exchange2strpcon
+
+
+class CsvIndex(object):
+    """ CSV数据文件的稀疏索引：每隔step行记录一次该行的时间和字节位置。
+
+    按时间范围查询时二分查找出包含该范围的字节区间，按最后n根查询时
+    由行号算出起始位置。索引假定数据按时间严格递增，生成索引时逐行检查，
+    不满足时数据源读取整个文件。索引记录数据文件的修改时间和大小，文件
+    变化后须重建。
+
+    :ivar step: 采样间隔行数。
+    :ivar rows: 数据行数。
+    :ivar size: 数据文件的字节数。
+    :ivar columns: 表头的列名。
+    :ivar sorted: 数据的每一行是否按时间严格递增。
+    """
+    _CHUNK = 1 << 24
+    _ROWS = 1 << 20  # 检查排序时每次解析的行数
+
+    def __init__(self, times, offsets, step, rows, size, mtime, columns,
+                 is_sorted):
+        self.times = times  # 采样行的时间 (datetime64[ns])
+        self.offsets = offsets  # 采样行的起始字节位置
+        self.step = step
+        self.rows = rows
+        self.size = size
+        self.mtime = mtime
+        self.columns = columns
+        self.sorted = is_sorted
+
+    @classmethod
+    def build(cls, fname, step):
+        """ 扫描一遍数据文件生成索引，只解析采样行的时间。 """
+        stat = os.stat(fname)
+        with open(fname, 'rb') as f:
+            columns = f.readline().decode().strip().split(',')
+        if stat.st_size == 0:
+            return cls(np.empty(0, 'datetime64[ns]'), np.empty(0, np.int64),
+                       step, 0, 0, stat.st_mtime_ns, columns, True)
+        data = np.memmap(fname, dtype=np.uint8, mode='r')
+        size = len(data)
+        offsets = []
+        count = 0  # 已找到的换行符数
+        for i in range(0, size, cls._CHUNK):
+            newlines = np.flatnonzero(data[i:i + cls._CHUNK] == 10) + i
+            # 第g个换行符之后是第g个数据行(第0个换行符结束表头)。
+            g = count + np.arange(len(newlines))
+            offsets.append(newlines[g % step == 0] + 1)
+            count += len(newlines)
+        offsets = np.concatenate(offsets).astype(np.int64)
+        offsets = offsets[offsets < size]
+        rows = count if data[-1] != 10 else count - 1
+        fields = [bytes(data[o:o + 64]).split(b',', 1)[0].decode()
+                  for o in offsets]
+        times = pd.to_datetime(fields).values.astype('datetime64[ns]')
+        del data
+        return cls(times, offsets, step, rows, size, stat.st_mtime_ns,
+                   columns, cls._is_sorted(fname))
+
+    @classmethod
+    def _is_sorted(cls, fname):
+        """ 逐行检查时间是否严格递增，只采样行的话采样之间的乱序行
+        会在按字节区间读取时丢失。 """
+        last = None
+        for chunk in pd.read_csv(fname, usecols=[0], chunksize=cls._ROWS):
+            times = pd.to_datetime(chunk.iloc[:, 0]).values
+            if not len(times):
+                continue
+            if last is not None and times[0] <= last:
+                return False
+            if np.any(times[1:] <= times[:-1]):
+                return False
+            last = times[-1]
+        return True
+
+    @classmethod
+    def load(cls, path):
+        """ 读取索引文件，不存在或格式不对时返回None。 """
+        try:
+            with open(path, 'rb') as f:
+                npz = np.load(f)
+                return cls(npz['times'], npz['offsets'], int(npz['step']),
+                           int(npz['rows']), int(npz['size']),
+                           int(npz['mtime']), list(npz['columns']),
+                           bool(npz['sorted']))
+        except (IOError, OSError, KeyError, ValueError):
+            return None
+
+    def save(self, path):
+        """ 写入索引文件，数据目录不可写时只在内存中使用。 """
+        try:
+            with open(path, 'wb') as f:
+                np.savez(f, times=self.times, offsets=self.offsets,
+                         step=self.step, rows=self.rows, size=self.size,
+                         mtime=self.mtime, columns=np.array(self.columns),
+                         sorted=self.sorted)
+        except (IOError, OSError):
+            pass
+
+    def matches(self, stat):
+        return self.size == stat.st_size and self.mtime == stat.st_mtime_ns
+
+    def locate(self, dt_start, dt_end):
+        """ 包含时间范围 [dt_start, dt_end] 内所有行的字节区间。
+
+        Returns:
+            tuple. (起始位置, 结束位置)
+        """
+        if not len(self.offsets):
+            return self.size, self.size
+        times = self.times
+        i = np.searchsorted(times, np.datetime64(dt_start, 'ns'), 'right') - 1
+        j = np.searchsorted(times, np.datetime64(dt_end, 'ns'), 'right')
+        begin = self.offsets[max(i, 0)]
+        end = self.offsets[j] if j < len(self.offsets) else self.size
+        return int(begin), int(end)
+
+    def tail(self, n):
+        """ 包含最后n行的起始字节位置。 """
+        if not len(self.offsets):
+            return self.size
+        row = max(self.rows - n, 0)
+        return int(self.offsets[row // self.step])
+
+
+def _read_span(fname, index, begin, end):
+    """ 读取数据文件中 [begin, end) 字节范围内的行。 """
+    if begin >= end:
+        return pd.DataFrame(columns=index.columns[1:], index=pd.DatetimeIndex(
+            [], name=index.columns[0]))
+    with open(fname, 'rb') as f:
+        f.seek(begin)
+        span = f.read(end - begin)
+    return pd.read_csv(io.BytesIO(span), header=None, names=index.columns,
+                       index_col=0, parse_dates=True)
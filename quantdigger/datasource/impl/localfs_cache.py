@@ -1,11 +1,14 @@
 # -*- coding: utf-8 -*-
+import json
 import os
 import pickle
+import numpy as np
 import pandas as pd
-from datetime import datetime, timedelta
 
 from quantdigger.datasource.cache import CacheAbstract, LoadCacheException
 from quantdigger.datasource.source import SourceWrapper
+from quantdigger.infras.object import HashObject
+from quantdigger.util import log
 
 
 def _merge_data(arr):
@@ -25,6 +28,18 @@ def _missing_range(delta, dt_start, dt_end, cached_start, cached_end):
     return result
 
 
+def _merge_range(cached, range_lst):
+    """ 合并已缓存的时间范围和新补充的时间范围，开始时间为None表示
+    从最早的数据开始。 """
+    starts, ends = map(lambda t: list(t), zip(*range_lst))
+    if cached is not None:
+        starts.append(cached[0])
+        ends.append(cached[1])
+    new_start = None if any(map(lambda d: d is None, starts)) \
+        else min(starts)
+    return new_start, max(ends)
+
+
 def _filter_by_datetime_range(data, start, end):
     start = pd.to_datetime(start)
     end = pd.to_datetime(end)
@@ -41,85 +56,201 @@ def _filter_by_datetime_range(data, start, end):
 
 
 class LocalFsCache(CacheAbstract):
-    '''本地文件系统缓存'''
+    """ 本地文件系统缓存。
+
+    每个周期合约一个目录，数据按月分区保存为二进制文件(YYYYMM.npz)，
+    目录下的清单文件(manifest.json)记录已缓存的时间范围和分区。补充缺失
+    的数据时只重写涉及的分区，读取时只加载和查询时间范围重叠的分区。
+
+    旧版本的缓存(元数据文件_meta，每个周期合约一个csv文件)在第一次读取
+    该周期合约时转换成分区格式，转换后删除旧的csv文件。
+    """
 
     def __init__(self, base_path):
         self._base_path = base_path
-        self._load_meta()
+        self._manifests = {}  # key -> 清单
+        self._legacy_meta = None  # 旧版本缓存的元数据
 
     def get_bars(self, pcontract, dt_start, dt_end):
         key = self._to_key(pcontract)
         dt_start = pd.to_datetime(dt_start)
         dt_end = pd.to_datetime(dt_end)
-        try:
-            cached_start, cached_end = self._meta[key]
-            missing_range = _missing_range(
-                pcontract.period.to_timedelta(),
-                dt_start, dt_end, cached_start, cached_end)
-            data = self._load_data_from_path(self._key_to_path(key))
-            if missing_range:
-                raise LoadCacheException(missing_range, data)
-            data = _filter_by_datetime_range(data, dt_start, dt_end)
-            return SourceWrapper(pcontract, data, len(data))
-        except (KeyError, IOError):
+        manifest = self._load_manifest(key)
+        if manifest is None:
             raise LoadCacheException([(dt_start, dt_end)])
+        cached_start, cached_end = manifest['range']
+        missing_range = _missing_range(
+            pcontract.period.to_timedelta(),
+            dt_start, dt_end, cached_start, cached_end)
+        data = self._load_partitions(key, manifest, dt_start, dt_end)
+        if missing_range:
+            raise LoadCacheException(missing_range, data)
+        data = _filter_by_datetime_range(data, dt_start, dt_end)
+        return SourceWrapper(pcontract, data, len(data))
 
-    def save_data(self, missing_data, pcontract):
+    def get_last_bars(self, pcontract, n):
+        """ 从最新的分区向前读取，直到有n根Bar。
+
+        Raises:
+            LoadCacheException: 没有缓存，或者已缓存的Bar不够n根且之前
+                还可能有数据
+        """
         key = self._to_key(pcontract)
-        path = self._key_to_path(key)
-        data_arr = map(lambda t: t.data, missing_data)
+        manifest = self._load_manifest(key)
+        if manifest is None:
+            raise LoadCacheException([(None, None)])
+        frames, size = [], 0
+        for name in reversed(manifest['partitions']):
+            frames.insert(0, self._load_partition(key, name))
+            size += len(frames[0])
+            if size >= n:
+                break
+        data = pd.concat(frames) if frames else \
+            self._load_partitions(key, manifest, None, None)
+        cached_start = manifest['range'][0]
+        if size < n and cached_start is not None:
+            raise LoadCacheException(
+                [(None, cached_start - pcontract.period.to_timedelta())],
+                data)
+        data = data.iloc[-n:]
+        return SourceWrapper(pcontract, data, len(data))
+
+    def save_data(self, missing_data, pcontract):
+        self._save(self._to_key(pcontract), missing_data)
+
+    def _save(self, key, missing_data):
+        manifest = self._load_manifest(key) or \
+            {'range': None, 'partitions': [], 'columns': None}
+        data = [t.data for t in missing_data if len(t.data)]
+        if data:
+            data = pd.concat(data)
+            # 有的数据源(如tushare)以日期字符串为索引。
+            data.index = pd.DatetimeIndex(pd.to_datetime(data.index),
+                                          name='datetime')
+            if manifest['columns'] is None:
+                manifest['columns'] = list(data.columns)
+            partitions = set(manifest['partitions'])
+            for name, part in data.groupby(data.index.strftime('%Y%m')):
+                if name in partitions:
+                    part = _merge_data([self._load_partition(key, name),
+                                        part])
+                else:
+                    part = _merge_data([part])
+                self._save_partition(key, name, part)
+                partitions.add(name)
+            manifest['partitions'] = sorted(partitions)
+        manifest['range'] = _merge_range(
+            manifest['range'], [(t.start, t.end) for t in missing_data])
+        self._save_manifest(key, manifest)
+
+    def _key_dir(self, key):
+        return os.path.join(self._base_path, key)
+
+    def _manifest_path(self, key):
+        return os.path.join(self._key_dir(key), 'manifest.json')
+
+    def _load_manifest(self, key):
+        manifest = self._manifests.get(key)
+        if manifest is not None:
+            return manifest
         try:
-            old_data = self._load_data_from_path(path)
-            data_arr.insert(0, old_data)
-        except IOError:
-            pass
-        data = _merge_data(data_arr)
-        self._save_data_to_path(data, path)
-        self._update_meta(key, map(lambda t: (t.start, t.end), missing_data))
-        self._save_meta()
-
-    def _check_base_path(self):
-        if not os.path.isdir(self._base_path):
-            os.makedirs(self._base_path)
-
-    def _load_data_from_path(self, path):
-        return pd.read_csv(path, index_col=0, parse_dates=True)
-
-    def _save_data_to_path(self, data, path):
-        self._check_base_path()
-        data.to_csv(path)
-
-    def _meta_path(self):
+            with open(self._manifest_path(key)) as f:
+                manifest = json.load(f)
+        except (IOError, OSError, ValueError):
+            return self._migrate_legacy(key)
+        manifest['range'] = tuple(
+            None if dt is None else pd.Timestamp(dt)
+            for dt in manifest['range'])
+        self._manifests[key] = manifest
+        return manifest
+
+    def _save_manifest(self, key, manifest):
+        path = self._manifest_path(key)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        content = dict(manifest, range=[
+            None if dt is None else str(dt) for dt in manifest['range']])
+        # 先写临时文件再替换，写入中途崩溃不会损坏旧清单。
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(content, f)
+        os.replace(tmp, path)
+        self._manifests[key] = manifest
+
+    def _legacy_meta_path(self):
         return os.path.join(self._base_path, '_meta')
 
-    def _load_meta(self):
-        try:
-            with open(self._meta_path(), 'rb') as f:
-                self._meta = pickle.load(f)
-        except IOError:
-            self._meta = {}
-
-    def _save_meta(self):
-        self._check_base_path()
-        with open(self._meta_path(), 'wb') as f:
-            pickle.dump(self._meta, f, protocol=2)
-
-    def _update_meta(self, key, range_lst):
-        starts, ends = map(lambda t: list(t), zip(*range_lst))
+    def _migrate_legacy(self, key):
+        """ 把旧版本缓存中周期合约key的数据转换成分区格式。
+
+        Returns:
+            dict. 转换后的清单，没有旧版本缓存时返回None
+        """
+        if self._legacy_meta is None:
+            try:
+                with open(self._legacy_meta_path(), 'rb') as f:
+                    self._legacy_meta = pickle.load(f)
+            except (IOError, OSError, pickle.UnpicklingError, EOFError):
+                self._legacy_meta = {}
+        if key not in self._legacy_meta:
+            return None
+        fname = os.path.join(self._base_path, key + '.csv')
         try:
-            cached_start, cached_end = self._meta[key]
-            starts.append(cached_start)
-            ends.append(cached_end)
-        except KeyError:
-            pass
-        new_start = None if any(map(lambda d: d is None, starts)) \
-            else min(starts)
-        new_end = max(ends)
-        self._meta[key] = new_start, new_end
+            data = pd.read_csv(fname, index_col=0, parse_dates=True)
+        except (IOError, OSError):
+            log.warn('旧版本缓存缺少数据文件，忽略: {0}'.format(fname))
+            return None
+        log.info('转换旧版本缓存: {0}'.format(fname))
+        start, end = self._legacy_meta.pop(key)
+        self._save(key, [HashObject.new(data=data, start=start, end=end)])
+        os.remove(fname)
+        if self._legacy_meta:
+            with open(self._legacy_meta_path(), 'wb') as f:
+                pickle.dump(self._legacy_meta, f, protocol=2)
+        else:
+            os.remove(self._legacy_meta_path())
+        return self._manifests[key]
+
+    def _load_partitions(self, key, manifest, dt_start, dt_end):
+        """ 读取和时间范围重叠的分区。 """
+        first = None if dt_start is None else dt_start.strftime('%Y%m')
+        last = None if dt_end is None else dt_end.strftime('%Y%m')
+        names = [name for name in manifest['partitions']
+                 if (first is None or name >= first) and
+                 (last is None or name <= last)]
+        if not names:
+            return pd.DataFrame(columns=manifest['columns'] or [],
+                                index=pd.DatetimeIndex([], name='datetime'))
+        return pd.concat([self._load_partition(key, name) for name in names])
+
+    def _partition_path(self, key, name):
+        return os.path.join(self._key_dir(key), name + '.npz')
+
+    def _load_partition(self, key, name):
+        with np.load(self._partition_path(key, name)) as npz:
+            columns = list(npz['columns'])
+            return pd.DataFrame(
+                dict((c, npz['c%d' % i]) for i, c in enumerate(columns)),
+                index=pd.DatetimeIndex(npz['index'], name='datetime'),
+                columns=columns)
+
+    def _save_partition(self, key, name, data):
+        path = self._partition_path(key, name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        arrays = {}
+        for i, c in enumerate(data.columns):
+            values = np.asarray(data[c])
+            if values.dtype.kind == 'O':
+                # 对象数组需要pickle才能读取，非数值列按字符串保存。
+                values = values.astype(str)
+            arrays['c%d' % i] = values
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            np.savez(f, index=data.index.values.astype('datetime64[ns]'),
+                     columns=np.array([str(c) for c in data.columns]),
+                     **arrays)
+        os.replace(tmp, path)
 
     def _to_key(self, pcontract):
         return str(pcontract)
-
-    def _key_to_path(self, key):
-        path = os.path.join(self._base_path, key + '.csv')
-        return path
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+##
+# @file mmap_source.py
+# @brief 内存映射的二进制列式数据源。
+# @version 0.6
+
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from quantdigger.datasource.dsutil import *
+from quantdigger.datasource.impl.csv_source import CsvSource
+from quantdigger.errors import FileDoesNotExist
+
+_COLUMNS = ('open', 'close', 'high', 'low', 'volume')
+_TIME_DTYPE = np.dtype('<i8')  # 纳秒时间戳
+_VALUE_DTYPE = np.dtype('<f8')
+
+
+@register_datasource('mmap', 'data_path')
+class MmapSource(CsvSource):
+    """ 二进制列式数据源。
+
+    每个周期合约一个目录，如 root/1MINUTE/SHFE/IF/ ，目录下每列一个定长
+    二进制文件: datetime.bin (int64纳秒时间戳), open.bin, close.bin,
+    high.bin, low.bin, volume.bin (float64)。文件用 np.memmap 打开，
+    按时间范围查询时在时间列上二分查找，只读取需要的部分。合约基本信息
+    和CSV数据源一样保存在 root/CONTRACTS.csv 。
+    """
+    def __init__(self, root):
+        super(MmapSource, self).__init__(root)
+        self._maps = {}  # 周期合约目录 -> {列名: np.memmap}
+
+    def get_bars(self, pcontract, dt_start, dt_end):
+        columns = self._load_columns(pcontract)
+        times = columns['datetime']
+        start = np.searchsorted(times, pd.Timestamp(dt_start).value, 'left')
+        end = np.searchsorted(times, pd.Timestamp(dt_end).value, 'right')
+        return _to_frame(columns, start, end)
+
+    def get_last_bars(self, pcontract, n):
+        columns = self._load_columns(pcontract)
+        size = len(columns['datetime'])
+        return _to_frame(columns, max(size - n, 0), size)
+
+    def iter_bars(self, pcontract, dt_start, dt_end, chunksize):
+        columns = self._load_columns(pcontract)
+        times = columns['datetime']
+        start = np.searchsorted(times, pd.Timestamp(dt_start).value, 'left')
+        end = np.searchsorted(times, pd.Timestamp(dt_end).value, 'right')
+        for i in range(start, end, chunksize):
+            yield _to_frame(columns, i, min(i + chunksize, end))
+
+    def import_bars(self, tbdata, pcontract):
+        """ 导入交易数据
+
+        Args:
+            tbdata (dict/pd.DataFrame): {'datetime', 'open', 'close',
+                            'high', 'low', 'volume'}，DataFrame可以
+                            datetime为索引
+            pcontract (PContract): 周期合约
+        """
+        df = pd.DataFrame(tbdata)
+        if 'datetime' in df.columns:
+            df = df.set_index('datetime')
+        df = df.sort_index()
+        path = self._bars_dir(pcontract, check=False)
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self._maps.pop(path, None)
+        times = pd.to_datetime(df.index).values.astype('datetime64[ns]')
+        times.view(_TIME_DTYPE).tofile(os.path.join(path, 'datetime.bin'))
+        for name in _COLUMNS:
+            df[name].values.astype(_VALUE_DTYPE).tofile(
+                os.path.join(path, name + '.bin'))
+
+    def get_code2strpcon(self):
+        symbols = {}  # code -> string pcontracts, 所有周期
+        period_exchange2strpcon = {}  # exchange.period -> string pcontracts
+        for parent, dirs, files in os.walk(self._root):
+            if 'datetime.bin' not in files:
+                continue
+            t = parent.split(os.sep)
+            period, exch, code = t[-3], t[-2], t[-1]
+            for i, a in enumerate(period):
+                if not a.isdigit():
+                    sepi = i
+                    break
+            period = '.'.join([period[0:sepi], period[sepi:]])
+            rst = ''.join([code, '.', exch, '-', period])
+            symbols.setdefault(code, []).append(rst)
+            period_exchange2strpcon.setdefault(
+                ''.join([exch, '-', period]), []).append(rst)
+        return symbols, period_exchange2strpcon
+
+    def _bars_dir(self, pcontract, check=True):
+        strpcon = str(pcontract).upper()
+        contract, period = tuple(strpcon.split('-'))
+        code, exch = tuple(contract.split('.'))
+        path = os.path.join(self._root, period.replace('.', ''), exch, code)
+        if check and not os.path.isdir(path):
+            raise FileDoesNotExist(file=path)
+        return path
+
+    def _load_columns(self, pcontract):
+        path = self._bars_dir(pcontract)
+        columns = self._maps.get(path)
+        if columns is None:
+            columns = {'datetime': _open_column(path, 'datetime',
+                                                _TIME_DTYPE)}
+            for name in _COLUMNS:
+                columns[name] = _open_column(path, name, _VALUE_DTYPE)
+            self._maps[path] = columns
+        return columns
+
+
+def _open_column(path, name, dtype):
+    fname = os.path.join(path, name + '.bin')
+    if not os.path.exists(fname):
+        raise FileDoesNotExist(file=fname)
+    if os.path.getsize(fname) == 0:
+        # 空文件不能映射。
+        return np.empty(0, dtype=dtype)
+    return np.memmap(fname, dtype=dtype, mode='r')
+
+
+def _to_frame(columns, start, end):
+    """ 把各列的 [start, end) 部分复制到DataFrame中。 """
+    index = pd.DatetimeIndex(
+        np.array(columns['datetime'][start:end]).view('datetime64[ns]'),
+        name='datetime')
+    return pd.DataFrame(dict((name, np.array(columns[name][start:end]))
+                             for name in _COLUMNS),
+                        index=index, columns=list(_COLUMNS))
+
+
+def convert_csv(csv_root, root):
+    """ 把CSV数据源的目录转换成二进制数据源的目录。
+
+    Args:
+        csv_root (str): CSV数据根目录，结构如 csv_root/1MINUTE/SHFE/IF.csv
+
+        root (str): 二进制数据根目录
+
+    Returns:
+        list. 转换的周期合约
+    """
+    csv_source = CsvSource(csv_root)
+    source = MmapSource(root)
+    if not os.path.isdir(root):
+        os.makedirs(root)
+    contracts = os.path.join(csv_root, 'CONTRACTS.csv')
+    if os.path.exists(contracts):
+        shutil.copy(contracts, os.path.join(root, 'CONTRACTS.csv'))
+    code2strpcon, _ = csv_source.get_code2strpcon()
+    converted = []
+    for strpcons in code2strpcon.values():
+        for strpcon in strpcons:
+            source.import_bars(csv_source._load_bars(strpcon), strpcon)
+            converted.append(strpcon)
+    return converted
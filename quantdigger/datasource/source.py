@@ -29,8 +29,28 @@ class DatasourceAbstract(object):
     def get_last_bars(self, pcontract, n):
         raise NotImplementedError
 
+    def iter_bars(self, pcontract, dt_start, dt_end, chunksize):
+        """ 按时间顺序分块读取数据。
+
+        默认实现先读取全部数据再切块，支持分块读取的数据源应重载。
+
+        Args:
+            chunksize (int): 每块的最大Bar数
+
+        Returns:
+            generator. 逐块返回pd.DataFrame
+        """
+        return iter_chunks(self.get_bars(pcontract, dt_start, dt_end),
+                           chunksize)
+
     def get_contracts(self):
         raise NotImplementedError
 
     def get_code2strpcon(self):
         raise NotImplementedError
+
+
+def iter_chunks(data, chunksize):
+    """ 把DataFrame按行切成不超过chunksize的块。 """
+    for i in range(0, len(data), chunksize):
+        yield data.iloc[i:i + chunksize]
@@ -199,6 +199,7 @@ class Transaction(object):
     :ivar datetime: 成交时间
     :ivar price_type: 下单类型。
     :ivar hedge_type: 交易类型。
+    :ivar slippage: 成交价格中包含的每单位滑点。
     """
     def __init__(self, order=None):
         if order:
@@ -212,6 +213,7 @@ class Transaction(object):
             self.price_type = order.price_type
             self.hedge_type = order.hedge_type
             self.order = order
+        self.slippage = 0.0
         self.volume_multiple = order.volume_multiple
         self.compute_commission()
         #six.print_("********************" )
@@ -220,11 +222,16 @@ class Transaction(object):
         #assert False
 
     def compute_commission(self):
-        ratio = settings['stock_commission'] if self.contract.is_stock else\
-            settings['future_commission']
+        ratio = Transaction.commission_ratio(self.contract)
         self.commission = self.price * self.quantity * \
             self.volume_multiple * ratio
 
+    @staticmethod
+    def commission_ratio(contract):
+        """ 合约的佣金费率(按成交额)。 """
+        return settings['stock_commission'] if contract.is_stock else\
+            settings['future_commission']
+
     def __hash__(self):
         try:
             return self._hash
@@ -310,12 +317,9 @@ class Order(object):
         self.datetime = dt
         self.price_type = type_
         self.hedge_type = hedge
-        if self.direction == Direction.LONG:
-            self._margin_ratio = Contract.long_margin_ratio(str(self.contract))
-        else:
-            self._margin_ratio = Contract.short_margin_ratio(
-                str(self.contract))
-        self.volume_multiple = Contract.volume_multiple(str(self.contract))
+        spec = contract.spec
+        self._margin_ratio = spec.margin_ratio(direction)
+        self.volume_multiple = spec.volume_multiple
 
     def order_margin(self, new_price):
         """ 计算这笔限价交易的保证金。
@@ -353,6 +357,27 @@ class Order(object):
         return self._hash == r._hash
 
 
+class ContractSpec(object):
+    """ 合约规格。
+
+    :ivar long_margin_ratio: 多头保证金比例。
+    :ivar short_margin_ratio: 空头保证金比例。
+    :ivar volume_multiple: 合约乘数。
+    """
+    __slots__ = ('long_margin_ratio', 'short_margin_ratio', 'volume_multiple')
+
+    def __init__(self, long_margin_ratio, short_margin_ratio,
+                 volume_multiple):
+        self.long_margin_ratio = long_margin_ratio
+        self.short_margin_ratio = short_margin_ratio
+        self.volume_multiple = volume_multiple
+
+    def margin_ratio(self, direction):
+        """ 开仓方向对应的保证金比例。 """
+        return self.long_margin_ratio if direction == Direction.LONG else \
+            self.short_margin_ratio
+
+
 class Contract(object):
     """ 合约。
 
@@ -364,8 +389,15 @@ class Contract(object):
     """
     info = None
     source_type = None
+    _specs = {}  # 大写合约名 -> ContractSpec
+    _instances = {}  # 合约字符串 -> Contract
 
-    def __init__(self, str_contract):
+    def __new__(cls, str_contract):
+        """ 相同的合约只有一个对象，比较和哈希都不再需要字符串运算。 """
+        try:
+            return cls._instances[str_contract]
+        except KeyError:
+            pass
         ## @TODO 修改参数为（code, exchange)
         info = str_contract.split('.')
         if len(info) == 2:
@@ -374,28 +406,102 @@ class Contract(object):
         else:
             log.error('错误的合约格式: %s' % str_contract)
             log.exception()
-        self.exchange = exchange
-        self.code = code
-        if self.exchange == 'SZ' or self.exchange == 'SH':
-            self.is_stock = True
-        elif self.exchange == 'SHFE':
-            self.is_stock = False
-        elif self.exchange == 'TEST' and self.code == 'STOCK':
-            self.is_stock = True
-        elif self.exchange == 'TEST':
-            self.is_stock = False
-        else:
-            log.error('Unknown exchange: {0}', self.exchange)
-            assert(False)
+        key = "%s.%s" % (code, exchange)
+        self = cls._instances.get(key)
+        if self is None:
+            if exchange == 'SZ' or exchange == 'SH':
+                is_stock = True
+            elif exchange == 'SHFE':
+                is_stock = False
+            elif exchange == 'TEST' and code == 'STOCK':
+                is_stock = True
+            elif exchange == 'TEST':
+                is_stock = False
+            else:
+                log.error('Unknown exchange: {0}', exchange)
+                assert(False)
+            self = object.__new__(cls)
+            # 对象被所有使用者共享，构造后不能修改。
+            object.__setattr__(self, 'exchange', exchange)
+            object.__setattr__(self, 'code', code)
+            object.__setattr__(self, 'is_stock', is_stock)
+            object.__setattr__(self, '_hash', hash(key))
+            cls._instances[key] = self
+        cls._instances[str_contract] = self
+        return self
+
+    def __setattr__(self, name, value):
+        if name not in ('_spec', '_spec_table'):
+            raise AttributeError('合约对象不可修改: %s' % name)
+        object.__setattr__(self, name, value)
+
+    def __delattr__(self, name):
+        raise AttributeError('合约对象不可修改: %s' % name)
 
     @classmethod
     def _get_info(cls):
         if Contract.source_type:
             return Contract.info
-        src, Contract.source_type = get_setting_datasource()
-        Contract.info = src.get_contracts()
+        src, source_type = get_setting_datasource()
+        cls.set_info(src.get_contracts())
+        Contract.source_type = source_type
         return Contract.info
 
+    @classmethod
+    def set_info(cls, info):
+        """ 设置合约基本信息，并生成按合约查询的规格表。
+
+        Args:
+            info (pd.DataFrame): 以大写合约名为索引，包含 'long_margin_ratio',
+                'short_margin_ratio', 'volume_multiple' 列。
+        """
+        specs = {}
+        for strcontract, long_ratio, short_ratio, multiple in zip(
+                info.index, info['long_margin_ratio'],
+                info['short_margin_ratio'], info['volume_multiple']):
+            strcontract = strcontract.upper()
+            # 有重复项时取第一项。
+            if strcontract not in specs:
+                specs[strcontract] = ContractSpec(long_ratio, short_ratio,
+                                                  multiple)
+        Contract.info = info
+        Contract._specs = specs
+
+    @classmethod
+    def get_spec(cls, strcontract):
+        """ 合约规格，找不到合约时保证金比例和合约乘数都为1。
+
+        Returns:
+            ContractSpec.
+        """
+        if not Contract.source_type:
+            cls._get_info()
+        key = strcontract.upper()
+        try:
+            return Contract._specs[key]
+        except KeyError:
+            log.warn("Can't not find contract: %s" % strcontract)
+            spec = Contract._specs[key] = ContractSpec(1, 1, 1)
+            return spec
+
+    @property
+    def spec(self):
+        """ 合约规格，缓存在合约对象上，合约信息重新设置后失效。
+
+        Returns:
+            ContractSpec.
+        """
+        if not Contract.source_type:
+            Contract._get_info()
+        try:
+            if self._spec_table is Contract._specs:
+                return self._spec
+        except AttributeError:
+            pass
+        self._spec = Contract.get_spec(str(self))
+        self._spec_table = Contract._specs
+        return self._spec
+
     @classmethod
     def from_string(cls, strcontract):
         return cls(strcontract)
@@ -405,17 +511,19 @@ class Contract(object):
         return "%s.%s" % (self.code, self.exchange)
 
     def __hash__(self):
-        try:
-            return self._hash
-        except AttributeError:
-            self._hash = hash(self.__str__())
-            return self._hash
+        return self._hash
 
     def __eq__(self, r):
-        try:
-            return self._hash == r._hash
-        except AttributeError:
-            return hash(self) == hash(r)
+        if self is r:
+            return True
+        if isinstance(r, Contract):
+            return False
+        return self._hash == hash(r)
+
+    def __reduce__(self):
+        # 恢复和复制时都返回同一个合约对象，
+        # 字符串的哈希值随进程变化，也不能随对象保存。
+        return (Contract, (str(self),))
 
     def __cmp__(self, r):
         return str(self) < str(r)
@@ -427,31 +535,15 @@ class Contract(object):
 
     @classmethod
     def long_margin_ratio(cls, strcontract):
-        try:
-            ## @todo 确保CONTRACTS.csv里面没有重复的项，否则有可能返回数组．
-            return cls._get_info().loc[strcontract.upper(), 'long_margin_ratio']
-        except KeyError:
-            log.warn("Can't not find contract: %s" % strcontract)
-            return 1
-            # assert(False)
+        return cls.get_spec(strcontract).long_margin_ratio
 
     @classmethod
     def short_margin_ratio(cls, strcontract):
-        try:
-            return cls._get_info().loc[strcontract.upper(), 'short_margin_ratio']
-        except KeyError:
-            log.warn("Can't not find contract: %s" % strcontract)
-            return 1
-            # assert(False)
+        return cls.get_spec(strcontract).short_margin_ratio
 
     @classmethod
     def volume_multiple(cls, strcontract):
-        try:
-            return cls._get_info().loc[strcontract.upper(), 'volume_multiple']
-        except KeyError:
-            log.warn("Can't not find contract: %s" % strcontract)
-            return 1
-            # assert(False)
+        return cls.get_spec(strcontract).volume_multiple
 
 
 class Period(object):
@@ -531,9 +623,29 @@ class PContract(object):
     :ivar contract: 合约对象。
     :ivar period: 周期。
     """
-    def __init__(self, contract, period):
-        self.contract = contract
-        self.period = period
+    _instances = {}  # (合约, 周期字符串) -> PContract
+    _strings = {}  # 周期合约字符串 -> PContract
+
+    def __new__(cls, contract, period):
+        """ 相同的周期合约只有一个对象。 """
+        key = (contract, str(period))
+        try:
+            return cls._instances[key]
+        except KeyError:
+            pass
+        self = object.__new__(cls)
+        # 对象被所有使用者共享，构造后不能修改。
+        object.__setattr__(self, 'contract', contract)
+        object.__setattr__(self, 'period', period)
+        object.__setattr__(self, '_hash', hash(str(self)))
+        cls._instances[key] = self
+        return self
+
+    def __setattr__(self, name, value):
+        raise AttributeError('周期合约对象不可修改: %s' % name)
+
+    def __delattr__(self, name):
+        raise AttributeError('周期合约对象不可修改: %s' % name)
 
     #def __str__(self):
         #""" return string like 'IF000.SHEF-10.Minutes'  """
@@ -541,21 +653,27 @@ class PContract(object):
 
     @classmethod
     def from_string(cls, strpcon):
+        try:
+            return cls._strings[strpcon]
+        except KeyError:
+            pass
         t = strpcon.split('-')
-        return cls(Contract(t[0]), Period(t[1]))
+        pcontract = cls._strings[strpcon] = cls(Contract(t[0]), Period(t[1]))
+        return pcontract
 
     def __hash__(self):
-        try:
-            return self._hash
-        except AttributeError:
-            self._hash = hash(self.__str__())
-            return self._hash
+        return self._hash
 
     def __eq__(self, r):
-        try:
-            return self._hash == r._hash
-        except AttributeError:
-            return hash(self) == hash(r)
+        if self is r:
+            return True
+        if isinstance(r, PContract):
+            return False
+        return self._hash == hash(r)
+
+    def __reduce__(self):
+        # 字符串的哈希值随进程变化，不能随对象保存。
+        return (PContract, (self.contract, self.period))
 
     def __str__(self):
         return '%s-%s' % (str(self.contract), str(self.period))
@@ -598,6 +716,12 @@ class PositionKey(object):
         except AttributeError:
             return hash(self) == hash(r)
 
+    def __getstate__(self):
+        # 字符串的哈希值随进程变化，不能随对象保存。
+        state = self.__dict__.copy()
+        state.pop('_hash', None)
+        return state
+
 
 class Position(object):
     """ 单笔仓位信息。
@@ -616,12 +740,9 @@ class Position(object):
         self.today = 0
         self.cost = 0
         self.direction = trans.direction
-        strcon = str(self.contract)
-        if self.direction == Direction.LONG:
-            self._margin_ratio = Contract.long_margin_ratio(strcon)
-        else:
-            self._margin_ratio = Contract.short_margin_ratio(strcon)
-        self._volume_multiple = Contract.volume_multiple(strcon)
+        spec = self.contract.spec
+        self._margin_ratio = spec.margin_ratio(self.direction)
+        self._volume_multiple = spec.volume_multiple
         self.symbol = str(trans.contract)
 
     def profit(self, new_price):
@@ -38,12 +38,14 @@ def max_drawdown(networth):
     drawdown = pd.Series(index=eq_idx)
     duration = pd.Series(index=eq_idx)
 
+    # 按位置访问，networth 以时间为索引。
     for t in range(1, len(eq_idx)):
-        cur_hwm = max(hwm[t-1], networth[t])
+        cur_hwm = max(hwm[t-1], networth.iloc[t])
         hwm.append(cur_hwm)
-        drawdown[t] = hwm[t] - networth[t]
+        drawdown.iloc[t] = hwm[t] - networth.iloc[t]
         # <=0 新高，计数0
-        duration[t] = 0 if drawdown[t] <= 0 else duration[t-1] + 1
+        duration.iloc[t] = 0 if drawdown.iloc[t] <= 0 \
+            else duration.iloc[t-1] + 1
     return drawdown.max(), duration.max()
 
 
@@ -51,16 +53,24 @@ def create_equity_curve(all_holdings):
     """ 创建资金曲线, 历史回报率对象。
 
     Args:
-        all_holdings (list): 账号资金历史。
+        all_holdings (pd.DataFrame|HoldingsHistory|list): 账号资金历史，
+            如 Profile.all_holdings() 。
 
     Returns:
         pd.DataFrame 数据列 { 'cash', 'commission',
                               'equity', 'returns', 'networth' }
     """
-    curve = pd.DataFrame(all_holdings)
-    curve.set_index('datetime', inplace=True)
+    if isinstance(all_holdings, pd.DataFrame):
+        # 浅复制，新增的列不影响传入的 DataFrame。
+        curve = all_holdings.copy(deep=False)
+    elif hasattr(all_holdings, 'to_frame'):
+        curve = all_holdings.to_frame()
+    else:
+        curve = pd.DataFrame(all_holdings)
+        curve.set_index('datetime', inplace=True)
     curve['returns'] = curve['equity'].pct_change()
-    curve.iloc[0, 3] = 0  # reset first value as 0 instead nan
+    # reset first value as 0 instead nan
+    curve.iloc[0, curve.columns.get_loc('returns')] = 0
     curve['networth'] = (1.0+curve['returns']).cumprod()
     return curve
 
@@ -70,7 +80,7 @@ def summary_stats(curve, periods):
     策略统计。
     periods - Daily (252), Hourly (252*6.5), Minutely(252*6.5*60) etc.
     """
-    total_return = curve['networth'][-1]
+    total_return = curve['networth'].iloc[-1]
     returns = curve['returns']
     pnl = curve['networth']
 
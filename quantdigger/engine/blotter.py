@@ -1,11 +1,14 @@
 # -*- coding: utf-8 -*-
 import six
 import copy
+import numpy as np
+import pandas as pd
 from abc import ABCMeta, abstractmethod
 
 from quantdigger.util import log
-from quantdigger.errors import TradingError
+from quantdigger.errors import DataAlignError, TradingError
 from quantdigger.engine.api import SimulateTraderAPI
+from quantdigger.engine.costs import apply_costs
 from quantdigger.event import Event
 from quantdigger.datastruct import (
     Direction,
@@ -18,6 +21,138 @@ from quantdigger.datastruct import (
 )
 
 
+class HoldingsHistory(object):
+    """ 账号资金历史，按列存放在预分配的 NumPy 数组中。
+
+    按下标访问和迭代时返回和旧接口一致的dict，
+    :meth:`to_frame` 返回不复制数据的 DataFrame。
+
+    :ivar datetime: 时间列 (datetime64[ns])，只有前 len(self) 项有效。
+    :ivar commission: 累计佣金列。
+    :ivar equity: 权益列。
+    :ivar cash: 可用资金列。
+    :ivar position_profit: 持仓盈亏列。
+    """
+    columns = ('commission', 'equity', 'cash', 'position_profit')
+
+    def __init__(self, capacity=0):
+        """
+        Args:
+            capacity (int): 预分配的行数，一般为回测的Bar数，不够时自动扩容。
+        """
+        capacity = max(capacity, 1)
+        self.datetime = np.empty(capacity, dtype='datetime64[ns]')
+        self.commission = np.empty(capacity)
+        self.equity = np.empty(capacity)
+        self.cash = np.empty(capacity)
+        self.position_profit = np.empty(capacity)
+        self._size = 0
+
+    @classmethod
+    def from_columns(cls, datetime, commission, equity, cash,
+                     position_profit=None):
+        """ 由已有的列构造资金历史。 """
+        history = cls(len(datetime))
+        history._size = len(datetime)
+        history.datetime[:] = datetime
+        history.commission[:] = commission
+        history.equity[:] = equity
+        history.cash[:] = cash
+        history.position_profit[:] = np.nan if position_profit is None \
+            else position_profit
+        return history
+
+    @classmethod
+    def sum(cls, histories):
+        """ 多个账号资金历史的逐行加总。
+
+        Raises:
+            DataAlignError: 各账号的资金历史长度或时间不一致
+        """
+        first = histories[0]
+        n = len(first)
+        for history in histories[1:]:
+            if len(history) != n or \
+                    (history.datetime[:n] != first.datetime[:n]).any():
+                raise DataAlignError()
+        columns = [getattr(first, name)[:n].copy() for name in cls.columns]
+        for history in histories[1:]:
+            for column, name in zip(columns, cls.columns):
+                column += getattr(history, name)[:n]
+        return cls.from_columns(first.datetime[:n], *columns)
+
+    def append(self, dt, commission, equity, cash, position_profit):
+        """ 新增一行。 """
+        if self._size == len(self.datetime):
+            self._resize(max(2 * self._size, 1))
+        self._size += 1
+        self.update_last(dt, commission, equity, cash, position_profit)
+
+    def update_last(self, dt, commission, equity, cash, position_profit):
+        """ 覆盖最后一行。 """
+        i = self._size - 1
+        assert(i >= 0)
+        self.datetime[i] = dt
+        self.commission[i] = commission
+        self.equity[i] = equity
+        self.cash[i] = cash
+        self.position_profit[i] = position_profit
+
+    def to_frame(self):
+        """ 以时间为索引的 DataFrame，和资金历史共享内存。
+
+        Returns:
+            pd.DataFrame 数据列 { 'commission', 'equity', 'cash',
+                                  'position_profit' }
+        """
+        n = self._size
+        index = pd.DatetimeIndex(self.datetime[:n], name='datetime')
+        return pd.DataFrame(dict((name, getattr(self, name)[:n])
+                                 for name in self.columns),
+                            index=index, columns=self.columns, copy=False)
+
+    def _resize(self, capacity):
+        for name in ('datetime',) + self.columns:
+            column = getattr(self, name)
+            new_column = np.empty(capacity, dtype=column.dtype)
+            new_column[:self._size] = column[:self._size]
+            setattr(self, name, new_column)
+
+    def _row(self, i, dt):
+        return {
+            'datetime': dt,
+            'commission': float(self.commission[i]),
+            'equity': float(self.equity[i]),
+            'cash': float(self.cash[i]),
+            'position_profit': float(self.position_profit[i])
+        }
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self._size))]
+        if i < 0:
+            i += self._size
+        if not 0 <= i < self._size:
+            raise IndexError('资金历史下标越界')
+        return self._row(i, pd.Timestamp(self.datetime[i]))
+
+    def __iter__(self):
+        dts = pd.DatetimeIndex(self.datetime[:self._size])
+        for i, dt in enumerate(dts):
+            yield self._row(i, dt)
+
+    def __getstate__(self):
+        # 只保存有效的行。
+        n = self._size
+        state = dict((name, getattr(self, name)[:n].copy())
+                     for name in ('datetime',) + self.columns)
+        state['_size'] = n
+        return state
+
+
 class Blotter(object):
     """
     订单管理。
@@ -47,7 +182,18 @@ class SimpleBlotter(Blotter):
     简单的订单管理系统，直接给 :class:`quantdigger.engine.exchange.Exchange`
     对象发订单，没有风控。
     """
-    def __init__(self, name, events_pool, settings={}):
+    def __init__(self, name, events_pool, settings={}, capacity=0):
+        """
+        Args:
+            name (str): 策略名
+
+            events_pool (EventsPool): 事件池
+
+            settings (dict): 'capital' 为初始资金，'commission' 为可选的
+                佣金模型，用于最后的强平
+
+            capacity (int): 资金历史预分配的行数，一般为回测的Bar数
+        """
         super(SimpleBlotter, self).__init__(name)
         self.open_orders = set()
         self.positions = {}  # Contract: Position
@@ -56,9 +202,18 @@ class SimpleBlotter(Blotter):
         self._all_orders = []
         self._pre_settlement = 0     # 昨日结算价
         self._datetime = None  # 当前时间
-        self._all_holdings = []   # 所有时间点上的资金 list of dict
+        self._all_holdings = HoldingsHistory(capacity)  # 所有时间点上的资金
         self._all_transactions = []
         self._capital = settings['capital']
+        self._commission = settings.get('commission')
+        # 持仓盈亏和保证金的汇总，只在价格或持仓变化时更新。
+        self._held = {}  # Contract -> [PositionKey]
+        self._pos_marks = {}  # PositionKey -> (持仓盈亏, 保证金)
+        self._changed_positions = set()  # 上次更新后成交过的持仓
+        self._pos_profit = 0.0
+        self._pos_margin = 0.0
+        self._order_margins = {}  # 未成交开仓报单 -> 保证金
+        self._order_margin = 0.0
 
     @property
     def all_holdings(self):
@@ -74,9 +229,12 @@ class SimpleBlotter(Blotter):
             self._force_close()
         return self._all_transactions
 
-    def update_data(self, ticks, bars):
-        """ 当前价格数据更新。 """
-        # self._ticks = ticks
+    def update_data(self, bars):
+        """ 当前价格数据更新。
+
+        Args:
+            bars (BarStore): 各合约的最新Bar
+        """
         self._bars = bars
 
     def update_signal(self, event):
@@ -85,15 +243,30 @@ class SimpleBlotter(Blotter):
         可能产生一系列order事件，在bar的开盘时间交易。
         """
         assert event.route == Event.SIGNAL
+        for order in self.add_orders(event.orders, event.checked):
+            self.api.order(copy.deepcopy(order))
+
+    def add_orders(self, orders, checked=False):
+        """ 检查并登记策略函数产生的订单，冻结开仓资金和平仓仓位。
+
+        Args:
+            orders (list): [Order, ..]
+
+            checked (bool): 开仓单是否已整批检查过资金，见
+                :meth:`TradingDelegator.rebalance` ，是则不再逐单检查。
+
+        Returns:
+            list. 合法的订单，由调用者发给交易所。
+        """
         new_orders = []
-        for order in event.orders:
-            errmsg = self._valid_order(order)
+        for order in orders:
+            errmsg = self._valid_order(order, checked)
             if errmsg == '':
                 order.datetime = self._datetime
                 new_orders.append(order)
                 if order.side == TradeSide.OPEN:
                     self.holding['cash'] -= \
-                        order.order_margin(self._bars[order.contract].open)
+                        order.order_margin(self._bars.open(order.contract))
             else:
                 log.warn(errmsg)
                 # six.print_(len(event.orders), len(new_orders))
@@ -101,18 +274,52 @@ class SimpleBlotter(Blotter):
         self.open_orders.update(new_orders)  # 改变对象的值，不改变对象地址。
         self._all_orders.extend(new_orders)
         for order in new_orders:
-            self.api.order(copy.deepcopy(order))
+            if order.side == TradeSide.OPEN:
+                margin = order.order_margin(order.price)
+                self._order_margins[order] = margin
+                self._order_margin += margin
         for order in new_orders:
             if order.side == TradeSide.CLOSE:
                 pos = self.positions[
                     PositionKey(order.contract, order.direction)]
                 pos.closable -= order.quantity
+        return new_orders
+
+    def released_margin(self, contract, direction, quantity):
+        """ 平仓释放的资金，用于批量调仓时整批检查资金。
+
+        按持仓最近一次估值的保证金(股票为市值)的比例计算，持仓盈亏已计入
+        权益和可用资金。
+
+        Args:
+            contract (Contract): 合约
+
+            direction (Direction): 持仓方向
+
+            quantity (int): 平仓数量
+
+        Returns:
+            float.
+        """
+        key = PositionKey(contract, direction)
+        pos = self.positions.get(key)
+        if not pos or not pos.quantity:
+            return 0.0
+        margin = self._pos_marks.get(key, (0.0, 0.0))[1]
+        return margin * quantity / pos.quantity
 
     def update_fill(self, event):
         """ 处理委托单成交事件。 """
-        # @TODO 订单编号和成交编号区分开
         assert event.route == Event.FILL
-        trans = event.transaction
+        self.add_transaction(event.transaction)
+
+    def add_transaction(self, trans):
+        """ 处理委托单成交或撤单回报。
+
+        Args:
+            trans (Transaction): 成交明细
+        """
+        # @TODO 订单编号和成交编号区分开
         try:
             self.open_orders.remove(trans.order)
         except KeyError:
@@ -120,6 +327,11 @@ class SimpleBlotter(Blotter):
                 raise TradingError(err='重复撤单')
             else:
                 assert(False and '重复成交')
+        # 成交或撤单都释放开仓报单的保证金，撤单和原报单的编号相同。
+        margin = self._order_margins.pop(trans.order, None)
+        if margin is not None:
+            self._order_margin = self._order_margin - margin \
+                if self._order_margins else 0.0
         self._update_holding(trans)
         self._update_positions(trans)
 
@@ -135,6 +347,8 @@ class SimpleBlotter(Blotter):
                         order.contract, order.direction)]
                     pos.closable += order.quantity
             self.open_orders.clear()
+            self._order_margins.clear()
+            self._order_margin = 0.0
             for key, pos in six.iteritems(self.positions):
                 pos.closable += pos.today
                 pos.today = 0
@@ -144,53 +358,66 @@ class SimpleBlotter(Blotter):
         """ 更新历史持仓，当前权益。"""
         # @TODO open_orders 和 postion_margin分开，valid_order调用前再统计？
         # 更新资金历史。
-        dh = {}
-        dh['datetime'] = dt
-        dh['commission'] = self.holding['commission']
-        pos_profit = 0.0
-        margin = 0.0
-        order_margin = 0.0
-        # 计算当前持仓历史盈亏。
-        # 以close价格替代市场价格。
-        for key, pos in six.iteritems(self.positions):
-            bar = self._bars[key.contract]
-            if not at_baropen or bar.datetime < dt:
-                new_price = bar.close
-            else:
-                new_price = bar.open
-            pos_profit += pos.profit(new_price)
-            # @TODO 用昨日结算价计算保证金
-            margin += pos.position_margin(new_price)
-        # 计算未成交开仓报单的保证金占用
-        for order in self.open_orders:
-            assert(order.price_type == PriceType.LMT)
-            bar = self._bars[order.contract]
-            #new_price = bar.open if at_baropen else bar.close
-            new_price = order.price
-            if order.side == TradeSide.OPEN:
-                order_margin += order.order_margin(new_price)
+        commission = self.holding['commission']
+        self._mark_positions(dt, at_baropen)
+        pos_profit = self._pos_profit
+        margin = self._pos_margin
+        order_margin = self._order_margin
         # 当前权益 = 初始资金 + 累积平仓盈亏 + 当前持仓盈亏 - 历史佣金总额
-        dh['equity'] = self._capital + self.holding['history_profit'] + \
-            pos_profit - self.holding['commission']
+        equity = self._capital + self.holding['history_profit'] + \
+            pos_profit - commission
         # @TODO
         # 对于股票，Bar的开盘和收盘点资金验证是一致的。
         # 如果期货不一致，成交撮合时候也无法确定确切的时间点，
         # ，就无法确定精确的可用资金，可能因此导致cash<0, 就得加
         # 强平功能，使交易继续下去。
-        dh['cash'] = dh['equity'] - margin - order_margin
-        if dh['cash'] < 0:
+        cash = equity - margin - order_margin
+        if cash < 0:
             for key in six.iterkeys(self.positions):
                 if not key.contract.is_stock:
                     # @NOTE  只要有一个是期货，在资金不足的时候就得追加保证金
                     raise Exception('需要追加保证金!')
-        self.holding['cash'] = dh['cash']
-        self.holding['equity'] = dh['equity']
+        self.holding['cash'] = cash
+        self.holding['equity'] = equity
         self.holding['position_profit'] = pos_profit
         if at_baropen:
-            self._all_holdings.append(dh)
+            self._all_holdings.append(dt, commission, equity, cash,
+                                      pos_profit)
         else:
-            self._all_holdings[-1] = dh
+            self._all_holdings.update_last(dt, commission, equity, cash,
+                                           pos_profit)
 
+    def _mark_positions(self, dt, at_baropen):
+        """ 重新计算本时间步有新Bar的合约和成交过的持仓的盈亏和保证金。 """
+        bars = self._bars
+        held = self._held
+        changed = self._changed_positions
+        for contract in bars.updated:
+            keys = held.get(contract)
+            if keys:
+                changed.update(keys)
+        for key in changed:
+            old_profit, old_margin = self._pos_marks.pop(key, (0.0, 0.0))
+            pos = self.positions.get(key)
+            if pos is None:
+                profit = margin = 0.0
+            else:
+                # 以close价格替代市场价格。
+                contract = key.contract
+                if not at_baropen or bars.datetime(contract) < dt:
+                    new_price = bars.close(contract)
+                else:
+                    new_price = bars.open(contract)
+                profit = pos.profit(new_price)
+                # @TODO 用昨日结算价计算保证金
+                margin = pos.position_margin(new_price)
+                self._pos_marks[key] = (profit, margin)
+            self._pos_profit += profit - old_profit
+            self._pos_margin += margin - old_margin
+        changed.clear()
+        if not self._pos_marks:
+            # 没有持仓时清零，避免累积浮点误差。
+            self._pos_profit = self._pos_margin = 0.0
 
     def _update_positions(self, trans):
         """ 更新持仓 """
@@ -200,7 +427,11 @@ class SimpleBlotter(Blotter):
             if pos:
                 pos.closable += trans.quantity
             return
-        pos = self.positions.setdefault(poskey, Position(trans))
+        self._changed_positions.add(poskey)
+        pos = self.positions.get(poskey)
+        if pos is None:
+            pos = self.positions[poskey] = Position(trans)
+            self._held.setdefault(poskey.contract, []).append(poskey)
         if trans.side == TradeSide.OPEN:
             pos.cost = (pos.cost*pos.quantity + trans.price*trans.quantity) / \
                         (pos.quantity+trans.quantity)
@@ -214,6 +445,10 @@ class SimpleBlotter(Blotter):
             pos.quantity -= trans.quantity
             if pos.quantity == 0:
                 del self.positions[poskey]
+                keys = self._held[poskey.contract]
+                keys.remove(poskey)
+                if not keys:
+                    del self._held[poskey.contract]
 
     def _update_holding(self, trans):
         """ 更新佣金和平仓盈亏。 """
@@ -229,8 +464,8 @@ class SimpleBlotter(Blotter):
             self.holding['history_profit'] += profit
         self._all_transactions.append(trans)
 
-    def _valid_order(self, order):
-        """ 判断订单是否合法。 """
+    def _valid_order(self, order, checked=False):
+        """ 判断订单是否合法，checked为真时不检查开仓资金。 """
         if order.quantity <= 0:
             return "交易数量要大于0"
         # 撤单
@@ -247,8 +482,8 @@ class SimpleBlotter(Blotter):
                 # 没有持有该合约
                 # log.warn("不存在合约[%s]" % order.contract)
                 return "不存在合约[%s]" % order.contract
-        elif order.side == TradeSide.OPEN:
-            new_price = self._bars[order.contract].open
+        elif order.side == TradeSide.OPEN and not checked:
+            new_price = self._bars.open(order.contract)
             if self.holding['cash'] < order.order_margin(new_price):
                 # six.print_(self.holding['cash'], new_price * order.quantity)
                 return '没有足够的资金开仓'
@@ -268,10 +503,14 @@ class SimpleBlotter(Blotter):
                 price_type,
                 TradeSide.CLOSE,
                 pos.direction,
-                self._bars[pos.contract].close,
+                self._bars.close(pos.contract),
                 pos.quantity
             )
-            force_trans.append(Transaction(order))
+            trans = Transaction(order)
+            if self._commission is not None:
+                # 强平不计滑点。
+                apply_costs(trans, self._commission)
+            force_trans.append(trans)
 
         for trans in force_trans:
             self._update_holding(trans)
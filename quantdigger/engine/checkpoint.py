@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+""" 回测断点的保存和恢复。
+
+断点只保存回测状态：各合约读到第几根Bar、策略的用户序列变量、
+订单管理器和模拟交易所的状态。行情数据和指标在恢复时重新加载和计算，
+所以恢复时的数据可以比保存时多，用于在已完成的回测后追加新数据。
+"""
+import os
+import pickle
+
+from quantdigger.datastruct import OrderID
+
+
+def save(path, state):
+    """ 把断点写入文件，先写临时文件再替换，写入中途崩溃不会损坏旧断点。 """
+    state['order_id'] = OrderID.order_id
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        pickle.dump(state, f, pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+
+
+def load(path):
+    with open(path, 'rb') as f:
+        state = pickle.load(f)
+    # 避免恢复后新订单和断点中的订单编号重复。
+    OrderID.order_id = max(OrderID.order_id, state['order_id'])
+    return state
+
+
+def _obj_state(obj, *excludes):
+    return dict((k, v) for k, v in obj.__dict__.items() if k not in excludes)
+
+
+def _series_state(derived):
+    return dict((name, (s.curbar, s.data[:s.curbar + 1]))
+                for name, s in derived._series.items())
+
+
+def context_state(ctx):
+    """ 策略上下文的状态。
+
+    Returns:
+        dict.
+    """
+    series = {}
+    for key, data in ctx.data_ref._all_pcontract_data.items():
+        if key == data.s_pcontract:  # 跳过简写合约
+            series[key] = _series_state(data.derived)
+    return {
+        'aligned_bar_index': ctx.aligned_bar_index,
+        'aligned_dt': ctx.aligned_dt,
+        'dt_series': ctx.dt_series.data[:ctx.aligned_bar_index],
+        'series': series,
+        'marks': ctx.marks,
+        'strategy': ctx.strategy.__dict__,
+        # 行情数据每步都会重新设置，不需要保存。
+        'blotter': _obj_state(ctx.blotter, 'api', '_bars'),
+        'exchange': _obj_state(ctx.exchange, 'events', 'ticks'),
+        'trading': (ctx._datetime, ctx._cancel_now),
+    }
+
+
+def restore_context(ctx, state):
+    """ 恢复策略上下文的状态，对象原地更新，已返回的Profile仍然有效。
+
+    ctx须已运行过策略的on_init。
+    """
+    ctx.aligned_bar_index = state['aligned_bar_index']
+    ctx.aligned_dt = state['aligned_dt']
+    dts = state['dt_series']
+    ctx.dt_series.data[:len(dts)] = dts
+    for s_pcontract, saved in state['series'].items():
+        derived = ctx.data_ref.get_data(s_pcontract).derived
+        for name, (curbar, data) in saved.items():
+            s = derived._series[name]
+            s.data[:len(data)] = data
+            s.update_curbar(curbar)
+    ctx.marks[:] = state['marks']
+    ctx.strategy.__dict__.update(state['strategy'])
+    ctx.blotter.__dict__.update(state['blotter'])
+    ctx.exchange.__dict__.update(state['exchange'])
+    ctx._datetime, ctx._cancel_now = state['trading']
+
@@ -1,2 +1,3 @@
-from .data_context import OriginalData
+from .data_context import OriginalData, MarketData
 from .context import Context
+from .universe import Universe
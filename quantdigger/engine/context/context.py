@@ -3,41 +3,48 @@ import six
 import datetime
 
 from quantdigger.engine.series import SeriesBase
+from quantdigger.errors import StreamTechnicalError
+from quantdigger.technicals.base import TechnicalBase
 from quantdigger.util import MAX_DATETIME
 from quantdigger.engine.series import DateTimeSeries
 
-from .data_context import DataRef
+from .data_context import DataRef, MarketData
 from .plotter import PlotterDelegator
 from .trading import TradingDelegator
 
 
 class Context(PlotterDelegator, TradingDelegator):
     """ 上下文"""
-    def __init__(self, data: "dict((s_pcon, DataFrame))",
-                 name, settings, strategy, max_window):
-        TradingDelegator.__init__(self, name, settings)
+    def __init__(self, market_data: MarketData,
+                 name, settings, strategy, max_window, window=None,
+                 direct=False):
+        TradingDelegator.__init__(self, name, settings, max_window, direct)
         PlotterDelegator.__init__(self)
 
-        self.dt_series = DateTimeSeries([MAX_DATETIME] * max_window,
+        if window:
+            # 流式模式，只保留最近window个时间。
+            self.dt_series = DateTimeSeries(name='universal_time',
+                                            window=window)
+        else:
+            self.dt_series = DateTimeSeries([MAX_DATETIME] * max_window,
                                             'universal_time')
         self.aligned_dt = datetime.datetime(2100, 1, 1)
         self.aligned_bar_index = 0
         self.strategy_name = name
         self.on_bar = False
         self.strategy = strategy
-        self.data_ref = DataRef(data)
+        self.data_ref = DataRef(market_data)
+        self.universe = None  # 截面策略的 Universe
 
     def process_trading_events(self, at_baropen):
-        super().update_environment(
-            self.aligned_dt, self.data_ref.ticks, self.data_ref.bars)
+        super().update_environment(self.aligned_dt, self.data_ref.bars)
         super().process_trading_events(at_baropen)
 
     def update_datetime(self, next_dt):
         self.dt_series.curbar = self.aligned_bar_index
-        self.aligned_dt = min(self.data_ref.original.next_datetime,
-                                self.aligned_dt)
+        self.aligned_dt = next_dt
         try:
-            self.dt_series.data[self.aligned_bar_index] = self.aligned_dt
+            self.dt_series.update(self.aligned_dt)
         except IndexError:
             self.dt_series.data.append(self.aligned_dt)
 
@@ -57,14 +64,20 @@ class Context(PlotterDelegator, TradingDelegator):
         if name in [
                 'dt_series', 'strategy',
                 '_trading', 'on_bar', 'aligned_bar_index', 'aligned_dt',
-                'marks', 'blotter', 'exchange', '_orders', '_datetime',
+                'marks', 'blotter', 'exchange', '_orders', '_batches',
+                '_datetime',
                 '_cancel_now', 'events_pool', 'data_ref',
-                'strategy_name'
+                'strategy_name', 'timer', '_direct', 'universe'
         ]:
             super(Context, self).__setattr__(name, value)
         else:
+            original = self.data_ref.original
             if isinstance(value, SeriesBase):
-                value.reset_data([], self.data_ref.original.size)
+                value.reset_data([], original.size, original.window)
+            elif isinstance(value, TechnicalBase) and original.window:
+                # 指标在on_init中对整个序列做向量计算，流式模式下只能
+                # 看到最近window根Bar。
+                raise StreamTechnicalError(window=original.window, name=name)
             self.data_ref.add_item(name, value)
 
     @property
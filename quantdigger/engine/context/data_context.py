@@ -2,9 +2,10 @@
 
 import datetime
 import six
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
 
 from quantdigger.engine.series import NumberSeries, DateTimeSeries, SeriesBase
+from quantdigger.errors import DataAlignError
 from quantdigger.technicals.base import TechnicalBase
 from quantdigger.util import log
 from quantdigger.datastruct import Bar, PContract
@@ -13,15 +14,183 @@ from quantdigger.datastruct import Bar, PContract
 PContractData = namedtuple("PContractData", "s_pcontract original derived")
 
 
-class DataRef(object):
+class MarketData(object):
+    """ 所有策略共享的行情数据。
+
+    系统序列变量(open, close...)和最新的Bar在每个时间步只更新一次，
+    各策略的 :class:`DataRef` 只引用它。
+
+    设置window时为流式模式，data的值是按时间顺序逐块返回DataFrame的
+    迭代器，系统序列变量只保留最近window根Bar。
     """
+    def __init__(self, data: "Dict((strpcon, DataFrame))", window=None):
+        self.originals = OrderedDict()  # strpcon -> OriginalData
+        self.aliases = {}  # 简写合约 -> strpcon
+        self.bars = BarStore()
+        self._bar_slots = {}  # strpcon -> BarStore中的下标
+        self._window = window
+        self._tranform_data(data)
+
+    def _tranform_data(self, data: "Dict((strpcon, DataFrame))"):
+        for s_pcontract, raw_data in six.iteritems(data):
+            pcontract = PContract.from_string(s_pcontract)
+            if self._window:
+                self.originals[s_pcontract] = StreamOriginalData(
+                    pcontract, raw_data, self._window)
+            else:
+                self.originals[s_pcontract] = OriginalData(pcontract,
+                                                           raw_data)
+            self._bar_slots[s_pcontract] = self.bars.add(
+                self.originals[s_pcontract])
+            # PContract -- 'IF000.SHEF-10.Minutes'
+            # 简化策略用户的合约输入。
+            symbol_exchange = s_pcontract.split('-')[0]
+            same_contracts = list(filter(
+                lambda x: x.startswith(symbol_exchange), data.keys()))
+            if len(same_contracts) == 1:
+                self.aliases[symbol_exchange] = s_pcontract
+                symbol = s_pcontract.split('.')[0]
+                self.aliases[symbol] = s_pcontract
+
+    def get_original(self, s_pcontract: str):
+        return self.originals[self.aliases.get(s_pcontract, s_pcontract)]
+
+    def rolling_forward(self, s_pcontract: str):
+        """ 合约读取下一根Bar。 """
+        hasnext, data = self.originals[s_pcontract].rolling_forward()
+        return hasnext
+
+    def seek(self, s_pcontract: str, curbar: int):
+        """ 合约直接定位到第curbar根Bar，用于从断点恢复。 """
+        self.originals[s_pcontract].seek(curbar)
+        self.update_system_vars(s_pcontract)
+
+    def update_system_vars(self, s_pcontract: str):
+        """ 更新合约的系统序列变量和最新价格。 """
+        original = self.originals[s_pcontract]
+        original.update_system_vars()
+        self.bars.update(self._bar_slots[s_pcontract],
+                         original.close._offset(original._curbar))
+
+
+class BarStore(object):
+    """ 各合约最新Bar的列式视图。
+
+    直接引用各周期合约系统序列变量的数据数组，每个周期合约只记录当前
+    Bar在数组中的位置，撮合和持仓计算按下标读取价格，不为每根Bar创建
+    对象。同一合约有多个周期时，读取最近更新的周期。
+
+    :ivar updated: 当前时间步有新Bar的合约。
     """
-    def __init__(self, data: "Dict((strpcon, DataFrame))"):
+    def __init__(self):
+        self.updated = []
+        self._slots = {}  # Contract -> 合约下标
+        self._latest = []  # 合约下标 -> 最近更新的周期合约下标
+        self._contract_slots = []  # 周期合约下标 -> 合约下标
+        self._contracts = []  # 周期合约下标 -> Contract
+        self._cursors = []  # 周期合约下标 -> 当前Bar在数组中的位置
+        self._datetimes = []
+        self._opens = []
+        self._closes = []
+        self._highs = []
+        self._lows = []
+        self._volumes = []
+
+    def add(self, original):
+        """ 登记周期合约的数据数组。
+
+        Returns:
+            int. 周期合约下标
+        """
+        slot = len(self._cursors)
+        contract_slot = self._slots.get(original.contract)
+        if contract_slot is None:
+            contract_slot = self._slots[original.contract] = len(self._latest)
+            self._latest.append(-1)
+        self._contract_slots.append(contract_slot)
+        self._contracts.append(original.contract)
+        self._cursors.append(-1)
+        self._datetimes.append(original.datetime.data)
+        self._opens.append(original.open.data)
+        self._closes.append(original.close.data)
+        self._highs.append(original.high.data)
+        self._lows.append(original.low.data)
+        self._volumes.append(original.volume.data)
+        return slot
+
+    def update(self, slot, cursor):
+        """ 周期合约的当前Bar移到数据数组的cursor处。 """
+        self._cursors[slot] = cursor
+        self._latest[self._contract_slots[slot]] = slot
+        self.updated.append(self._contracts[slot])
+
+    def new_step(self):
+        """ 进入新的时间步。 """
+        self.updated = []
+
+    def locate(self, contract):
+        """ 合约当前Bar的 (周期合约下标, 数组位置)，没有数据时抛出KeyError。 """
+        slot = self._latest[self._slots[contract]]
+        if slot < 0:
+            raise KeyError(contract)
+        return slot, self._cursors[slot]
+
+    def __contains__(self, contract):
+        try:
+            self.locate(contract)
+        except KeyError:
+            return False
+        return True
+
+    def datetimes(self, slot):
+        """ 周期合约的时间数组。 """
+        return self._datetimes[slot]
+
+    def datetime(self, contract):
+        slot, i = self.locate(contract)
+        return self._datetimes[slot][i]
+
+    def open(self, contract):
+        slot, i = self.locate(contract)
+        return float(self._opens[slot][i])
+
+    def close(self, contract):
+        slot, i = self.locate(contract)
+        return float(self._closes[slot][i])
+
+    def high(self, contract):
+        slot, i = self.locate(contract)
+        return float(self._highs[slot][i])
+
+    def low(self, contract):
+        slot, i = self.locate(contract)
+        return float(self._lows[slot][i])
+
+    def volume(self, contract):
+        slot, i = self.locate(contract)
+        return float(self._volumes[slot][i])
+
+    def __getitem__(self, contract):
+        """ 合约的最新Bar，每次调用都创建新对象，不要在回测循环中使用。 """
+        slot, i = self.locate(contract)
+        return Bar(self._datetimes[slot][i], float(self._opens[slot][i]),
+                   float(self._closes[slot][i]), float(self._highs[slot][i]),
+                   float(self._lows[slot][i]), float(self._volumes[slot][i]))
+
+
+class DataRef(object):
+    """ 策略对行情数据的引用，只包含策略自己的用户变量。
+    """
+    def __init__(self, market_data: MarketData):
         self._all_pcontract_data = {}
         self._pcontract_data = None
-        self.ticks = {}  # Contract -> float
-        self.bars = {}   # Contract -> Bar
-        self._tranform_data(data)
+        self.bars = market_data.bars
+        for s_pcontract, original in six.iteritems(market_data.originals):
+            self._all_pcontract_data[s_pcontract] = PContractData(
+                s_pcontract, original, DerivedData())
+        for alias, s_pcontract in six.iteritems(market_data.aliases):
+            self._all_pcontract_data[alias] = \
+                self._all_pcontract_data[s_pcontract]
         self.default_pcontract: str = None
 
     @property
@@ -41,58 +210,13 @@ class DataRef(object):
     def switch_to_default_pcontract(self):
         self.switch_to_pcontract(self.default_pcontract)
 
-    def _tranform_data(self, data: "Dict((strpcon, DataFrame))"):
-        for s_pcontract, raw_data in six.iteritems(data):
-            original = OriginalData(PContract.from_string(s_pcontract),
-                                    raw_data)
-            derived = DerivedData()
-            pcontract_data = PContractData(s_pcontract, original, derived)
-            self._all_pcontract_data[s_pcontract] = pcontract_data
-            # PContract -- 'IF000.SHEF-10.Minutes'
-            # 简化策略用户的合约输入。
-            symbol_exchange = s_pcontract.split('-')[0]
-            same_contracts = list(filter(
-                lambda x: x.startswith(symbol_exchange), data.keys()))
-            if len(same_contracts) == 1:
-                self._all_pcontract_data[symbol_exchange] = pcontract_data
-            symbol = s_pcontract.split('.')[0]
-            num_same_contract = list(filter(
-                lambda x: x.startswith(symbol), data.keys()))
-            if len(same_contracts) == 1:
-                self._all_pcontract_data[symbol] = pcontract_data
-
     def switch_to_pcontract(self, s_pcontract):
         self._pcontract_data = self._all_pcontract_data[s_pcontract]
 
-    def datetime_aligned(self, context_dt):
-        return (self.original.datetime[0] <= context_dt and
-                self.original.next_datetime <= context_dt)
-
-    def rolling_forward(self, context_dt_update_func):
-        if self.original.has_pending_data:
-            context_dt_update_func(self.original.next_datetime)
-            return True
-        hasnext, data = self.original.rolling_forward()
-        if not hasnext:
-            return False
-        context_dt_update_func(self.original.next_datetime)
-        return True
-
     def update_user_vars(self):
         """ 更新用户在策略中定义的变量, 如指标等。 """
         self.derived.update_user_vars(self.original._curbar)
 
-    def update_system_vars(self):
-        """ 更新用户在策略中定义的变量, 如指标等。 """
-        original = self.original
-        original.update_system_vars()
-        self.ticks[original.contract] = original.close[0]
-        self.bars[original.contract] = original.bar
-        oldbar = self.bars.setdefault(original.contract, original.bar)
-        if original.bar.datetime > oldbar.datetime:
-            # 处理不同周期时间滞后
-            self.bars[original.contract] = original.bar
-
     def add_item(self, name, value):
         self.derived.add_item(name, value)
 
@@ -117,10 +241,58 @@ class RollingHelper(object):
             return True, self.curbar
 
 
+class StreamRollingHelper(object):
+    """ 分块数据源包装器，逐块读取数据并支持逐步读取操作。
+
+    只持有当前块，当前块读完后才从数据源读取下一块。
+    """
+
+    def __init__(self, chunks):
+        self.curbar = -1
+        self.row = None  # 当前Bar (datetime, open, close, high, low, volume)
+        self._chunks = iter(chunks)
+        self._columns = None
+        self._pos = 0
+        self._size = 0
+        self._next_chunk()
+
+    def _next_chunk(self):
+        for chunk in self._chunks:
+            if len(chunk):
+                self._columns = (chunk.index, chunk.open.values,
+                                 chunk.close.values, chunk.high.values,
+                                 chunk.low.values, chunk.volume.values)
+                self._pos = 0
+                self._size = len(chunk)
+                return
+        self._columns = None
+
+    @property
+    def next_datetime(self):
+        """ 下一根Bar的时间，数据读完时为None。 """
+        if self._columns is None:
+            return None
+        return self._columns[0][self._pos]
+
+    def rolling_forward(self):
+        """ 读取下一个数据"""
+        if self._columns is None:
+            return False, self.curbar
+        pos = self._pos
+        self.row = tuple(column[pos] for column in self._columns)
+        self.curbar += 1
+        self._pos += 1
+        if self._pos == self._size:
+            self._next_chunk()
+        return True, self.curbar
+
+
 class OriginalData(object):
     """ A DataContext expose data should be visited by multiple strategie.
     which including bars of specific PContract.
     """
+    window = None
+
     def __init__(self, pcontract, raw_data):
         self.open = NumberSeries(raw_data.open.values, 'open')
         self.close = NumberSeries(raw_data.close.values, 'close')
@@ -128,7 +300,6 @@ class OriginalData(object):
         self.low = NumberSeries(raw_data.low.values, 'low')
         self.volume = NumberSeries(raw_data.volume.values, 'volume')
         self.datetime = DateTimeSeries(raw_data.index, 'datetime')
-        self.bar = Bar(None, None, None, None, None, None)
         self.has_pending_data = False
         self.next_datetime = datetime.datetime(2100, 1, 1)
         self.size = len(raw_data.close)
@@ -149,6 +320,12 @@ class OriginalData(object):
     def contract(self):
         return self.pcontract.contract
 
+    @property
+    def bar(self):
+        """ 当前Bar，每次调用都创建新对象。 """
+        return Bar(self.datetime[0], self.open[0], self.close[0],
+                   self.high[0], self.low[0], self.volume[0])
+
     def update_system_vars(self):
         self._curbar = self._next_bar
         self.open.update_curbar(self._curbar)
@@ -157,8 +334,6 @@ class OriginalData(object):
         self.low.update_curbar(self._curbar)
         self.volume.update_curbar(self._curbar)
         self.datetime.update_curbar(self._curbar)
-        self.bar = Bar(self.datetime[0], self.open[0], self.close[0],
-                       self.high[0], self.low[0], self.volume[0])
 
     def rolling_forward(self):
         """ Retrieve data of next step """
@@ -171,10 +346,71 @@ class OriginalData(object):
             raise
         return True, self.has_pending_data
 
+    def seek(self, curbar):
+        """ 下一步读取第curbar根Bar。 """
+        self._helper.curbar = curbar
+        self._next_bar = curbar
+        self.has_pending_data = True
+        self.next_datetime = self._raw_data.index[curbar]
+
     def __len__(self):
         return len(self._helper)
 
 
+class StreamOriginalData(OriginalData):
+    """ 流式读取的OriginalData，数据逐块读取，系统序列变量是只保留最近
+    window根Bar的环形缓冲区，内存占用和数据长度无关。
+    """
+    def __init__(self, pcontract, chunks, window):
+        self.open = NumberSeries(name='open', window=window)
+        self.close = NumberSeries(name='close', window=window)
+        self.high = NumberSeries(name='high', window=window)
+        self.low = NumberSeries(name='low', window=window)
+        self.volume = NumberSeries(name='volume', window=window)
+        self.datetime = DateTimeSeries(name='datetime', window=window)
+        self.has_pending_data = False
+        self.next_datetime = datetime.datetime(2100, 1, 1)
+        self.size = window
+        self.window = window
+        self.pcontract = pcontract
+        self._curbar = -1
+        self._helper = StreamRollingHelper(chunks)
+        self._series = (self.datetime, self.open, self.close,
+                        self.high, self.low, self.volume)
+
+    @property
+    def pending_datetime(self):
+        """ 下一根未读取Bar的时间，数据读完时为None。 """
+        return self._helper.next_datetime
+
+    def update_system_vars(self):
+        self._curbar = self._next_bar
+        for s, value in zip(self._series, self._helper.row):
+            s.update_curbar(self._curbar)
+            s.update(value)
+
+    def rolling_forward(self):
+        """ Retrieve data of next step """
+        self.has_pending_data, self._next_bar = self._helper.rolling_forward()
+        if not self.has_pending_data:
+            return False, None
+        self.next_datetime = self._helper.row[0]
+        if self.datetime[0] >= self.next_datetime and self.curbar != 0:
+            log.error('合约[%s] 数据时间逆序或冗余' % self.pcontract)
+            raise DataAlignError()
+        return True, self.has_pending_data
+
+    def seek(self, curbar):
+        """ 逐根读取到第curbar根Bar，环形缓冲区随之填满。 """
+        while self._helper.curbar < curbar - 1:
+            self.rolling_forward()
+            self.update_system_vars()
+        self.rolling_forward()
+
+    def __len__(self):
+        return self.window
+
+
 class DerivedData(object):
     def __init__(self):
         self._series = {}
@@ -4,6 +4,7 @@
 
 import copy
 import six
+import numpy as np
 from six.moves import queue
 from quantdigger.engine.blotter import SimpleBlotter
 from quantdigger.engine.exchange import Exchange
@@ -16,38 +17,60 @@ from quantdigger.datastruct import (
     PriceType,
     Contract
 )
+from quantdigger.util import log
 
 
 class TradingDelegator(object):
     """"""
-    def __init__(self, name, settings={}):
+    def __init__(self, name, settings={}, capacity=0, direct=False):
+        """
+        Args:
+            direct (bool): 订单管理器和模拟交易所直接相互调用，
+                不经过事件池，也不复制订单，只用于回测。
+        """
         self.events_pool = EventsPool()
         # @TODO merge blotter and exchange
-        self.blotter = SimpleBlotter(name, self.events_pool, settings)
-        self.exchange = Exchange(name, self.events_pool, strict=True)
+        self.blotter = SimpleBlotter(name, self.events_pool, settings,
+                                     capacity)
+        self.exchange = Exchange(name, self.events_pool,
+                                 slippage=settings.get('slippage'),
+                                 strict=True,
+                                 commission=settings.get('commission'))
         self._orders = []
+        self._batches = []  # 批量调仓的订单，整批检查过资金
         self._datetime = None
         self._cancel_now = False  # 是当根bar还是下一根bar撤单成功。
+        self.timer = None  # PhaseTimer, 统计各事件的处理耗时。
+        self._direct = direct
 
-    def update_environment(self, dt, ticks, bars):
+    def update_environment(self, dt, bars):
         """ 更新模拟交易所和订单管理器的数据，时间,持仓 """
         self.blotter.update_datetime(dt)
         self.exchange.update_datetime(dt)
-        self.blotter.update_data(ticks, bars)
+        self.blotter.update_data(bars)
         self._datetime = dt
 
     def process_trading_events(self, at_baropen):
         """ 提交订单，撮合，更新持仓 """
+        if self._direct:
+            self._process_trading_direct(at_baropen)
+            self._orders = []
+            self._batches = []
+            return
         if self._orders:
             self.events_pool.put(SignalEvent(self._orders))
-        if not self._orders:
+        for batch in self._batches:
+            self.events_pool.put(SignalEvent(batch, checked=True))
+        if not self._orders and not self._batches:
             # 没有交易信号，确保至少运行一次
             self.events_pool.put(OnceEvent())
         self._process_trading_events(at_baropen)
         self._orders = []
+        self._batches = []
 
     def _process_trading_events(self, at_baropen):
         """"""
+        timer = self.timer
         while True:
             # 事件处理。
             try:
@@ -57,6 +80,8 @@ class TradingDelegator(object):
             except IndexError:
                 break
             else:
+                if timer:
+                    start = timer.now()
                 # if event.type == 'MARKET':
                     # strategy.calculate_signals(event)
                     # port.update_timeindex(event)
@@ -70,10 +95,57 @@ class TradingDelegator(object):
                     # 模拟交易接口收到报单成交
                     self.blotter.api.on_transaction(event)
             # 价格撮合。note: bar价格撮合要求撮合置于运算后面。
-            # @TODO tick 回测不一样
+            # tick回放时交易所在收盘时不撮合，见 Exchange.ticks
             if event.route == Event.ONCE or event.route == Event.ORDER:
                 self.exchange.make_market(self.blotter._bars, at_baropen)
+            if timer:
+                timer.add(event.route, start)
+        if timer:
+            start = timer.now()
         self.blotter.update_status(self._datetime, at_baropen)
+        if timer:
+            timer.add('update_status', start)
+
+    def _process_trading_direct(self, at_baropen):
+        """ 和事件处理的顺序一致：每个订单进入交易所后撮合一次，
+        所有订单提交后再处理成交回报。 """
+        timer = self.timer
+        blotter = self.blotter
+        exchange = self.exchange
+        bars = blotter._bars
+        fills = []
+        if timer:
+            start = timer.now()
+        if self._orders or self._batches:
+            assert(not at_baropen)
+            orders = blotter.add_orders(self._orders)
+            for batch in self._batches:
+                orders.extend(blotter.add_orders(batch, checked=True))
+            if timer:
+                timer.add(Event.SIGNAL, start)
+            for order in orders:
+                if timer:
+                    start = timer.now()
+                exchange.add_order(order)
+                fills.extend(exchange.match_orders(bars, at_baropen))
+                if timer:
+                    timer.add(Event.ORDER, start)
+        else:
+            # 没有交易信号，确保至少撮合一次
+            fills = exchange.match_orders(bars, at_baropen)
+            if timer:
+                timer.add(Event.ONCE, start)
+        for trans in fills:
+            if timer:
+                start = timer.now()
+            blotter.add_transaction(trans)
+            if timer:
+                timer.add(Event.FILL, start)
+        if timer:
+            start = timer.now()
+        blotter.update_status(self._datetime, at_baropen)
+        if timer:
+            timer.add('update_status', start)
 
     def buy(self, price, quantity, symbol=None):
         """ 开多仓
@@ -175,6 +247,132 @@ class TradingDelegator(object):
             quantity
         ))
 
+    def order_target(self, contracts, targets, prices):
+        """ 批量把合约仓位调整到目标数量，见 :meth:`rebalance` 。
+
+        Args:
+            contracts (list): [Contract, ..]，如 universe.contracts
+
+            targets (array): 目标仓位，正数为多头，负数为空头，
+                0表示平仓，nan表示不调整。
+
+            prices (array): 下单价格，0表市价，nan表示不调整。
+        """
+        self.rebalance(contracts, quantities=targets, prices=prices)
+
+    def rebalance(self, contracts, weights=None, quantities=None,
+                  prices=None):
+        """ 按目标权重或目标数量批量调仓，先平后开。
+
+        一次算出所有合约的下单数量和开仓保证金，按合约顺序累计开仓保证金，
+        累计超出可用资金之后的开仓单都舍去。同一批的平仓单释放的资金计入
+        可用资金，见 :meth:`SimpleBlotter.released_margin` 。整批订单在收盘
+        时一次登记，平仓单在前，不再逐单检查资金。目标数量计入未成交的开仓单，
+        不计未成交的平仓单；只能平可平仓位，当天开仓的股票要到下一个交易日
+        才平。
+
+        Args:
+            contracts (list): [Contract, ..]，如 universe.contracts
+
+            weights (array): 目标市值占当前权益的比例，正数为多头，
+                负数为空头，nan表示不调整。
+
+            quantities (array): 目标仓位，和weights二选一。
+
+            prices (array): 下单价格，0表市价，nan表示不调整，
+                默认为各合约最新收盘价。
+
+        Returns:
+            list. 因资金不足舍去的开仓合约
+        """
+        if not self.on_bar:
+            raise Exception('只有on_bar函数内能下单！')
+        assert (weights is None) != (quantities is None)
+        bars = self.blotter._bars
+        n = len(contracts)
+        last = np.array([bars.close(c) if c in bars else np.nan
+                         for c in contracts], dtype=np.float64)
+        prices = last if prices is None else \
+            np.asarray(prices, dtype=np.float64)
+        specs = [c.spec for c in contracts]
+        multiples = np.array([spec.volume_multiple for spec in specs],
+                             dtype=np.float64)
+        if weights is not None:
+            # 市价单按最新收盘价计算数量。
+            values = np.asarray(weights, dtype=np.float64) * \
+                self.blotter.holding['equity']
+            with np.errstate(divide='ignore', invalid='ignore'):
+                targets = np.trunc(values / (
+                    np.where(prices > 0, prices, last) * multiples))
+        else:
+            targets = np.asarray(quantities, dtype=np.float64)
+        active = np.isfinite(targets) & ~np.isnan(prices)
+        targets = np.where(active, targets, 0).astype(np.int64)
+
+        # 当前仓位，计入未成交的开仓单。
+        pending = {}
+        for order in self.blotter.open_orders:
+            if order.side == TradeSide.OPEN:
+                key = PositionKey(order.contract, order.direction)
+                pending[key] = pending.get(key, 0) + order.quantity
+        positions = self.blotter.positions
+        current = np.zeros((2, n), dtype=np.int64)
+        closable = np.zeros((2, n), dtype=np.int64)
+        directions = (Direction.LONG, Direction.SHORT)
+        for i, contract in enumerate(contracts):
+            if not active[i]:
+                continue
+            for d, direction in enumerate(directions):
+                key = PositionKey(contract, direction)
+                pos = positions.get(key)
+                if pos:
+                    closable[d, i] = pos.closable
+                    current[d, i] = pos.closable + pos.today
+                current[d, i] += pending.get(key, 0)
+        goals = np.array([np.maximum(targets, 0), np.maximum(-targets, 0)])
+        goals[:, ~active] = current[:, ~active]
+        closes = np.minimum(np.maximum(current - goals, 0), closable)
+        opens = np.maximum(goals - current, 0)
+
+        # 开仓保证金，和订单管理器的资金检查一致：股票按下单价格，
+        # 期货按开盘价格。
+        is_stock = np.array([c.is_stock for c in contracts], dtype=bool)
+        opens_at = np.array([bars.open(c) if active[i] and c in bars
+                             else 0.0 for i, c in enumerate(contracts)])
+        margin_prices = np.where(is_stock, prices, opens_at)
+        ratios = np.array([[spec.long_margin_ratio for spec in specs],
+                           [spec.short_margin_ratio for spec in specs]])
+        margins = np.where(opens > 0,
+                           opens * margin_prices * ratios * multiples, 0.0)
+        blotter = self.blotter
+        cash = blotter.holding['cash']
+        for order in self._orders + sum(self._batches, []):
+            if order.side == TradeSide.OPEN:
+                cash -= order.order_margin(bars.open(order.contract))
+        for i, d in zip(*np.nonzero(closes.T)):
+            cash += blotter.released_margin(contracts[i], directions[d],
+                                            int(closes[d, i]))
+        # 按合约顺序，先多后空累计。
+        accepted = np.cumsum(margins.T.ravel()).reshape(n, 2).T <= cash
+        rejected = (opens > 0) & ~accepted
+        if rejected.any():
+            log.warning('没有足够的资金开仓: %d笔' % rejected.sum())
+        opens = np.where(accepted, opens, 0)
+
+        batch = [self._new_order(contracts[i], prices[i], TradeSide.CLOSE,
+                                 directions[d], int(closes[d, i]))
+                 for i, d in zip(*np.nonzero(closes.T))]
+        batch.extend(self._new_order(contracts[i], prices[i], TradeSide.OPEN,
+                                     directions[d], int(opens[d, i]))
+                     for i, d in zip(*np.nonzero(opens.T)))
+        if batch:
+            self._batches.append(batch)
+        return [contracts[i] for i in sorted(set(np.nonzero(rejected)[1]))]
+
+    def _new_order(self, contract, price, side, direction, quantity):
+        price_type = PriceType.MKT if price == 0 else PriceType.LMT
+        return Order(None, contract, price_type, side, direction,
+                     float(price), quantity)
 
     def cancel(self, orders):
         """ 撤单
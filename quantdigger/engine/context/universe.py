@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+##
+# @file universe.py
+# @brief 截面策略使用的全部合约的对齐数据。
+# @version 0.6
+
+import numpy as np
+
+from quantdigger.technicals.base import TechnicalBase
+
+
+class Universe(object):
+    """ 全部周期合约在当前时间步的截面数据，供
+    :class:`quantdigger.engine.strategy.UniverseStrategy` 使用。
+
+    各字段都是按 :attr:`pcontracts` 顺序排列的数组，值为各合约最近一根
+    Bar的数据，还没有Bar的合约为nan。各合约的数据数组在第一次读取时拼接
+    成一个数组，之后每步只做一次按下标取值，只支持预加载模式。
+
+    :ivar pcontracts: 周期合约列表。
+    :ivar contracts: 合约列表。
+    :ivar mask: 当前时间步有新Bar的合约 (bool数组)。
+    """
+    def __init__(self, market_data, data_ref):
+        """
+        Args:
+            market_data (MarketData): 所有策略共享的行情数据
+
+            data_ref (DataRef): 策略的数据引用，用于读取指标
+        """
+        self.pcontracts = list(market_data.originals.keys())
+        self._originals = list(market_data.originals.values())
+        self.contracts = [original.contract for original in self._originals]
+        self._index = dict((s, i) for i, s in enumerate(self.pcontracts))
+        self._data_ref = data_ref
+        n = len(self.pcontracts)
+        self.mask = np.zeros(n, dtype=bool)
+        self._cursors = np.full(n, -1, dtype=np.int64)
+        sizes = [len(original.close.data) for original in self._originals]
+        self._offsets = np.concatenate(
+            [[0], np.cumsum(sizes)[:-1]]).astype(np.int64)
+        self._columns = {}  # 字段 -> 拼接后的数组
+
+    def update(self, advancing):
+        """ 进入新的时间步。
+
+        Args:
+            advancing (list): 当前时间步有新Bar的周期合约
+        """
+        self.mask[:] = False
+        for s_pcontract in advancing:
+            i = self._index[s_pcontract]
+            self.mask[i] = True
+            self._cursors[i] = self._originals[i]._curbar
+
+    def sync(self):
+        """ 按各合约的当前Bar重新定位，用于从断点恢复。 """
+        self.mask[:] = False
+        for i, original in enumerate(self._originals):
+            self._cursors[i] = original._curbar
+
+    def __len__(self):
+        return len(self.pcontracts)
+
+    @property
+    def valid(self):
+        """ 已有Bar的合约 (bool数组)。 """
+        return self._cursors >= 0
+
+    @property
+    def datetime(self):
+        return self._gather('datetime', lambda s, original: np.asarray(
+            original.datetime.data, dtype='datetime64[ns]'),
+            np.datetime64('NaT'))
+
+    @property
+    def open(self):
+        return self._system_var('open')
+
+    @property
+    def close(self):
+        return self._system_var('close')
+
+    @property
+    def high(self):
+        return self._system_var('high')
+
+    @property
+    def low(self):
+        return self._system_var('low')
+
+    @property
+    def volume(self):
+        return self._system_var('volume')
+
+    def indicator(self, name, key=None):
+        """ 各合约在on_init中定义的指标的当前值。
+
+        Args:
+            name (str): 指标的变量名，如on_init中的 ctx.ma 为 'ma'
+
+            key (str): 多值指标的字段名，如BOLL的 'upper'
+
+        Returns:
+            np.ndarray.
+        """
+        def values(s_pcontract, original):
+            derived = self._data_ref.get_data(s_pcontract).derived
+            technical = derived._all_vars[name]
+            if not isinstance(technical, TechnicalBase):
+                raise TypeError('[%s] 不是指标，截面数据只支持指标' % name)
+            return technical.values[key] if key else technical.values
+        return self._gather((name, key), values)
+
+    def _system_var(self, name):
+        return self._gather(
+            name, lambda s, original: getattr(original, name).data)
+
+    def _gather(self, field, get_data, missing=np.nan):
+        column = self._columns.get(field)
+        if column is None:
+            arrays = [get_data(s, original) for s, original
+                      in zip(self.pcontracts, self._originals)]
+            if missing is np.nan:
+                arrays = [np.asarray(a, dtype=np.float64) for a in arrays]
+            column = self._columns[field] = np.concatenate(arrays)
+        valid = self._cursors >= 0
+        values = column[self._offsets + np.where(valid, self._cursors, 0)]
+        return np.where(valid, values, missing)
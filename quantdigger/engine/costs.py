@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+##
+# @file costs.py
+# @brief 成交成本模型：佣金和滑点。
+# @version 0.6
+#
+# 模型的参数可以是标量也可以是等长数组，事件回测中逐笔成交调用，
+# 向量化回测和事后重算成本时按合约对整个成交数组调用。
+
+import numpy as np
+import pandas as pd
+import six
+
+from quantdigger.datastruct import Contract, Direction, TradeSide, Transaction
+
+
+class CommissionModel(object):
+    """ 佣金模型基类。 """
+
+    def compute(self, contract, prices, quantities, multiple):
+        """ 计算佣金。
+
+        Args:
+            contract (Contract): 合约
+
+            prices (float/np.ndarray): 成交价格
+
+            quantities (float/np.ndarray): 成交数量，0表示没有成交
+
+            multiple (float): 合约乘数
+
+        Returns:
+            float/np.ndarray. 和quantities形状相同
+        """
+        raise NotImplementedError
+
+
+class ProportionalCommission(CommissionModel):
+    """ 按成交额的比例收取佣金，默认费率见 settings 的 'stock_commission'
+    和 'future_commission' ，和不设置佣金模型时一致。 """
+
+    def __init__(self, ratio=None):
+        self.ratio = ratio
+
+    def compute(self, contract, prices, quantities, multiple):
+        ratio = Transaction.commission_ratio(contract) \
+            if self.ratio is None else self.ratio
+        return np.abs(quantities) * prices * multiple * ratio
+
+
+class FixedCommission(CommissionModel):
+    """ 每笔成交收取固定佣金。 """
+
+    def __init__(self, cost):
+        self.cost = cost
+
+    def compute(self, contract, prices, quantities, multiple):
+        return np.where(np.asarray(quantities) != 0, self.cost, 0.0)
+
+
+class SlippageModel(object):
+    """ 滑点模型基类，成交价格向不利方向偏移：买入加价，卖出减价。 """
+
+    def compute(self, contract, prices, quantities, volumes):
+        """ 计算每单位的价格偏移。
+
+        Args:
+            contract (Contract): 合约
+
+            prices (float/np.ndarray): 撮合价格
+
+            quantities (float/np.ndarray): 成交数量
+
+            volumes (float/np.ndarray): 成交所在Bar的成交量，未知时为nan
+
+        Returns:
+            float/np.ndarray. 非负的价格偏移
+        """
+        raise NotImplementedError
+
+
+class TickSlippage(SlippageModel):
+    """ 固定跳数的滑点。 """
+
+    def __init__(self, ticks, tick_size):
+        """
+        Args:
+            ticks (float): 跳数
+
+            tick_size (float): 最小变动价位
+        """
+        self.offset = ticks * tick_size
+
+    def compute(self, contract, prices, quantities, volumes):
+        return np.zeros_like(np.asarray(prices, dtype=np.float64)) + \
+            self.offset
+
+
+class VolumeImpact(SlippageModel):
+    """ 成交量相关的冲击成本，价格偏移为
+    ``price * coefficient * (quantity / volume) ** exponent`` ，
+    成交量未知或为0时没有冲击成本。 """
+
+    def __init__(self, coefficient=0.1, exponent=0.5):
+        self.coefficient = coefficient
+        self.exponent = exponent
+
+    def compute(self, contract, prices, quantities, volumes):
+        volumes = np.asarray(volumes, dtype=np.float64)
+        valid = volumes > 0
+        share = np.abs(quantities) / np.where(valid, volumes, 1.0)
+        return np.where(valid,
+                        prices * self.coefficient * share ** self.exponent,
+                        0.0)
+
+
+def _is_buy(transact):
+    return (transact.side == TradeSide.OPEN) == \
+        (transact.direction == Direction.LONG)
+
+
+def apply_costs(transact, commission=None, slippage=None, volume=np.nan):
+    """ 按成本模型设置单笔成交的价格和佣金。
+
+    Args:
+        transact (Transaction): 已设置撮合价格的成交
+
+        commission (CommissionModel): 佣金模型，None时按默认费率
+
+        slippage (SlippageModel): 滑点模型，None时没有滑点
+
+        volume (float): 成交所在Bar的成交量
+    """
+    if slippage is not None:
+        offset = float(slippage.compute(transact.contract, transact.price,
+                                        transact.quantity, volume))
+        transact.slippage = offset
+        transact.price += offset if _is_buy(transact) else -offset
+    if commission is None:
+        transact.compute_commission()
+    else:
+        transact.commission = float(commission.compute(
+            transact.contract, transact.price, transact.quantity,
+            transact.volume_multiple))
+
+
+def fill_costs(transactions):
+    """ 成交明细的成本。
+
+    Returns:
+        pd.DataFrame. 以成交时间为索引，包含 'contract', 'price'(撮合价格),
+        'quantity', 'sign'(买入为1，卖出为-1), 'multiple', 'commission',
+        'slippage'(每单位的价格偏移), 'cost'(佣金和滑点成本之和) 列。
+    """
+    rows = [(t.datetime, t.contract, t.price, t.quantity,
+             1.0 if _is_buy(t) else -1.0, t.volume_multiple, t.commission,
+             t.slippage) for t in transactions]
+    frame = pd.DataFrame(rows, columns=[
+        'datetime', 'contract', 'price', 'quantity', 'sign', 'multiple',
+        'commission', 'slippage'])
+    frame['price'] -= frame['sign'] * frame['slippage']
+    frame['cost'] = frame['commission'] + \
+        frame['slippage'] * frame['quantity'] * frame['multiple']
+    return frame.set_index('datetime')
+
+
+def recost(transactions, commission=None, slippage=None, volumes=None):
+    """ 用新的成本模型重新计算已完成回测的成交成本，不需要重新回测。
+
+    Args:
+        transactions (list/pd.DataFrame): 成交明细或 :func:`fill_costs`
+            的结果
+
+        commission (CommissionModel): 佣金模型，None时按默认费率
+
+        slippage (SlippageModel): 滑点模型，None时没有滑点
+
+        volumes (dict): 各合约的成交量 {strcontract: pd.Series}，
+            以时间为索引，用于成交量相关的滑点
+
+    Returns:
+        pd.DataFrame. 格式同 :func:`fill_costs`
+    """
+    frame = transactions if isinstance(transactions, pd.DataFrame) else \
+        fill_costs(transactions)
+    frame = frame.copy()
+    commission = commission or ProportionalCommission()
+    volumes = dict((Contract(k), v) for k, v in six.iteritems(volumes or {}))
+    for contract, index in six.iteritems(frame.groupby('contract').indices):
+        prices = frame['price'].values[index]
+        quantities = frame['quantity'].values[index]
+        sign = frame['sign'].values[index]
+        multiple = frame['multiple'].values[index]
+        if slippage is None:
+            offsets = np.zeros(len(index))
+        else:
+            volume = volumes.get(contract)
+            bar_volumes = np.full(len(index), np.nan) if volume is None \
+                else volume.reindex(frame.index[index], method='ffill').values
+            offsets = slippage.compute(contract, prices, quantities,
+                                       bar_volumes)
+        fill_prices = prices + sign * offsets
+        frame.iloc[index, frame.columns.get_loc('slippage')] = offsets
+        frame.iloc[index, frame.columns.get_loc('commission')] = \
+            commission.compute(contract, fill_prices, quantities, multiple)
+    frame['cost'] = frame['commission'] + \
+        frame['slippage'] * frame['quantity'] * frame['multiple']
+    return frame
+
+
+def adjust_equity(equity, before, after):
+    """ 按两组成交成本的差调整资金曲线。
+
+    Args:
+        equity (pd.Series): 以时间为索引的权益
+
+        before (pd.DataFrame): 回测时的成交成本，见 :func:`fill_costs`
+
+        after (pd.DataFrame): 新的成交成本，见 :func:`recost`
+
+    Returns:
+        pd.Series.
+    """
+    delta = pd.Series(after['cost'].values - before['cost'].values,
+                      index=after.index).groupby(level=0).sum()
+    # tick回放的成交时间在Bar内，计入之后的第一个时间点。
+    delta = delta.cumsum().reindex(equity.index, method='ffill')
+    return equity - delta.fillna(0.0)
+
+
+__all__ = ['CommissionModel', 'ProportionalCommission', 'FixedCommission',
+           'SlippageModel', 'TickSlippage', 'VolumeImpact', 'apply_costs',
+           'fill_costs', 'recost', 'adjust_equity']
@@ -1,114 +1,279 @@
 # -*- coding: utf-8 -*-
+import bisect
+import numpy as np
+import pandas as pd
+import six
+
 from quantdigger.datastruct import Transaction, PriceType, TradeSide, Direction
+from quantdigger.engine.costs import apply_costs
+from quantdigger.engine.ticks import first_crossings
 from quantdigger.event import FillEvent
 from quantdigger.util import log
 
 
+class OrderBook(object):
+    """ 单个合约上的未成交订单。
+
+    限价单按成交方向分两边，各自按价格排序，成交判断是一次二分查找：
+
+    * 买边(开多, 平空)，价格不低于阈值时成交，按价格升序排列。
+    * 卖边(开空, 平多)，价格不高于阈值时成交，按价格降序排列。
+
+    :ivar scanned: 上次撮合时的 (Bar位置, 是否开盘撮合)。
+    :ivar dirty: 上次撮合后是否有新订单。
+    """
+    def __init__(self):
+        self.buys = []  # [(price, id, order)]
+        self.sells = []  # [(-price, id, order)]
+        self.markets = []  # 市价单
+        self.scanned = None
+        self.dirty = False
+        self._entries = {}  # order -> 所在的列表和排序键
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, order):
+        if order.price_type == PriceType.MKT:
+            side, key = self.markets, None
+            side.append(order)
+        else:
+            if _is_buy(order):
+                side, key = self.buys, (order.price, order.id, order)
+            else:
+                side, key = self.sells, (-order.price, order.id, order)
+            bisect.insort(side, key)
+        self._entries[order] = (side, key)
+        self.dirty = True
+
+    def remove(self, order):
+        side, key = self._entries.pop(order)
+        if key is None:
+            side.remove(order)
+        else:
+            del side[bisect.bisect_left(side, key)]
+
+    def pop_crossed(self, buy_threshold, sell_threshold):
+        """ 取出所有能成交的限价单。
+
+        Args:
+            buy_threshold (float): 买边价格不低于它时成交
+
+            sell_threshold (float): 卖边价格不高于它时成交
+        """
+        i = bisect.bisect_left(self.buys, (buy_threshold,))
+        j = bisect.bisect_left(self.sells, (-sell_threshold,))
+        crossed = [entry[2] for entry in self.buys[i:]] + \
+            [entry[2] for entry in self.sells[j:]]
+        del self.buys[i:]
+        del self.sells[j:]
+        for order in crossed:
+            del self._entries[order]
+        return crossed
+
+    def pop_markets(self):
+        markets = self.markets
+        self.markets = []
+        for order in markets:
+            del self._entries[order]
+        return markets
+
+    def pop_all(self):
+        orders = list(self._entries)
+        self.__init__()
+        return orders
+
+
+def _is_buy(order):
+    """ 开多和平空是买入方向。 """
+    return (order.side == TradeSide.OPEN) == (order.direction == Direction.LONG)
+
+
 class Exchange(object):
     """ 模拟交易所。
 
+    未成交订单按合约分到 :class:`OrderBook` 中，每次撮合只检查Bar有变化
+    或有新订单的合约。
+
+    设置了 :attr:`ticks` 时按tick回放撮合：收盘时只接收订单和撤单，
+    订单在之后每根新Bar的开盘时按该Bar内的tick路径撮合。
+
         :ivar events: 事件池。
         :ivar name: 策略名，用于代码跟踪。
+        :ivar ticks: tick回放数据(TickReplay)，为None时按Bar撮合。
     """
-    def __init__(self, name, events_pool, slippage=None, strict=True):
+    def __init__(self, name, events_pool, slippage=None, strict=True,
+                 commission=None):
+        """
+        Args:
+            slippage (SlippageModel): 滑点模型，None时没有滑点
+
+            commission (CommissionModel): 佣金模型，None时按默认费率
+        """
         self.events = events_pool
         self.name = name
         self._slippage = slippage
-        self._open_orders = set()
+        self._commission = commission
+        self._books = {}  # Contract -> OrderBook
+        self._cancels = []  # 撤单
         # strict 为False表示只关注信号源的可视化，而非实际成交情况。
         self._strict = strict
         self._datetime = None
+        self.ticks = None
 
     def make_market(self, bars, at_baropen):
-        """ 价格撮合"""
-        if len(self._open_orders) == 0:
-            return
-        fill_orders = set()
-        for order in self._open_orders:
-            if order.side == TradeSide.CANCEL:
-                fill_orders.add(order)
-                transact = Transaction(order)
-                self.events.put(FillEvent(transact))
+        """ 价格撮合
+
+        Args:
+            bars (BarStore): 各合约的最新Bar
+
+            at_baropen (bool): 是否在Bar的开盘时间撮合
+        """
+        for transact in self.match_orders(bars, at_baropen):
+            self.events.put(FillEvent(transact))
+
+    def match_orders(self, bars, at_baropen):
+        """ 价格撮合，直接返回成交和撤单回报，不产生事件。
+
+        Args:
+            bars (BarStore): 各合约的最新Bar
+
+            at_baropen (bool): 是否在Bar的开盘时间撮合
+
+        Returns:
+            list. [Transaction, ..]，按订单编号排序
+        """
+        fills = []
+        for order in self._cancels:
+            fills.append(Transaction(order))
+        self._cancels = []
+        for contract, book in six.iteritems(self._books):
+            if not len(book):
                 continue
             try:
-                bar = bars[order.contract]
+                location = bars.locate(contract)
             except KeyError:
-                log.error('所交易的合约[%s]数据不存在' % order.contract)
+                log.error('所交易的合约[%s]数据不存在' % contract)
+                continue
+            if self.ticks is not None and self._strict:
+                # 每根Bar的tick只回放一次，之后的订单等下一根Bar。
+                if at_baropen and book.scanned != location:
+                    book.scanned = location
+                    book.dirty = False
+                    self._match_ticks(contract, book, bars, fills)
+                elif not at_baropen and book.dirty:
+                    # 收盘时的新订单从合约的下一根Bar开始回放，合约在下个
+                    # 时间步没有新Bar时不能回放已经结束的当根Bar。
+                    book.scanned = location
+                    book.dirty = False
+                continue
+            if not book.dirty and book.scanned is not None and \
+                    book.scanned[0] == location and \
+                    (not book.scanned[1] or book.scanned[1] == at_baropen):
+                # 同一根Bar已按最高最低价撮合过，不会有新的成交。
                 continue
+            book.scanned = (location, at_baropen)
+            book.dirty = False
+            self._match(contract, book, bars, at_baropen, fills)
+        fills.sort(key=lambda transact: transact.order.id)
+        return fills
+
+    def _match(self, contract, book, bars, at_baropen, fills):
+        dt = bars.datetime(contract)
+        if not self._strict:
+            for order in book.pop_all():
+                transact = Transaction(order)
+                transact.datetime = dt
+                fills.append(transact)
+            return
+        if at_baropen:
+            open_price = bars.open(contract)
+            buy_threshold = sell_threshold = open_price
+        else:
+            # 限价单以最高和最低价格为成交的判断条件．
+            high, low = bars.high(contract), bars.low(contract)
+            buy_threshold, sell_threshold = low, high
+        volume = bars.volume(contract) if self._slippage else None
+        for order in book.pop_crossed(buy_threshold, sell_threshold):
             transact = Transaction(order)
-            if self._strict:
-                if at_baropen:
-                    if order.price_type == PriceType.LMT:
-                        price = bar.open
-                        if (order.side == TradeSide.OPEN and \
-                                 (order.direction == Direction.LONG and order.price >= price or \
-                                 order.direction == Direction.SHORT and order.price <= price)) or \
-                           (order.side == TradeSide.CLOSE and \
-                                 (order.direction == Direction.LONG and order.price <= price or \
-                                 order.direction == Direction.SHORT and order.price >= price)):
-                                transact.price = order.price
-                                transact.datetime = bar.datetime
-                                fill_orders.add(order)
-                                self.events.put(FillEvent(transact))
-                    elif order.price_type == PriceType.MKT:
-                        transact.price = bar.open
-                        transact.datetime = bar.datetime
-                        # recompute commission when price changed
-                        transact.compute_commission()
-                        fill_orders.add(order)
-                        self.events.put(FillEvent(transact))
-                else:
-                    if order.price_type == PriceType.LMT:
-                        # 限价单以最高和最低价格为成交的判断条件．
-                        if (order.side == TradeSide.OPEN and \
-                                 (order.direction == Direction.LONG and order.price >= bar.low or \
-                                 order.direction == Direction.SHORT and order.price <= bar.high)) or \
-                           (order.side == TradeSide.CLOSE and \
-                                 (order.direction == Direction.LONG and order.price <= bar.high or \
-                                 order.direction == Direction.SHORT and order.price >= bar.low)):
-                                transact.price = order.price
-                                # Bar的结束时间做为交易成交时间.
-                                transact.datetime = bar.datetime
-                                fill_orders.add(order)
-                                self.events.put(FillEvent(transact))
-                    elif order.price_type == PriceType.MKT:
-                        # 市价单以最高或最低价格为成交价格．
-                        if order.side == TradeSide.OPEN:
-                            if order.direction == Direction.LONG:
-                                transact.price = bar.high
-                            else:
-                                transact.price = bar.low
-                        elif order.side == TradeSide.CLOSE:
-                            if order.direction == Direction.LONG:
-                                transact.price = bar.low
-                            else:
-                                transact.price = bar.high
-                        transact.datetime = bar.datetime
-                        # recompute commission when price changed
-                        transact.compute_commission()
-                        fill_orders.add(order)
-                        self.events.put(FillEvent(transact))
+            transact.price = order.price
+            # Bar的结束时间做为交易成交时间.
+            transact.datetime = dt
+            self._apply_costs(transact, volume)
+            fills.append(transact)
+        for order in book.pop_markets():
+            transact = Transaction(order)
+            if at_baropen:
+                transact.price = open_price
+            elif _is_buy(order):
+                # 市价单以最高或最低价格为成交价格．
+                transact.price = high
             else:
-                transact.datetime = bar.datetime
-                fill_orders.add(order)
-                #
-                self.events.put(FillEvent(transact))
-            # end of for
-        if fill_orders:
-            self._open_orders -= fill_orders
+                transact.price = low
+            transact.datetime = dt
+            self._apply_costs(transact, volume)
+            fills.append(transact)
+
+    def _match_ticks(self, contract, book, bars, fills):
+        prices, times = self.ticks.path(bars, contract)
+        if not len(prices):
+            return
+        # 路径的最低和最高价确定能成交的订单，再逐个找第一次成交的tick。
+        crossed = book.pop_crossed(prices.min(), prices.max())
+        if crossed:
+            limits = np.array([order.price for order in crossed])
+            is_buy = np.array([_is_buy(order) for order in crossed])
+            positions = first_crossings(prices, limits, is_buy)
+        else:
+            positions = []
+        dt = bars.datetime(contract)
+        volume = bars.volume(contract) if self._slippage else None
+        for order, i in zip(crossed, positions):
+            transact = Transaction(order)
+            transact.price = order.price
+            transact.datetime = dt if times is None else \
+                pd.Timestamp(times[i])
+            self._apply_costs(transact, volume)
+            fills.append(transact)
+        for order in book.pop_markets():
+            # 市价单以第一个tick的价格成交．
+            transact = Transaction(order)
+            transact.price = float(prices[0])
+            transact.datetime = dt if times is None else \
+                pd.Timestamp(times[0])
+            self._apply_costs(transact, volume)
+            fills.append(transact)
+
+    def _apply_costs(self, transact, volume):
+        if self._slippage is None and self._commission is None:
+            # recompute commission when price changed
+            if transact.price_type == PriceType.MKT:
+                transact.compute_commission()
+            return
+        apply_costs(transact, self._commission, self._slippage, volume)
 
     def insert_order(self, event):
         """
         模拟交易所收到订单。
         """
-        ## @TODO
-        if event.order in self._open_orders:
-            # 撤单处理, set不会自动覆盖。
-            self._open_orders.remove(event.order)
-        self._open_orders.add(event.order)
+        self.add_order(event.order)
+
+    def add_order(self, order):
+        """ 模拟交易所收到订单，撤单时从订单簿中移除原订单。 """
+        book = self._books.get(order.contract)
+        if book is None:
+            book = self._books[order.contract] = OrderBook()
+        if order in book._entries:
+            # 撤单处理
+            book.remove(order)
+        if order.side == TradeSide.CANCEL:
+            self._cancels.append(order)
+        else:
+            book.add(order)
 
     def update_datetime(self, dt):
         if self._datetime:
             if self._datetime.date() != dt.date():
-                self._open_orders.clear()
+                self._books.clear()
+                self._cancels = []
         self._datetime = dt
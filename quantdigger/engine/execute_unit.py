@@ -5,9 +5,17 @@ from collections import OrderedDict
 from datetime import datetime
 from quantdigger.config import settings
 from quantdigger.datasource.data import DataManager
-from quantdigger.engine.context import Context
+from quantdigger.datasource.source import iter_chunks
+from quantdigger.engine import checkpoint
+from quantdigger.engine.context import Context, MarketData, Universe
+from quantdigger.engine.context.data_context import DataRef
 from quantdigger.engine.profile import Profile
-from quantdigger.util import log, MAX_DATETIME
+from quantdigger.engine.ticks import TickReplay
+from quantdigger.engine.timeline import StreamTimeline, Timeline
+from quantdigger.engine.timer import PhaseTimer
+from quantdigger.engine.vectorized import VectorBlotter
+from quantdigger.errors import DataAlignError
+from quantdigger.util import log
 from quantdigger.util import deprecated
 from quantdigger.datastruct import PContract
 
@@ -20,7 +28,12 @@ class ExecuteUnit(object):
                  dt_start="1980-1-1",
                  dt_end="2100-1-1",
                  n=None,
-                 spec_date={}):  # 'symbol':[,]
+                 spec_date={},  # 'symbol':[,]
+                 data=None,
+                 chunksize=None,
+                 window=None,
+                 direct=False,
+                 ticks=None):
         """
         Args:
             pcontracts (list): list of pcontracts(string)
@@ -32,20 +45,63 @@ class ExecuteUnit(object):
             n (int): last n bars
 
             spec_date (dict): time range for specific pcontracts
+
+            data (dict): preloaded data {strpcon: DataFrame}, skip loading
+                from datasource if not None.
+
+            chunksize (int): 流式模式，每次从数据源读取chunksize根Bar，
+                不预先加载全部数据。
+
+            window (int): 流式模式下序列变量可回溯的Bar数，默认等于
+                chunksize。流式模式不支持技术指标，在on_init中定义指标
+                会抛出 StreamTechnicalError。
+
+            direct (bool): 订单管理器和模拟交易所直接相互调用，不经过
+                事件池，回测更快，实盘交易需用默认的事件方式。
+
+            ticks (dict): tick回放撮合使用的tick数据 {strcontract:
+                Series/DataFrame}，没有tick数据的合约回放Bar展开的合成
+                路径。为None且 settings['tick_test'] 为False时按Bar撮合。
         """
         self.finished_data = []
         pcontracts = list(map(lambda x: x.upper(), pcontracts))
         self.pcontracts = pcontracts
         self._contexts = []
         self._data_manager = DataManager()
-        if settings['source'] == 'csv':
-            self.pcontracts = self._parse_pcontracts(self.pcontracts)
-        self._all_data, self._max_window = self._load_data(self.pcontracts,
-                                                           dt_start,
-                                                           dt_end,
-                                                           n,
-                                                           spec_date)
+        self._window = (window or chunksize) if chunksize else None
+        self._direct = direct
+        # 预加载时各合约的数据读取耗时(秒)。
+        self.load_timings = OrderedDict()
+        if ticks is not None or settings['tick_test']:
+            assert not (ticks and chunksize), "流式模式不支持tick数据回放"
+            self._ticks = TickReplay(ticks)
+        else:
+            self._ticks = None
+        if data is not None:
+            self._all_data = data
+            self._max_window = max(len(d) for d in six.itervalues(data))
+        else:
+            if settings['source'] in ('csv', 'mmap'):
+                self.pcontracts = self._parse_pcontracts(self.pcontracts)
+            if chunksize:
+                self._all_data = self._load_chunks(
+                    self.pcontracts, dt_start, dt_end, n, spec_date,
+                    chunksize)
+                self._max_window = self._window
+            else:
+                self._all_data, self._max_window = self._load_data(
+                    self.pcontracts, dt_start, dt_end, n, spec_date)
         self._all_pcontracts = list(self._all_data.keys())
+        # 所有策略共享的行情数据。
+        self._market_data = MarketData(self._all_data, self._window)
+        # 全局时间轴，主循环每步只处理有新Bar的合约。
+        if self._window:
+            self._timeline = StreamTimeline(self._market_data.originals)
+        else:
+            self._timeline = Timeline(self._all_data)
+        # 各阶段耗时统计，默认关闭。
+        self._timer = PhaseTimer() if settings['phase_timing'] else None
+        self._resumed = False
 
     def _parse_pcontracts(self, pcontracts):
         # @TODO test
@@ -90,13 +146,60 @@ class ExecuteUnit(object):
         return rst
 
     def add_strategies(self, settings):
+        """ 添加策略。
+
+        Args:
+            settings (list): [{'strategy': Strategy, 'capital': float,
+                'commission': CommissionModel, 'slippage': SlippageModel},
+                ..]，成本模型可选，见 :mod:`quantdigger.engine.costs`
+
+        Returns:
+            generator. 各策略的Profile
+        """
         for setting in settings:
             strategy = setting['strategy']
-            ctx = Context(self._all_data, strategy.name,
-                          setting,  strategy, self._max_window)
+            max_window = self._window or len(self._timeline)
+            ctx = Context(self._market_data, strategy.name,
+                          setting, strategy, max_window, self._window,
+                          self._direct)
+            ctx.exchange.ticks = self._ticks
             ctx.data_ref.default_pcontract = self.pcontracts[0]
+            if hasattr(strategy, 'on_universe'):
+                assert self._window is None, "流式模式不支持截面策略"
+                ctx.universe = Universe(self._market_data, ctx.data_ref)
+            if self._timer:
+                ctx.timer = PhaseTimer()
             self._contexts.append(ctx)
-            yield(Profile(ctx.marks, ctx.blotter, ctx.data_ref))
+            yield(Profile(ctx.marks, ctx.blotter, ctx.data_ref,
+                          [ctx.timer, self._timer]))
+
+    def run_vectorized(self, settings):
+        """ 向量化运行策略，不经过逐根Bar的事件循环。
+
+        Args:
+            settings (list): [{'strategy': VectorStrategy, 'capital': float,
+                'fill': 'close'/'open', 'commission': CommissionModel,
+                'slippage': SlippageModel}, ..]，成本模型可选
+
+        Returns:
+            list. [Profile, ..]
+        """
+        assert self._window is None, "流式模式不支持向量化运行"
+        log.info("runing vectorized strategies...")
+        profiles = []
+        for setting in settings:
+            strategy = setting['strategy']
+            targets = strategy.target_positions(self._all_data)
+            blotter = VectorBlotter(strategy.name, self._timeline,
+                                    self._all_data, targets,
+                                    setting['capital'],
+                                    setting.get('fill', 'close'),
+                                    setting.get('commission'),
+                                    setting.get('slippage'))
+            data_ref = DataRef(self._market_data)
+            data_ref.default_pcontract = self.pcontracts[0]
+            profiles.append(Profile([{}, {}], blotter, data_ref))
+        return profiles
 
     def _init_strategies(self):
         for s_pcontract in self._all_pcontracts:
@@ -104,67 +207,151 @@ class ExecuteUnit(object):
                 context.data_ref.switch_to_pcontract(s_pcontract)
                 context.strategy.on_init(context)
 
-    def run(self):
-        log.info("runing strategies...")
-        # 初始化策略自定义时间序列变量
+    def save_checkpoint(self, path, dt):
+        """ 保存回测断点。
+
+        Args:
+            path (str): 断点文件路径
+
+            dt (datetime): 最后处理完的时间步
+        """
+        cursors = {}
+        for s_pcontract, original in six.iteritems(
+                self._market_data.originals):
+            if original._curbar >= 0:
+                cursors[s_pcontract] = (original._curbar, original.datetime[0])
+        checkpoint.save(path, {
+            'datetime': dt,
+            'cursors': cursors,
+            'contexts': [checkpoint.context_state(ctx)
+                         for ctx in self._contexts],
+        })
+
+    def resume(self, path):
+        """ 从断点恢复，须在add_strategies之后，run之前调用。
+
+        恢复时的数据可以在断点之后追加了新的Bar，run只处理断点之后的
+        时间步。
+        """
+        state = checkpoint.load(path)
+        assert len(state['contexts']) == len(self._contexts)
         self._init_strategies()
+        for s_pcontract, (curbar, dt) in six.iteritems(state['cursors']):
+            self._market_data.seek(s_pcontract, curbar)
+            if self._market_data.originals[s_pcontract].datetime[0] != dt:
+                log.error('合约[%s] 数据和断点不一致' % s_pcontract)
+                raise DataAlignError()
+        for ctx, ctx_state in zip(self._contexts, state['contexts']):
+            checkpoint.restore_context(ctx, ctx_state)
+            if ctx.universe is not None:
+                ctx.universe.sync()
+        self._timeline.seek(state['datetime'])
+        self._resumed = True
 
-        has_next = True
-        while True:
-            # Feeding data of latest.
-            toremove = set()
-            for s_pcontract in self._all_pcontracts:
-                for ctx in self._contexts:
-                    ctx.data_ref.switch_to_pcontract(s_pcontract)
-                    has_next = ctx.data_ref.rolling_forward(
-                        ctx.update_datetime)
-                    if not has_next:
-                        toremove.add(s_pcontract)
-            if toremove:
-                for s_pcontract in toremove:
-                    self._all_pcontracts.remove(s_pcontract)
-                if len(self._all_pcontracts) == 0:
-                    # 策略退出后的处理
-                    for ctx in self._contexts:
-                        ctx.data_ref.switch_to_default_pcontract()
-                        # 异步情况下不同策略的结束时间不一样。
-                        ctx.strategy.on_exit(ctx)
-                    return
+    def run(self, checkpoint_path=None, checkpoint_interval=None):
+        """ 运行策略。
 
+        Args:
+            checkpoint_path (str): 断点文件路径，设置后在回测结束时保存
+                断点，见 :meth:`resume` 。
+
+            checkpoint_interval (int): 每隔多少个时间步保存一次断点，
+                须同时设置 checkpoint_path 。
+        """
+        if checkpoint_interval is not None:
+            if checkpoint_path is None:
+                raise ValueError('设置了checkpoint_interval，但没有设置'
+                                 'checkpoint_path')
+            if checkpoint_interval <= 0:
+                raise ValueError('checkpoint_interval须大于0: %s' %
+                                 checkpoint_interval)
+        log.info("runing strategies...")
+        if not self._resumed:
+            # 初始化策略自定义时间序列变量
+            self._init_strategies()
+
+        timer = self._timer
+        market_data = self._market_data
+        # 截面策略不逐合约运行。
+        symbol_contexts = [ctx for ctx in self._contexts
+                           if ctx.universe is None]
+        step = 0
+        dt = None
+        for dt, advancing in self._timeline:
+            # Feeding data of latest.
+            for ctx in self._contexts:
+                ctx.update_datetime(dt)
             # Updating global context variables like
             # close price and context time.
-            for s_pcontract in self._all_pcontracts:
-                for ctx in self._contexts:
-                    ctx.data_ref.switch_to_pcontract(s_pcontract)
-                    if ctx.data_ref.datetime_aligned(ctx.aligned_dt):
-                        ctx.data_ref.update_system_vars()
-                        ctx.data_ref.original.has_pending_data = False
+            if timer:
+                start = timer.now()
+            market_data.bars.new_step()
+            for s_pcontract in advancing:
+                market_data.rolling_forward(s_pcontract)
+            if timer:
+                timer.add('rolling_forward', start)
+                start = timer.now()
+            for s_pcontract in advancing:
+                market_data.update_system_vars(s_pcontract)
+            if timer:
+                timer.add('update_system_vars', start)
             # Calculating user context variables.
-            for s_pcontract in self._all_pcontracts:
+            for s_pcontract in advancing:
                 # Iterating over combinations.
-                for ctx in self._contexts:
+                for ctx in symbol_contexts:
                     ctx.data_ref.switch_to_pcontract(s_pcontract)
-                    if not ctx.data_ref.datetime_aligned(ctx.aligned_dt):
-                        continue
-                    ctx.data_ref.update_user_vars()
                     ctx.on_bar = False
-                    ctx.strategy.on_symbol(ctx)
+                    if ctx.timer:
+                        start = ctx.timer.now()
+                        ctx.data_ref.update_user_vars()
+                        ctx.timer.add('update_user_vars', start)
+                        start = ctx.timer.now()
+                        ctx.strategy.on_symbol(ctx)
+                        ctx.timer.add('on_symbol', start)
+                    else:
+                        ctx.data_ref.update_user_vars()
+                        ctx.strategy.on_symbol(ctx)
 
             # 遍历组合策略每轮数据的最后处理
-            tick_test = settings['tick_test']
             for ctx in self._contexts:
+                if ctx.universe is not None:
+                    ctx.universe.update(advancing)
                 # 确保单合约回测的默认值
                 ctx.data_ref.switch_to_default_pcontract()
                 ctx.on_bar = True
-                # 确保交易状态是基于开盘时间的。
-                ctx.process_trading_events(at_baropen=True)
-                ctx.strategy.on_bar(ctx)
-                if not tick_test:
-                    # 保证有可能在当根Bar成交
+                if ctx.timer:
+                    self._timed_on_bar(ctx)
+                else:
+                    # 确保交易状态是基于开盘时间的。
+                    ctx.process_trading_events(at_baropen=True)
+                    ctx.strategy.on_bar(ctx)
+                    # 保证有可能在当根Bar成交，tick回放时只提交订单。
                     ctx.process_trading_events(at_baropen=False)
-                ctx.aligned_dt = MAX_DATETIME
                 ctx.aligned_bar_index += 1
+            step += 1
+            if checkpoint_interval and step % checkpoint_interval == 0:
+                self.save_checkpoint(checkpoint_path, dt)
+
+        if checkpoint_path and dt is not None:
+            self.save_checkpoint(checkpoint_path, dt)
+        # 策略退出后的处理
+        for ctx in self._contexts:
+            ctx.data_ref.switch_to_default_pcontract()
+            # 异步情况下不同策略的结束时间不一样。
+            ctx.strategy.on_exit(ctx)
 
+    def _timed_on_bar(self, ctx):
+        """ 带计时的on_bar阶段，和run中的未计时版本保持一致。 """
+        timer = ctx.timer
+        start = timer.now()
+        ctx.process_trading_events(at_baropen=True)
+        timer.add('process_trading_events', start)
+        start = timer.now()
+        ctx.strategy.on_bar(ctx)
+        timer.add('on_bar', start)
+        start = timer.now()
+        ctx.process_trading_events(at_baropen=False)
+        timer.add('process_trading_events', start)
 
     def _load_data(self, strpcons, dt_start, dt_end, n, spec_date):
         all_data = OrderedDict()
@@ -172,20 +359,24 @@ class ExecuteUnit(object):
         log.info("loading data...")
         pcontracts = [PContract.from_string(s) for s in strpcons]
         pcontracts = sorted(pcontracts, key=PContract.__str__, reverse=True)
-        for i, pcon in enumerate(pcontracts):
+        requests = []
+        for pcon in pcontracts:
             strpcon = str(pcon)
-            if strpcon in spec_date:
-                dt_start = spec_date[strpcon][0]
-                dt_end = spec_date[strpcon][1]
-            assert(dt_start < dt_end)
-            if n:
-                raw_data = self._data_manager.get_last_bars(strpcon, n)
-            else:
-                raw_data = self._data_manager.get_bars(strpcon, dt_start, dt_end)
+            start, end = spec_date.get(strpcon, (dt_start, dt_end))
+            assert(start < end)
+            requests.append((strpcon, start, end, n))
+        for strpcon, raw_data, seconds in self._data_manager.load_many(
+                requests, settings['load_workers'],
+                settings['load_executor']):
+            self.load_timings[strpcon] = seconds
             if len(raw_data) == 0:
                 continue
             all_data[strpcon] = raw_data
             max_window = max(max_window, len(raw_data))
+        if self.load_timings:
+            slowest = max(self.load_timings, key=self.load_timings.get)
+            log.info("loaded %d pcontracts, slowest [%s] %.3fs" % (
+                len(self.load_timings), slowest, self.load_timings[slowest]))
 
         if n:
             assert(max_window <= n)
@@ -193,3 +384,25 @@ class ExecuteUnit(object):
             assert(False)
             # @TODO raise
         return all_data, max_window
+
+    def _load_chunks(self, strpcons, dt_start, dt_end, n, spec_date,
+                     chunksize):
+        """ 流式模式下各合约的分块数据迭代器，数据在回测时才读取。 """
+        all_data = OrderedDict()
+        log.info("loading data...")
+        pcontracts = [PContract.from_string(s) for s in strpcons]
+        pcontracts = sorted(pcontracts, key=PContract.__str__, reverse=True)
+        for pcon in pcontracts:
+            strpcon = str(pcon)
+            if strpcon in spec_date:
+                dt_start = spec_date[strpcon][0]
+                dt_end = spec_date[strpcon][1]
+            assert(dt_start < dt_end)
+            if n:
+                all_data[strpcon] = iter_chunks(
+                    self._data_manager.get_last_bars(strpcon, n), chunksize)
+            else:
+                all_data[strpcon] = self._data_manager.iter_bars(
+                    strpcon, chunksize, dt_start, dt_end)
+        assert(all_data)
+        return all_data
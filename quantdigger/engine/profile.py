@@ -7,9 +7,9 @@
 # @date 2016-12-18
 
 from six.moves import range
-import copy
 import pandas as pd
 
+from quantdigger.engine.blotter import HoldingsHistory
 from quantdigger.datastruct import (
     OneDeal,
     PositionKey,
@@ -19,12 +19,13 @@ from quantdigger.datastruct import (
 
 class Profile(object):
     """ 组合结果 """
-    def __init__(self, marks, blotter, data_ref):
+    def __init__(self, marks, blotter, data_ref, timers=None):
         """
         """
         self._marks = marks
         self._blotter = blotter
         self._data_ref = data_ref
+        self._timers = timers or []
 
     def name(self):
         return self._blotter.name
@@ -50,28 +51,29 @@ class Profile(object):
         """ 策略账号资金的历史。
 
         Returns:
-            list. [{'cash', 'commission', 'equity', 'datetime'}, ..]
+            pd.DataFrame. 以时间为索引，和资金历史共享内存，数据列
+                { 'commission', 'equity', 'cash', 'position_profit' }
+        """
+        return self._blotter.all_holdings.to_frame()
+
+    def holdings_history(self):
+        """ 策略账号资金的历史，按下标访问和迭代时返回dict，兼容旧接口。
+
+        Returns:
+            HoldingsHistory. [{'cash', 'commission', 'equity',
+                               'position_profit', 'datetime'}, ..]
         """
         return self._blotter.all_holdings
 
     @staticmethod
     def all_holdings_sum(profiles):
-        """
+        """ 多个策略账号资金历史的加总。
+
         Returns:
-            list. [{'cash', 'commission', 'equity', 'datetime'}, ..]
+            pd.DataFrame. 同 :meth:`all_holdings`
         """
-        all_holdings = copy.deepcopy(profiles[0].all_holdings())
-        for i, hd in enumerate(all_holdings):
-            for profile in profiles[1:]:
-                try:
-                    rhd = profile.all_holdings()[i]
-                except IndexError:
-                    rhd = rhd[-2]  # 是否强平导致长度不一
-                hd['cash'] += rhd['cash']
-                hd['commission'] += rhd['commission']
-                hd['equity'] += rhd['equity']
-        return all_holdings
-
+        return HoldingsHistory.sum(
+            [p.holdings_history() for p in profiles]).to_frame()
 
     def holding(self):
         """ 当前账号情况
@@ -80,6 +82,22 @@ class Profile(object):
         """
         return self._blotter.holding
 
+    def phase_timings(self):
+        """ 回测各阶段的累计耗时和调用次数，需要设置
+        settings['phase_timing'] = True。
+
+        rolling_forward, update_system_vars 为所有策略共享的阶段；
+        SIGNAL, ORDER, FILL, ONCE 为各类交易事件的处理。
+
+        Returns:
+            dict. {阶段: {'count': 调用次数, 'time': 累计秒数}}
+        """
+        rst = {}
+        for timer in self._timers:
+            if timer:
+                rst.update(timer.report())
+        return rst
+
     def marks(self):
         return self._marks
 
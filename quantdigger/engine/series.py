@@ -5,28 +5,43 @@ import datetime
 
 
 class SeriesBase(object):
-    def __init__(self, data=[], name='series', indic=None, default=None):
+    def __init__(self, data=[], name='series', indic=None, default=None,
+                 window=None):
         """ 序列变量的基类。
         name用来跟踪
+
+        Args:
+            window (int): 回溯窗口大小。设置后序列变量使用固定长度的环形
+                缓冲区，只保留最近window个值，内存占用和数据长度无关。
         """
         self.curbar = 0
-        self._window_size = len(data)
         self._indic = indic
         self._default = default
-        self._realtime = False
+        self._realtime = window is not None
+        self._window = window
+        if self._realtime and len(data) == 0:
+            self._window_size = window
+        else:
+            self._window_size = len(data)
         self.name = name
         if len(data) == 0:
             self.data = np.array([self._default] * self._window_size)
         else:
             self.data = data
 
-    def reset_data(self, data, wsize):
+    def reset_data(self, data, wsize, window=None):
         """ 初始化值和窗口大小
 
         Args:
             data (list|ndarray|pd.Series): 数据，类型为支持索引的数据结构
             wwsize (int): 窗口大小
+            window (int): 未设置回溯窗口时使用的环形缓冲区大小
         """
+        if window is not None and not self._realtime:
+            self._realtime = True
+            self._window = window
+        if self._realtime:
+            wsize = min(self._window, wsize)
         self._window_size = wsize
         if len(data) == 0:
             self.data = np.array([self._default] * self._window_size)
@@ -38,12 +53,18 @@ class SeriesBase(object):
         """ 更新当前Bar索引 """
         self.curbar = curbar
 
+    def _offset(self, curbar):
+        """ 第curbar个值在data中的位置 """
+        if self._realtime:
+            return curbar % self._window_size
+        return curbar
+
     def update(self, v):
         """ 更新最后一个值 """
         if isinstance(v, SeriesBase):
-            self.data[self.curbar] = v[0]
+            self.data[self._offset(self.curbar)] = v[0]
         else:
-            self.data[self.curbar] = v
+            self.data[self._offset(self.curbar)] = v
 
     def __len__(self):
         return len(self.data)
@@ -57,7 +78,7 @@ class SeriesBase(object):
         except KeyError:
             return
         else:
-            self.data[self.curbar] = pre_elem
+            self.data[self._offset(self.curbar)] = pre_elem
 
     def __str__(self):
         return str(self[0])
@@ -78,8 +99,9 @@ class NumberSeries(SeriesBase):
     DEFAULT_VALUE = 0.0
     value_type = float
 
-    def __init__(self, data=[], name='NumberSeries', indic=None, default=0.0):
-        super(NumberSeries, self).__init__(data, name, indic, default)
+    def __init__(self, data=[], name='NumberSeries', indic=None, default=0.0,
+                 window=None):
+        super(NumberSeries, self).__init__(data, name, indic, default, window)
         return
 
     def __float__(self):
@@ -166,18 +188,13 @@ class NumberSeries(SeriesBase):
     def __getitem__(self, index):
         try:
             if self._realtime:
-                #if index<0:
-                    #return self._default
-                #if self._shift:
-                    ## 输入
-                    #return self.data[self._index-index]
-                ## 输出
-                #i = self.curbar - index
-                #if self._indic:
-                    ## 延迟计算
-                    #self._indic.compute_element(i%self._window_size, index)
-                #return self.data[i%self._window_size]
-                assert(False)
+                i = self.curbar - index
+                if i < 0 or index < 0:
+                    return self._default
+                if index >= self._window_size:
+                    # 已被环形缓冲区覆盖
+                    raise SeriesIndexError
+                return float(self.data[i % self._window_size])
             else:
                 i = self.curbar - index
                 if i < 0 or index < 0:
@@ -196,9 +213,10 @@ class DateTimeSeries(SeriesBase):
     DEFAULT_VALUE = datetime.datetime(1980, 1, 1)
     value_type = datetime.datetime
 
-    def __init__(self, data=[], name='DateTimeSeries'):
+    def __init__(self, data=[], name='DateTimeSeries', window=None):
         super(DateTimeSeries, self).__init__(data, name,
-                                             default=self.DEFAULT_VALUE)
+                                             default=self.DEFAULT_VALUE,
+                                             window=window)
         return
 
     def __getitem__(self, index):
@@ -206,13 +224,14 @@ class DateTimeSeries(SeriesBase):
             i = self.curbar - index
             if i < 0 or index < 0:
                 return self._default
-            #return datetime.fromtimestamp(self.data[i%self._window_size]/1000)
-            return self.data[i]
+            if self._realtime and index >= self._window_size:
+                raise SeriesIndexError
+            return self.data[self._offset(i)]
         except SeriesIndexError:
             raise SeriesIndexError
 
     def __str__(self):
-        return str(self.data[self.curbar])
+        return str(self.data[self._offset(self.curbar)])
 
     def __eq__(self, r):
         if isinstance(r, DateTimeSeries):
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 from quantdigger.engine.execute_unit import ExecuteUnit
+from quantdigger.engine.vectorized import VectorStrategy
 
 # 系统角色
 
@@ -20,6 +21,19 @@ def add_strategies(symbols, strategies):
     return profiles
 
 
+def add_vectorized_strategies(symbols, strategies):
+    """ 向量化运行的策略
+
+    Args:
+        strategies (list): [{'strategy': VectorStrategy, 'capital': float}]
+
+    Returns:
+        list. [Profile, ..]
+    """
+    simulator = ExecuteUnit(symbols, "1980-1-1", "2100-1-1", None, {})
+    return simulator.run_vectorized(strategies)
+
+
 class Strategy(object):
     """ 策略基类"""
     def __init__(self, name):
@@ -51,4 +65,28 @@ class Strategy(object):
         # 停在最后一根bar
         return
 
-__all__ = ['add_strategies', 'Strategy']
+
+class UniverseStrategy(Strategy):
+    """ 截面策略基类。
+
+    每个时间步只运行一次 :meth:`on_universe` ，用数组一次处理所有合约，
+    不再逐合约调用 ``on_symbol`` 。``on_init`` 仍逐合约运行，其中定义的
+    指标可以用 :meth:`Universe.indicator` 按合约读取当前值；用户序列
+    变量不逐Bar更新。只支持预加载模式。
+    """
+    def on_universe(self, ctx, universe):
+        """ 逐个时间步运行
+
+        Args:
+            ctx (Context): 上下文，可用 ctx.order_target 批量下单
+
+            universe (Universe): 所有合约的截面数据
+        """
+        return
+
+    def on_bar(self, ctx):
+        self.on_universe(ctx, ctx.universe)
+
+
+__all__ = ['add_strategies', 'add_vectorized_strategies', 'Strategy',
+           'UniverseStrategy', 'VectorStrategy']
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+##
+# @file sweep.py
+# @brief 多进程参数扫描
+# @version 0.6
+
+import copy
+import itertools
+import multiprocessing
+from collections import OrderedDict
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+import six
+
+from quantdigger.config import settings
+from quantdigger.digger.finance import sharpe_ratio
+from quantdigger.engine.execute_unit import ExecuteUnit
+from quantdigger.util import log
+
+_COLUMNS = ['open', 'close', 'high', 'low', 'volume']
+
+# 工作进程内的全局状态，由 _init_worker 初始化。
+_worker = {}
+
+
+def _publish(all_data):
+    """ 把数据写入共享内存。
+
+    每个周期合约一块共享内存: n个int64时间戳，紧接着(5, n)的float64价格矩阵。
+
+    Returns:
+        (list, list). 共享内存对象，[(strpcon, 共享内存名, n)]
+    """
+    blocks, descs = [], []
+    for strpcon, raw_data in six.iteritems(all_data):
+        n = len(raw_data)
+        shm = shared_memory.SharedMemory(create=True,
+                                         size=max(1, n * 8 * 6))
+        dts, values = _views(shm, n)
+        dts[:] = raw_data.index.values.astype('M8[ns]').view(np.int64)
+        for i, col in enumerate(_COLUMNS):
+            values[i, :] = raw_data[col].values
+        blocks.append(shm)
+        descs.append((strpcon, shm.name, n))
+    return blocks, descs
+
+
+def _views(shm, n):
+    dts = np.ndarray((n,), dtype=np.int64, buffer=shm.buf)
+    values = np.ndarray((len(_COLUMNS), n), dtype=np.float64,
+                        buffer=shm.buf, offset=n * 8)
+    return dts, values
+
+
+def _init_worker(descs, config):
+    """ 工作进程初始化，从共享内存重建数据(不复制价格数据)。 """
+    settings.update(config)
+    all_data = OrderedDict()
+    blocks = []
+    for strpcon, name, n in descs:
+        shm = shared_memory.SharedMemory(name=name)
+        dts, values = _views(shm, n)
+        all_data[strpcon] = pd.DataFrame(
+            values.T, columns=_COLUMNS,
+            index=pd.DatetimeIndex(dts.view('M8[ns]'), name='datetime'),
+            copy=False)
+        blocks.append(shm)
+    _worker['data'] = all_data
+    _worker['blocks'] = blocks
+
+
+def _run_combination(task):
+    """ 在工作进程中运行一组参数。 """
+    pcontracts, strategy_cls, name, params, capital, periods = task
+    strategy = strategy_cls(name, **params)
+    unit = ExecuteUnit(pcontracts, data=_worker['data'])
+    profile = list(unit.add_strategies([{
+        'strategy': strategy,
+        'capital': capital
+    }]))[0]
+    unit.run()
+    return _summary(profile, params, periods)
+
+
+def _summary(profile, params, periods):
+    """ 策略结果的简要统计。 """
+    equity = profile.all_holdings()['equity'].values
+    networth = equity / equity[0]
+    returns = np.zeros(len(networth))
+    returns[1:] = networth[1:] / networth[:-1] - 1
+    drawdown = np.maximum.accumulate(networth) - networth
+    return {
+        'name': profile.name(),
+        'params': params,
+        'equity': equity[-1],
+        'total_return': networth[-1] - 1.0,
+        'sharpe_ratio': sharpe_ratio(returns, periods),
+        'max_drawdown': drawdown.max(),
+        'num_transactions': len(profile.transactions()),
+    }
+
+
+class ParameterSweep(object):
+    """ 多进程参数扫描。
+
+    数据只通过 :class:`ExecuteUnit` 加载一次，并放在共享内存中供
+    工作进程读取，每组参数在进程池中独立运行一个策略。
+
+    策略类必须可以被pickle(定义在模块顶层)，以 ``strategy_cls(name,
+    **params)`` 的形式构造。
+
+    >>> sweep = ParameterSweep(['BB.SHFE-1.Day'], DemoStrategy,
+    ...                        {'fast': [5, 10], 'slow': [20, 30]})
+    >>> results = sweep.run()
+    """
+    def __init__(self, pcontracts, strategy_cls, param_grid,
+                 capital=1000000.0, dt_start="1980-1-1",
+                 dt_end="2100-1-1", n=None, spec_date={},
+                 processes=None, periods=252):
+        """
+        Args:
+            pcontracts (list): 周期合约列表，同 :class:`ExecuteUnit`
+
+            strategy_cls (class): 策略类
+
+            param_grid (dict): 参数名 -> 参数取值列表
+
+            capital (float): 每个策略的初始资金
+
+            processes (int): 进程数，默认为cpu核数
+
+            periods (int): 计算夏普比率的年化周期数
+        """
+        self._strategy_cls = strategy_cls
+        self._param_grid = OrderedDict(sorted(six.iteritems(param_grid)))
+        self._capital = capital
+        self._processes = processes
+        self._periods = periods
+        self._unit = ExecuteUnit(pcontracts, dt_start, dt_end, n, spec_date)
+
+    def combinations(self):
+        """ 所有参数组合。
+
+        Returns:
+            list. [{参数名: 参数值}, ..]
+        """
+        keys = list(self._param_grid.keys())
+        return [dict(zip(keys, values)) for values in
+                itertools.product(*self._param_grid.values())]
+
+    def _strategy_name(self, params):
+        return '%s(%s)' % (self._strategy_cls.__name__, ', '.join(
+            '%s=%s' % (k, params[k]) for k in sorted(params)))
+
+    def run(self):
+        """ 运行所有参数组合。
+
+        Returns:
+            list. 与 :meth:`combinations` 顺序一致的统计结果
+            [{'name', 'params', 'equity', 'total_return', 'sharpe_ratio',
+            'max_drawdown', 'num_transactions'}, ..]
+        """
+        tasks = [(self._unit.pcontracts, self._strategy_cls,
+                  self._strategy_name(params), params, self._capital,
+                  self._periods) for params in self.combinations()]
+        log.info("running %d parameter combinations..." % len(tasks))
+        blocks, descs = _publish(self._unit._all_data)
+        try:
+            pool = multiprocessing.Pool(self._processes,
+                                        initializer=_init_worker,
+                                        initargs=(descs,
+                                                  copy.deepcopy(settings)))
+            try:
+                return pool.map(_run_combination, tasks, chunksize=1)
+            finally:
+                pool.close()
+                pool.join()
+        finally:
+            for shm in blocks:
+                shm.close()
+                shm.unlink()
+
+
+__all__ = ['ParameterSweep']
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+##
+# @file ticks.py
+# @brief 模拟交易所的tick回放撮合。
+# @version 0.6
+
+import numpy as np
+import pandas as pd
+import six
+
+from quantdigger.datastruct import Contract
+
+
+def bar_path(open_, high, low, close):
+    """ 把一根Bar展开成合成tick路径。
+
+    阳线按 开-低-高-收，阴线按 开-高-低-收 的顺序经过各价格。
+
+    Returns:
+        np.ndarray.
+    """
+    if close >= open_:
+        return np.array([open_, low, high, close], dtype=np.float64)
+    return np.array([open_, high, low, close], dtype=np.float64)
+
+
+def first_crossings(prices, limits, is_buy):
+    """ 各限价单在tick路径上第一次成交的位置。
+
+    买单在价格不高于限价时成交，卖单在价格不低于限价时成交。路径的
+    累计最低价单调不增、累计最高价单调不减，每个订单只需一次二分查找。
+
+    Args:
+        prices (np.ndarray): tick价格路径
+
+        limits (np.ndarray): 各订单的限价
+
+        is_buy (np.ndarray): 各订单是否是买入方向
+
+    Returns:
+        np.ndarray. 成交的tick下标，不成交的为 len(prices)
+    """
+    lows = np.minimum.accumulate(prices)
+    highs = np.maximum.accumulate(prices)
+    return np.where(is_buy,
+                    np.searchsorted(-lows, -limits, side='left'),
+                    np.searchsorted(highs, limits, side='left'))
+
+
+class TickReplay(object):
+    """ 为模拟交易所提供各合约当前Bar内的tick价格路径。
+
+    有tick数据的合约回放该Bar时间段 [Bar时间, 下一根Bar时间) 内的tick，
+    其它合约回放Bar展开的合成路径，见 :func:`bar_path` 。tick数据按Bar
+    切分的位置在第一次回放时用一次二分查找算出，只支持预加载模式。
+    """
+    def __init__(self, ticks=None):
+        """
+        Args:
+            ticks (dict): 各合约的tick数据 {strcontract: Series/DataFrame}，
+                以时间为索引，DataFrame取 'price' 列。
+        """
+        self._ticks = {}  # Contract -> (时间数组, 价格数组)
+        self._bounds = {}  # 周期合约下标 -> 各Bar在tick数组中的起始位置
+        for strcontract, data in six.iteritems(ticks or {}):
+            if isinstance(data, pd.DataFrame):
+                data = data['price']
+            self._ticks[Contract(strcontract)] = (
+                np.asarray(data.index.values, dtype='datetime64[ns]'),
+                np.asarray(data.values, dtype=np.float64))
+
+    def path(self, bars, contract):
+        """ 合约当前Bar内的tick路径。
+
+        Args:
+            bars (BarStore): 各合约的最新Bar
+
+            contract (Contract): 合约
+
+        Returns:
+            tuple. (价格数组, 时间数组)，合成路径的时间数组为None。
+        """
+        ticks = self._ticks.get(contract)
+        if ticks is None:
+            return bar_path(bars.open(contract), bars.high(contract),
+                            bars.low(contract), bars.close(contract)), None
+        times, prices = ticks
+        slot, i = bars.locate(contract)
+        bounds = self._bounds.get(slot)
+        if bounds is None:
+            bar_times = np.asarray(bars.datetimes(slot),
+                                   dtype='datetime64[ns]')
+            bounds = self._bounds[slot] = np.append(
+                np.searchsorted(times, bar_times, side='left'), len(times))
+        start, end = bounds[i], bounds[i + 1]
+        return prices[start:end], times[start:end]
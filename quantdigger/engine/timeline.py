@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+import heapq
+
+import numpy as np
+import pandas as pd
+
+from quantdigger.errors import DataAlignError
+from quantdigger.util import log
+
+
+class Timeline(object):
+    """ 所有周期合约的全局时间轴。
+
+    加载数据后一次性对各合约的时间索引做归并，并记录每个时间步上
+    有新Bar的合约，使得回测主循环每步只需处理这些合约。
+
+    :ivar datetimes: 归并后的全局时间轴 (pd.DatetimeIndex)。
+    :ivar pcontracts: 周期合约列表，下标即合约编号。
+    :ivar positions: 周期合约 -> 该合约每根Bar在全局时间轴上的下标数组。
+    """
+    def __init__(self, all_data: "OrderedDict((strpcon, DataFrame))"):
+        self.pcontracts = list(all_data.keys())
+        self.positions = {}
+        indices = []
+        for strpcon, raw_data in all_data.items():
+            values = raw_data.index.values
+            if len(values) > 1 and np.any(values[1:] <= values[:-1]):
+                log.error('合约[%s] 数据时间逆序或冗余' % strpcon)
+                raise DataAlignError()
+            indices.append(values)
+        # k路归并
+        merged = np.unique(np.concatenate(indices))
+        self.datetimes = pd.DatetimeIndex(merged)
+        steps, pcon_ids = [], []
+        for i, (strpcon, values) in enumerate(zip(self.pcontracts, indices)):
+            pos = np.searchsorted(merged, values)
+            self.positions[strpcon] = pos
+            steps.append(pos)
+            pcon_ids.append(np.full(len(pos), i, dtype=np.int64))
+        steps = np.concatenate(steps)
+        pcon_ids = np.concatenate(pcon_ids)
+        # 稳定排序保证同一时间步内合约的相对顺序不变。
+        order = np.argsort(steps, kind='mergesort')
+        self._pcon_ids = pcon_ids[order]
+        self._offsets = np.zeros(len(merged) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(steps, minlength=len(merged)),
+                  out=self._offsets[1:])
+        self._start = 0
+
+    def seek(self, dt):
+        """ 从dt之后的时间步开始迭代，用于从断点恢复。 """
+        self._start = int(np.searchsorted(self.datetimes, dt, side='right'))
+
+    def __len__(self):
+        return len(self.datetimes)
+
+    def advancing(self, step):
+        """ 第step个时间步上有新Bar的合约编号数组。 """
+        return self._pcon_ids[self._offsets[step]:self._offsets[step + 1]]
+
+    def __iter__(self):
+        """ 逐步返回 (时间, [有新Bar的周期合约]) """
+        pcontracts = self.pcontracts
+        offsets = self._offsets.tolist()
+        pcon_ids = self._pcon_ids.tolist()
+        for step, dt in enumerate(self.datetimes[self._start:], self._start):
+            yield dt, [pcontracts[i] for i in
+                       pcon_ids[offsets[step]:offsets[step + 1]]]
+
+
+class StreamTimeline(object):
+    """ 流式模式的全局时间轴。
+
+    不预先归并各合约的时间索引，而是用以各合约下一根未读取Bar的时间为键
+    的最小堆做k路归并，每步只重新查询本步有新Bar的合约。调用者须在取
+    下一步之前让本步有新Bar的合约读取该Bar。
+    """
+    def __init__(self, originals: "OrderedDict((strpcon, StreamOriginalData))"):
+        self.pcontracts = list(originals.keys())
+        self._originals = list(originals.values())
+
+    def seek(self, dt):
+        """ 各合约已读到dt，从下一根未读取的Bar继续即可。 """
+        pass
+
+    def __iter__(self):
+        """ 逐步返回 (时间, [有新Bar的周期合约]) """
+        pcontracts = self.pcontracts
+        originals = self._originals
+        heap = [(dt, i) for i, dt in
+                enumerate(original.pending_datetime for original in originals)
+                if dt is not None]
+        heapq.heapify(heap)
+        while heap:
+            step_dt = heap[0][0]
+            advancing = []
+            while heap and heap[0][0] == step_dt:
+                advancing.append(heapq.heappop(heap)[1])
+            # 时间相同时按合约编号出堆，保持合约的相对顺序。
+            yield step_dt, [pcontracts[i] for i in advancing]
+            for i in advancing:
+                dt = originals[i].pending_datetime
+                if dt is not None:
+                    heapq.heappush(heap, (dt, i))
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+from time import perf_counter
+
+
+class PhaseTimer(object):
+    """ 累计回测各阶段的耗时和调用次数。
+
+    由 ``settings['phase_timing']`` 开启，关闭时引擎不会创建该对象。
+    """
+    def __init__(self):
+        self._stats = {}  # phase -> [count, seconds]
+
+    @staticmethod
+    def now():
+        return perf_counter()
+
+    def add(self, phase, start):
+        """ 记录一次调用。
+
+        Args:
+            phase (str): 阶段名称
+
+            start (float): 调用开始时 :meth:`now` 的返回值
+        """
+        elapsed = perf_counter() - start
+        try:
+            stat = self._stats[phase]
+        except KeyError:
+            stat = self._stats[phase] = [0, 0.0]
+        stat[0] += 1
+        stat[1] += elapsed
+
+    def report(self):
+        """
+        Returns:
+            dict. {阶段: {'count': 调用次数, 'time': 累计秒数}}
+        """
+        return dict((phase, {'count': count, 'time': seconds})
+                    for phase, (count, seconds) in self._stats.items())
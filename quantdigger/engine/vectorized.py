@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+##
+# @file vectorized.py
+# @brief 向量化回测：由目标仓位数组直接计算成交，佣金，保证金和资金曲线。
+# @version 0.6
+
+import six
+import numpy as np
+
+from quantdigger.engine.blotter import HoldingsHistory
+from quantdigger.engine.costs import ProportionalCommission
+from quantdigger.datastruct import (
+    Contract,
+    Direction,
+    Order,
+    PContract,
+    PriceType,
+    TradeSide,
+    Transaction,
+)
+
+
+class VectorStrategy(object):
+    """ 向量化策略基类。
+
+    策略由指标数组完全决定时，一次性返回每个周期合约的目标仓位数组，
+    不再逐根Bar运行 ``on_bar``。
+    """
+    def __init__(self, name):
+        self.name = name
+
+    def target_positions(self, data):
+        """ 计算目标仓位。
+
+        Args:
+            data (dict): {strpcon: pd.DataFrame}, 周期合约数据。
+
+        Returns:
+            dict. {strpcon: array}, 与合约数据等长的目标仓位数组，
+            正数为多头，负数为空头，0表示空仓。
+        """
+        raise NotImplementedError
+
+
+class VectorBlotter(object):
+    """ 向量化回测的结果，接口与 :class:`SimpleBlotter` 兼容，
+    可直接用于构造 :class:`Profile` 。
+
+    第i根Bar的目标仓位在成交价上成交，成交价为当根Bar收盘价(fill='close')
+    或下根Bar开盘价(fill='open')。最后一根Bar以收盘价强平，和事件回测一致。
+    不检查可用资金，股票也不受T+1限制。成本模型按合约对整个成交数组计算，
+    反手时滑点按总数量计算，强平不计滑点。
+    """
+    def __init__(self, name, timeline, all_data, targets, capital,
+                 fill='close', commission=None, slippage=None):
+        """
+        Args:
+            name (str): 策略名
+
+            timeline (Timeline): 全局时间轴
+
+            all_data (dict): {strpcon: pd.DataFrame}
+
+            targets (dict): {strpcon: array}, 目标仓位
+
+            capital (float): 初始资金
+
+            fill (str): 'close' 或 'open'
+
+            commission (CommissionModel): 佣金模型，None时按默认费率
+
+            slippage (SlippageModel): 滑点模型，None时没有滑点
+        """
+        assert(fill in ('close', 'open'))
+        self.name = name
+        self.positions = {}
+        self.open_orders = set()
+        self._capital = capital
+        self._fill = fill
+        self._commission = commission or ProportionalCommission()
+        self._slippage = slippage
+        self._datetimes = timeline.datetimes
+        self._trades = []
+        self._all_transactions = None
+        steps = len(timeline)
+        pnl = np.zeros(steps)
+        commission = np.zeros(steps)
+        margin = np.zeros(steps)
+        final_commission = 0.0
+        for strpcon, target in six.iteritems(targets):
+            strpcon = strpcon.upper()
+            raw_data = all_data[strpcon]
+            contract = PContract.from_string(strpcon).contract
+            bar_pnl, bar_commission, bar_margin, last_commission = \
+                self._compute(contract, raw_data, target)
+            pos = timeline.positions[strpcon]
+            pnl[pos] += bar_pnl
+            commission[pos] += bar_commission
+            # 保证金是状态量，在合约没有新Bar的时间步上沿用上一个值，
+            # 所以累加变化量。
+            margin[pos] += np.diff(bar_margin, prepend=0.0)
+            final_commission += last_commission
+        commission = np.cumsum(commission)
+        equity = capital + np.cumsum(pnl) - commission
+        cash = equity - np.cumsum(margin)
+        # 最后一根k线处强平。
+        commission[-1] += final_commission
+        equity[-1] -= final_commission
+        cash[-1] = equity[-1]
+        self._all_holdings = HoldingsHistory.from_columns(
+            self._datetimes, commission, equity, cash)
+        self.holding = {
+            'cash': cash[-1],
+            'commission': commission[-1],
+            'history_profit': equity[-1] - capital + commission[-1],
+            'position_profit': 0.0,
+            'equity': equity[-1]
+        }
+
+    def _compute(self, contract, raw_data, target):
+        """ 计算单个合约每根Bar的盈亏，佣金和保证金占用。 """
+        strcon = str(contract)
+        multiple = Contract.volume_multiple(strcon)
+        long_ratio = Contract.long_margin_ratio(strcon)
+        short_ratio = Contract.short_margin_ratio(strcon)
+        close = raw_data.close.values.astype(np.float64)
+        target = np.nan_to_num(np.asarray(target, dtype=np.float64))
+        if len(target) != len(close):
+            raise ValueError('合约[%s]的目标仓位长度和数据长度不一致' % strcon)
+        if self._fill == 'open':
+            # 信号在下根Bar开盘成交。
+            target = np.concatenate([[0.0], target[:-1]])
+            price = raw_data.open.values.astype(np.float64)
+        else:
+            price = close
+        prev = np.concatenate([[0.0], target[:-1]])
+        prev_close = np.concatenate([[close[0]], close[:-1]])
+        trade = target - prev
+        quantity = np.abs(trade)
+        if self._slippage is None:
+            offset = np.zeros(len(trade))
+        else:
+            volume = raw_data.volume.values.astype(np.float64)
+            offset = np.where(trade != 0, self._slippage.compute(
+                contract, price, quantity, volume), 0.0)
+            price = price + np.sign(trade) * offset
+        pnl = (prev * (close - prev_close) + trade * (close - price)) * \
+            multiple
+        # 反手拆成平仓和开仓两笔成交分别计算佣金，和事件回测一致。
+        closed = np.where(prev * trade < 0,
+                          np.minimum(np.abs(prev), quantity), 0.0)
+        commission = \
+            self._commission.compute(contract, price, closed, multiple) + \
+            self._commission.compute(contract, price, quantity - closed,
+                                     multiple)
+        margin = np.abs(target) * close * multiple * \
+            np.where(target > 0, long_ratio, short_ratio)
+        last_commission = float(self._commission.compute(
+            contract, close[-1], abs(target[-1]), multiple))
+        # 成交明细只记录下标，需要时再构造 Transaction
+        for i in np.flatnonzero(trade):
+            self._trades.append((raw_data.index[i], contract, prev[i],
+                                 target[i], price[i], offset[i]))
+        if target[-1] != 0:
+            self._trades.append((raw_data.index[-1], contract, target[-1],
+                                 0.0, close[-1], 0.0))
+        return pnl, commission, margin, last_commission
+
+    @property
+    def all_holdings(self):
+        """ 账号历史情况，最后一根k线处平所有仓位。"""
+        return self._all_holdings
+
+    @property
+    def transactions(self):
+        """ 成交明细，最后一根k线处平所有仓位。"""
+        if self._all_transactions is None:
+            self._all_transactions = []
+            self._trades.sort(key=lambda t: t[0])
+            for dt, contract, prev, target, price, offset in self._trades:
+                for side, direction, quantity in _split_trade(prev, target):
+                    order = Order(dt, contract, PriceType.LMT, side,
+                                  direction, float(price), int(quantity))
+                    transact = Transaction(order)
+                    transact.slippage = float(offset)
+                    transact.commission = float(self._commission.compute(
+                        contract, transact.price, transact.quantity,
+                        transact.volume_multiple))
+                    self._all_transactions.append(transact)
+        return self._all_transactions
+
+
+def _split_trade(prev, target):
+    """ 把仓位变化拆分成先平后开的交易。
+
+    Returns:
+        list. [(TradeSide, Direction, quantity)]
+    """
+    rst = []
+    if prev > 0 and target < prev:
+        rst.append((TradeSide.CLOSE, Direction.LONG, prev - max(target, 0)))
+    elif prev < 0 and target > prev:
+        rst.append((TradeSide.CLOSE, Direction.SHORT,
+                    -prev - max(-target, 0)))
+    if target > 0 and target > max(prev, 0):
+        rst.append((TradeSide.OPEN, Direction.LONG, target - max(prev, 0)))
+    elif target < 0 and -target > max(-prev, 0):
+        rst.append((TradeSide.OPEN, Direction.SHORT,
+                    -target - max(-prev, 0)))
+    return rst
+
+
+__all__ = ['VectorStrategy', 'VectorBlotter']
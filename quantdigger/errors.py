@@ -66,6 +66,10 @@ class ArgumentError(QError):
     msg = "参数错误！"
 
 
+class StreamTechnicalError(QError):
+    msg = "流式模式下序列变量只保留最近{window}根Bar，不支持技术指标[{name}]！"
+
+
 class WrongDataForTransform(QError):
     """
     Raised whenever a rolling transform is called on an event that
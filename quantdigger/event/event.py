@@ -79,10 +79,14 @@ class Event(object):
 
 
 class SignalEvent(Event):
-    """ 由策略函数产生的交易信号事件。 """
+    """ 由策略函数产生的交易信号事件。
 
-    def __init__(self, orders):
+    :ivar checked: 开仓单是否已整批检查过资金。
+    """
+
+    def __init__(self, orders, checked=False):
         super(SignalEvent, self).__init__(Event.SIGNAL, orders)
+        self.checked = checked
 
     @property
     def orders(self):
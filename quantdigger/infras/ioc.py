@@ -62,9 +62,8 @@ def resolve_from(ioc_container):
     def resolve(name):
         obj = ioc_container.resolve(name)
         if isinstance(obj, IoCTrunk):
-            instance = obj.construct()
-            ioc_container.set(name, instance)
-            return instance
+            # 由trunk决定是否复用已构造的实例。
+            return obj.construct()
         else:
             return obj
     return resolve
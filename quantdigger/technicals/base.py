@@ -22,12 +22,16 @@ def ndarray(data):
     return data
 
 
+# python3.11 移除了 inspect.getargspec
+_getargspec = getattr(inspect, 'getfullargspec', None) or inspect.getargspec
+
+
 def tech_init(method):
     """ 根据被修饰函数的参数构造属性。
         并且触发向量计算。
     """
     def wrapper(self, *args, **kwargs):
-        magic = inspect.getargspec(method)
+        magic = _getargspec(method)
         arg_names = magic.args[1:]
         # 默认参数
         default = dict(
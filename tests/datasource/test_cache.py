@@ -1,7 +1,11 @@
 # -*- coding: utf-8 -*-
 
+import os
 import pandas as pd
+import pickle
 import shutil
+import threading
+import time
 import unittest
 
 from quantdigger.infras.object import HashObject
@@ -29,6 +33,54 @@ class _MockSource(DatasourceAbstract):
         return SourceWrapper(pcontract, data, len(data))
 
 
+class _DailySource(DatasourceAbstract):
+    """ 每天一根Bar的模拟数据源。 """
+    def __init__(self):
+        self.log = []
+
+    def get_bars(self, pcontract, dt_start, dt_end):
+        self.log.append((pd.to_datetime(dt_start), pd.to_datetime(dt_end)))
+        index = pd.date_range(dt_start, dt_end, freq='D', name='datetime')
+        data = pd.DataFrame({'close': index.day * 1.0}, index=index)
+        return SourceWrapper(pcontract, data, len(data))
+
+    def get_last_bars(self, pcontract, n):
+        self.log.append(n)
+        return self.get_bars(pcontract,
+                             pd.Timestamp('2010-12-31') - pd.Timedelta(n - 1,
+                                                                       'D'),
+                             '2010-12-31')
+
+
+class _BlockingSource(_DailySource):
+    """ 访问数据源时先等待，用于测试并发。 """
+    def __init__(self, wait):
+        super(_BlockingSource, self).__init__()
+        self._wait = wait
+        self._log_lock = threading.Lock()
+
+    def get_bars(self, pcontract, dt_start, dt_end):
+        self._wait()
+        with self._log_lock:
+            return super(_BlockingSource, self).get_bars(pcontract,
+                                                         dt_start, dt_end)
+
+
+class _TuShareLikeSource(DatasourceAbstract):
+    """ 和tushare返回格式相同的模拟数据源：日期字符串索引，有字符串列。 """
+
+    def get_bars(self, pcontract, dt_start, dt_end):
+        dates = pd.date_range(dt_start, dt_end, freq='D')
+        data = pd.DataFrame({
+            'date': [d.strftime('%Y-%m-%d') for d in dates],
+            'close': [float(d.day) for d in dates],
+            'code': pcontract.contract.code,
+        }).astype({'code': object})
+        data.set_index('date', drop=True, inplace=True)
+        data.index.names = ['datetime']
+        return SourceWrapper(pcontract, data, len(data))
+
+
 def dt_eq(dt1, dt2):
     return pd.to_datetime(dt1) == pd.to_datetime(dt2)
 
@@ -74,6 +126,190 @@ class TestCache(unittest.TestCase):
 
         # TODO: 两边
 
+    def test_partitions(self):
+        """
+        测试：缓存按月分区保存，补充数据只写入涉及的分区，读取时只加载
+              和查询范围重叠的分区。
+        """
+        src = _DailySource()
+        ds = CachedDatasource(src, LocalFsCache(TestCache.CACHE_PATH))
+        data = ds.get_bars(self.pcontract, '2010-1-10', '2010-3-5').data
+        self.assertEqual(len(data), 55)
+        path = os.path.join(TestCache.CACHE_PATH, str(self.pcontract))
+        self.assertEqual(sorted(os.listdir(path)), [
+            '201001.npz', '201002.npz', '201003.npz', 'manifest.json'])
+        mtimes = dict((name, os.stat(os.path.join(path, name)).st_mtime_ns)
+                      for name in ('201001.npz', '201002.npz'))
+
+        data = ds.get_bars(self.pcontract, '2010-1-10', '2010-4-10').data
+        self.assertEqual(src.log[-1], (pd.Timestamp('2010-3-6'),
+                                       pd.Timestamp('2010-4-10')))
+        self.assertEqual(len(data), 91)
+        self.assertTrue(data.index.is_monotonic_increasing)
+        for name, mtime in mtimes.items():
+            self.assertEqual(
+                os.stat(os.path.join(path, name)).st_mtime_ns, mtime)
+
+        # 新的缓存实例从清单读取，只加载重叠的分区。
+        cache = LocalFsCache(TestCache.CACHE_PATH)
+        loaded = []
+        load_partition = cache._load_partition
+        cache._load_partition = lambda key, name: \
+            loaded.append(name) or load_partition(key, name)
+        data = cache.get_bars(self.pcontract, '2010-2-3', '2010-2-5').data
+        self.assertEqual(list(data.close), [3.0, 4.0, 5.0])
+        self.assertEqual(loaded, ['201002'])
+
+    def test_legacy_layout(self):
+        """
+        测试：旧版本的缓存(_meta和csv文件)第一次读取时转换成分区格式，
+              已缓存的时间范围不再访问数据源。
+        """
+        key = str(self.pcontract)
+        os.makedirs(TestCache.CACHE_PATH)
+        index = pd.date_range('2010-1-10', '2010-3-5', freq='D',
+                              name='datetime')
+        pd.DataFrame({'close': index.day * 1.0}, index=index).to_csv(
+            os.path.join(TestCache.CACHE_PATH, key + '.csv'))
+        other = str(PContract.from_string('000002.SH-1.DAY'))
+        with open(os.path.join(TestCache.CACHE_PATH, '_meta'), 'wb') as f:
+            pickle.dump({key: (index[0], index[-1]), other: (None, index[-1])},
+                        f, protocol=2)
+
+        src = _DailySource()
+        ds = CachedDatasource(src, LocalFsCache(TestCache.CACHE_PATH))
+        data = ds.get_bars(self.pcontract, '2010-2-1', '2010-3-10').data
+        self.assertEqual(len(data), 38)
+        self.assertEqual(src.log, [(pd.Timestamp('2010-3-6'),
+                                    pd.Timestamp('2010-3-10'))])
+        path = os.path.join(TestCache.CACHE_PATH, key)
+        self.assertEqual(sorted(os.listdir(path)),
+                         ['201001.npz', '201002.npz', '201003.npz',
+                          'manifest.json'])
+        self.assertFalse(os.path.exists(path + '.csv'))
+        with open(os.path.join(TestCache.CACHE_PATH, '_meta'), 'rb') as f:
+            self.assertEqual(list(pickle.load(f)), [other])
+
+        # 转换后新的缓存实例直接读取分区。
+        src.log = []
+        data = CachedDatasource(src, LocalFsCache(TestCache.CACHE_PATH))\
+            .get_bars(self.pcontract, '2010-1-10', '2010-3-10').data
+        self.assertEqual(len(data), 60)
+        self.assertEqual(src.log, [])
+
+    def test_concurrent_fill(self):
+        """
+        测试：多个周期合约的缺失时间范围并发地从数据源补充。
+        """
+        # 顺序访问时第一个请求等不到其它请求，栅栏超时失败。
+        barrier = threading.Barrier(3, timeout=10)
+        src = _BlockingSource(barrier.wait)
+        ds = CachedDatasource(src, LocalFsCache(TestCache.CACHE_PATH),
+                              workers=3)
+        pcontracts = [PContract.from_string(s) for s in (
+            '000001.SH-1.DAY', '000002.SH-1.DAY', '000003.SH-1.DAY')]
+        results = ds.get_many([(p, '2010-1-1', '2010-1-31')
+                               for p in pcontracts])
+        self.assertEqual([len(r.data) for r in results], [31, 31, 31])
+        self.assertEqual([r.pcontract for r in results], pcontracts)
+        self.assertEqual(len(src.log), 3)
+
+        # 已缓存的数据不再访问数据源。
+        src._wait = lambda: self.fail('访问了数据源！')
+        results = ds.get_many([(p, '2010-1-5', '2010-1-10')
+                               for p in pcontracts])
+        self.assertEqual([len(r.data) for r in results], [6, 6, 6])
+        ds.close()
+
+    def test_close(self):
+        """
+        测试：关闭后线程池的线程退出，with语句退出时自动关闭。
+        """
+        with CachedDatasource(_DailySource(),
+                              LocalFsCache(TestCache.CACHE_PATH)) as ds:
+            ds.get_bars(self.pcontract, '2010-1-1', '2010-1-31')
+            threads = list(ds._pool._threads)
+            self.assertTrue(threads)
+        self.assertIsNone(ds._pool)
+        self.assertFalse(any(t.is_alive() for t in threads))
+        # 关闭后仍可使用，按需新建线程池。
+        data = ds.get_bars(self.pcontract, '2010-1-1', '2010-2-5').data
+        self.assertEqual(len(data), 36)
+        ds.close()
+
+    def test_coalesce(self):
+        """
+        测试：两个调用者同时请求同一个缺失时间范围时只访问一次数据源。
+        """
+        release = threading.Event()
+        src = _BlockingSource(lambda: release.wait(10))
+        ds = CachedDatasource(src, LocalFsCache(TestCache.CACHE_PATH))
+        futures = []
+        fill = ds._fill
+        ds._fill = lambda *args: futures.append(fill(*args)) or futures[-1]
+        results = []
+
+        def load():
+            results.append(ds.get_bars(self.pcontract,
+                                       '2010-1-1', '2010-1-31'))
+        threads = [threading.Thread(target=load) for i in range(2)]
+        for t in threads:
+            t.start()
+        deadline = time.time() + 10
+        while len(futures) < 2 and time.time() < deadline:
+            time.sleep(0.01)
+        release.set()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(futures), 2)
+        self.assertIs(futures[0], futures[1])
+        self.assertEqual(len(src.log), 1)
+        self.assertEqual([len(r.data) for r in results], [31, 31])
+
+    def test_last_bars(self):
+        """
+        测试：缓存中有足够数据时，最后n根Bar直接从缓存读取。
+        """
+        src = _DailySource()
+        ds = CachedDatasource(src, LocalFsCache(TestCache.CACHE_PATH))
+        ds.get_bars(self.pcontract, '2010-1-10', '2010-3-5')
+        src.log = []
+        data = ds.get_last_bars(self.pcontract, 40).data
+        self.assertEqual(len(data), 40)
+        self.assertEqual(data.index[-1], pd.Timestamp('2010-3-5'))
+        self.assertEqual(data.index[0], pd.Timestamp('2010-1-25'))
+        self.assertEqual(src.log, [])
+
+        # 缓存不够时从数据源读取。
+        data = ds.get_last_bars(self.pcontract, 100).data
+        self.assertEqual(src.log[0], 100)
+        self.assertEqual(data.index[-1], pd.Timestamp('2010-12-31'))
+
+        # 空缓存从数据源读取后缓存下来。
+        pcontract = PContract.from_string('000002.SH-1.DAY')
+        src.log = []
+        ds.get_last_bars(pcontract, 30)
+        self.assertEqual(len(src.log), 2)
+        data = ds.get_last_bars(pcontract, 10).data
+        self.assertEqual(len(src.log), 2)
+        self.assertEqual(list(data.close), [float(d) for d in range(22, 32)])
+
+    def test_tushare_frame(self):
+        """
+        测试：缓存以日期字符串为索引、包含字符串列的数据。
+        """
+        ds = CachedDatasource(_TuShareLikeSource(),
+                              LocalFsCache(TestCache.CACHE_PATH))
+        data = ds.get_bars(self.pcontract, '2010-1-30', '2010-2-2').data
+        self.assertEqual(list(data.close), [30.0, 31.0, 1.0, 2.0])
+        self.assertEqual(list(data.code), ['000001'] * 4)
+
+        cache = LocalFsCache(TestCache.CACHE_PATH)
+        data = cache.get_bars(self.pcontract, '2010-1-31', '2010-2-1').data
+        self.assertEqual(list(data.index), [pd.Timestamp('2010-1-31'),
+                                            pd.Timestamp('2010-2-1')])
+        self.assertEqual(list(data.code), ['000001'] * 2)
+
 
 if __name__ == '__main__':
     unittest.main()
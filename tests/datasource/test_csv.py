@@ -1,10 +1,15 @@
 # -*- coding: utf-8 -*-
 import pandas as pd
+import numpy as np
 import os
+import shutil
+import tempfile
 import unittest
 from logbook import Logger
 from quantdigger import ConfigUtil
 from quantdigger.datasource.data import DataManager
+from quantdigger.datasource.dsutil import get_setting_datasource
+from quantdigger.datasource.impl.csv_source import CsvIndex, CsvSource
 
 logger = Logger('test')
 _DT_START = '1980-1-1'
@@ -33,6 +38,101 @@ class TestCsvSource(unittest.TestCase):
         ConfigUtil.set(source=source_bak)
         logger.info('***** 数据测试结束 *****\n')
 
+    def test_switch_data_path(self):
+        """
+        测试：修改数据路径配置后重新构造数据源，配置不变时复用实例。
+        """
+        source_bak = ConfigUtil.get('source')
+        path_bak = ConfigUtil.get('data_path')
+        root = tempfile.mkdtemp()
+        try:
+            ConfigUtil.set(source='csv')
+            source, _ = get_setting_datasource()
+            self.assertIs(get_setting_datasource()[0], source)
+            ConfigUtil.set(data_path=root)
+            other, _ = get_setting_datasource()
+            self.assertIsNot(other, source)
+            self.assertEqual(other._root, root)
+        finally:
+            ConfigUtil.set(source=source_bak, data_path=path_bak)
+            shutil.rmtree(root)
+        self.assertEqual(get_setting_datasource()[0]._root, path_bak)
+
+
+class TestCsvIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.path = os.path.join(self.root, '1MINUTE', 'TEST')
+        os.makedirs(self.path)
+        self.fname = os.path.join(self.path, 'AA.csv')
+        self.data = self.frame('2016-1-4 9:00', 1000)
+        self.data.to_csv(self.fname)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def frame(self, start, n):
+        return pd.DataFrame({
+            'open': np.arange(n) + 0.5, 'close': np.arange(n) + 1.5,
+            'high': np.arange(n) + 2.5, 'low': np.arange(n) - 0.5,
+            'volume': np.arange(n),
+        }, index=pd.date_range(start, periods=n, freq='min',
+                               name='datetime'))
+
+    def assertFrameEqual(self, left, right, **kwargs):
+        pd.testing.assert_frame_equal(left, right, check_index_type=False,
+                                      check_freq=False, **kwargs)
+
+    def test_case(self):
+        """
+        测试：CSV数据源按索引只读取需要的字节范围，结果和读取整个文件
+              后筛选一致；数据文件变化后索引重建。
+        """
+        source = CsvSource(self.root, index_step=7)
+        for start, end in [('1980-1-1', '2100-1-1'),
+                           ('2016-1-4 9:13', '2016-1-4 10:40'),
+                           ('2016-1-4 9:14:30', '2016-1-4 9:14:40'),
+                           ('2010-1-1', '2011-1-1'),
+                           ('2100-1-1', '2100-1-2')]:
+            expected = self.data[(pd.to_datetime(start) <= self.data.index) &
+                                 (self.data.index <= pd.to_datetime(end))]
+            target = source.get_bars('AA.TEST-1.MINUTE', start, end)
+            self.assertFrameEqual(target, expected,
+                                  check_dtype=len(expected) > 0)
+            chunks = list(source.iter_bars('AA.TEST-1.MINUTE', start, end, 50))
+            self.assertEqual(sum(len(c) for c in chunks), len(expected))
+        for n in (1, 10, 1000, 2000):
+            self.assertFrameEqual(
+                source.get_last_bars('AA.TEST-1.MINUTE', n), self.data[-n:])
+        self.assertTrue(os.path.exists(self.fname + '.idx'))
+
+        # 追加数据后索引失效，新的数据源实例也不使用旧索引。
+        more = self.frame('2016-1-5 9:00', 100)
+        more.to_csv(self.fname, mode='a', header=False)
+        for src in (source, CsvSource(self.root, index_step=7)):
+            self.assertFrameEqual(
+                src.get_last_bars('AA.TEST-1.MINUTE', 150),
+                pd.concat([self.data, more])[-150:])
+
+    def test_unsorted(self):
+        """
+        测试：采样行之间有乱序行时不使用索引，读取整个文件后筛选。
+        """
+        rows = self.data.index.values.copy()
+        rows[[3, 63]] = rows[[63, 3]]
+        data = self.data.copy()
+        data.index = pd.DatetimeIndex(rows, name='datetime')
+        data.to_csv(self.fname)
+        source = CsvSource(self.root, index_step=10)
+        for start, end in [('2016-1-4 9:00', '2016-1-4 9:10'),
+                           ('2016-1-4 10:02', '2016-1-4 10:04')]:
+            expected = data[(pd.to_datetime(start) <= data.index) &
+                            (data.index <= pd.to_datetime(end))]
+            target = source.get_bars('AA.TEST-1.MINUTE', start, end)
+            self.assertFrameEqual(target, expected)
+        self.assertFalse(CsvIndex.load(self.fname + '.idx').sorted)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+import pandas as pd
+
+from quantdigger import ConfigUtil
+from quantdigger.datasource.impl.csv_source import CsvSource
+from quantdigger.datasource.impl.mmap_source import MmapSource, convert_csv
+from quantdigger.engine.execute_unit import ExecuteUnit
+
+
+class TestMmapSource(unittest.TestCase):
+
+    def setUp(self):
+        self.csv_root = os.path.join(os.getcwd(), 'data')
+        self.root = tempfile.mkdtemp()
+        self.converted = convert_csv(self.csv_root, self.root)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_range_query(self):
+        """
+        测试：二进制数据源按时间范围和最后n根读取的数据和CSV数据源一致。
+        """
+        self.assertTrue('BB.TEST-1.MINUTE' in self.converted)
+        csv_source = CsvSource(self.csv_root)
+        source = MmapSource(self.root)
+        self.assertEqual(
+            sorted(source.get_code2strpcon()[0]['BB']),
+            sorted(csv_source.get_code2strpcon()[0]['BB']))
+        for start, end in [('1980-1-1', '2100-1-1'),
+                           ('2013-12-06 10:00', '2013-12-09 14:00'),
+                           ('2100-1-1', '2100-1-2')]:
+            target = source.get_bars('BB.TEST-1.MINUTE', start, end)
+            expected = csv_source.get_bars('BB.TEST-1.MINUTE', start, end)
+            pd.testing.assert_frame_equal(target, expected,
+                                          check_dtype=False,
+                                          check_index_type=False)
+        pd.testing.assert_frame_equal(
+            source.get_last_bars('BB.TEST-1.MINUTE', 10),
+            csv_source.get_last_bars('BB.TEST-1.MINUTE', 10),
+            check_dtype=False, check_index_type=False)
+        chunks = list(source.iter_bars('BB.TEST-1.MINUTE', '1980-1-1',
+                                       '2100-1-1', 100))
+        pd.testing.assert_frame_equal(
+            pd.concat(chunks),
+            source.get_bars('BB.TEST-1.MINUTE', '1980-1-1', '2100-1-1'))
+
+    def test_backtest(self):
+        """
+        测试：切换到二进制数据源后回测读取的数据和CSV数据源一致。
+        """
+        source_bak = ConfigUtil.get('source')
+        path_bak = ConfigUtil.get('data_path')
+        try:
+            expected = ExecuteUnit(['BB.TEST-1.Minute'])._all_data
+            ConfigUtil.set(source='mmap', data_path=self.root)
+            data = ExecuteUnit(['BB.TEST-1.Minute'])._all_data
+        finally:
+            ConfigUtil.set(source=source_bak, data_path=path_bak)
+        self.assertEqual(list(data.keys()), list(expected.keys()))
+        for key in data:
+            pd.testing.assert_frame_equal(data[key], expected[key],
+                                          check_dtype=False,
+                                          check_index_type=False)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+# encoding: utf-8
+
+import os
+import shutil
+import tempfile
+import unittest
+from quantdigger import (
+    NumberSeries,
+    Strategy,
+    MA,
+)
+from quantdigger.engine.execute_unit import ExecuteUnit
+
+
+class CrashError(Exception):
+    pass
+
+
+class CheckpointStrategy(Strategy):
+    """ 带用户变量、指标和策略属性的交易策略。 """
+    crash_at = None
+
+    def __init__(self, name):
+        super(CheckpointStrategy, self).__init__(name)
+        self.trades = 0
+
+    def on_init(self, ctx):
+        ctx.ma = MA(ctx.close, 5)
+        ctx.acc = NumberSeries()
+
+    def on_symbol(self, ctx):
+        ctx.acc.update(ctx.close[0] - ctx.open[0] + ctx.acc[1])
+
+    def on_bar(self, ctx):
+        if ctx.curbar == self.crash_at:
+            raise CrashError()
+        if ctx.acc[0] > ctx.acc[1] and ctx.close[0] > ctx.ma[0] and \
+                ctx.pos() == 0:
+            ctx.buy(ctx.close, 1)
+            self.trades += 1
+        elif ctx.acc[0] < ctx.acc[1] and ctx.pos() > 0:
+            ctx.sell(ctx.close, ctx.pos())
+            self.trades += 1
+
+
+class CrashStrategy(CheckpointStrategy):
+    """ 在第250根Bar抛出异常。 """
+    crash_at = 250
+
+
+def run(strategy, data=None, resume=None, **kwargs):
+    unit = ExecuteUnit(['BB.TEST-1.Minute'], data=data)
+    profile = list(unit.add_strategies([{
+        'strategy': strategy,
+        'capital': 1000000.0,
+    }]))[0]
+    if resume:
+        unit.resume(resume)
+    unit.run(**kwargs)
+    return unit, profile
+
+
+def result(profile):
+    return (list(profile.all_holdings()['equity']),
+            [(t.datetime, t.price, t.quantity)
+             for t in profile.transactions()])
+
+
+class TestCheckpoint(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        self.path = os.path.join(self._dir, 'checkpoint.pkl')
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def test_resume_after_crash(self):
+        """
+        测试：回测中途崩溃后从最近的断点恢复，结果和完整回测一致。
+        """
+        full_strategy = CheckpointStrategy('A1')
+        unit, profile = run(full_strategy)
+        expected = result(profile)
+
+        self.assertRaises(CrashError, run, CrashStrategy('A1'),
+                          checkpoint_path=self.path, checkpoint_interval=100)
+        resumed_strategy = CheckpointStrategy('A1')
+        unit, profile = run(resumed_strategy, resume=self.path)
+        self.assertEqual(resumed_strategy.trades, full_strategy.trades)
+        self.assertTrue(full_strategy.trades > 0)
+        self.assertEqual(result(profile), expected)
+
+    def test_arguments(self):
+        """
+        测试：只设置断点间隔、没有设置断点路径时，开始回测前报错。
+        """
+        strategy = CheckpointStrategy('A1')
+        self.assertRaises(ValueError, run, strategy, checkpoint_interval=100)
+        self.assertEqual(strategy.trades, 0)
+
+    def test_append_bars(self):
+        """
+        测试：在已完成的回测后追加新数据继续回测，结果和完整回测一致。
+        """
+        unit, profile = run(CheckpointStrategy('A1'))
+        expected = result(profile)
+        all_data = unit._all_data
+        head = dict((k, v[:len(v) // 2]) for k, v in all_data.items())
+
+        run(CheckpointStrategy('A1'), head, checkpoint_path=self.path)
+        unit, profile = run(CheckpointStrategy('A1'), all_data,
+                            resume=self.path)
+        self.assertEqual(result(profile), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
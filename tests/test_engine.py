@@ -1,7 +1,11 @@
 # encoding: utf-8
 
+import six
 from six.moves import range
+import copy
 import datetime
+import pickle
+from collections import OrderedDict
 import unittest
 import pandas as pd
 import os
@@ -9,12 +13,34 @@ import talib
 import numpy as np
 from quantdigger.util.log import gen_log as logger
 from quantdigger import (
+    ConfigUtil,
     add_strategies,
     NumberSeries,
     DateTimeSeries,
     MA,
     BOLL,
     Strategy,
+    UniverseStrategy,
+)
+from quantdigger.digger import finance
+from quantdigger.engine.blotter import HoldingsHistory
+from quantdigger.engine.context import MarketData
+from quantdigger.engine.exchange import OrderBook
+from quantdigger.engine.execute_unit import ExecuteUnit
+from quantdigger.engine.profile import Profile
+from quantdigger.datastruct import (
+    Contract,
+    Direction,
+    Order,
+    PContract,
+    PriceType,
+    TradeSide,
+)
+from quantdigger.engine.timeline import StreamTimeline, Timeline
+from quantdigger.errors import (
+    DataAlignError,
+    SeriesIndexError,
+    StreamTechnicalError,
 )
 
 
@@ -404,5 +430,764 @@ class TestDefaultPContract(unittest.TestCase):
         logger.info("默认合约测试成功！")
 
 
+class TestPhaseTiming(unittest.TestCase):
+
+    def test_case(self):
+        """
+        测试：开启阶段计时后Profile返回各阶段的调用次数。
+        """
+        class DemoStrategy(Strategy):
+
+            def on_bar(self, ctx):
+                if ctx.curbar == 10:
+                    ctx.buy(ctx.close, 1)
+
+        ConfigUtil.set(phase_timing=True)
+        try:
+            profiles = add_strategies(['BB.TEST-1.Minute'], [
+                {
+                    'strategy': DemoStrategy('A1'),
+                    'capital': 1000000.0,
+                },
+                {
+                    'strategy': DemoStrategy('A2'),
+                    'capital': 1000000.0,
+                }
+            ])
+        finally:
+            ConfigUtil.set(phase_timing=False)
+        fname = os.path.join(os.getcwd(), 'data', '1MINUTE', 'TEST', 'BB.csv')
+        blen = len(pd.read_csv(fname))
+        for profile in profiles:
+            timings = profile.phase_timings()
+            self.assertEqual(timings['rolling_forward']['count'], blen)
+            self.assertEqual(timings['on_bar']['count'], blen)
+            self.assertEqual(timings['on_symbol']['count'], blen)
+            self.assertEqual(timings['process_trading_events']['count'],
+                             blen * 2)
+            self.assertEqual(timings['SIGNAL']['count'], 1)
+            self.assertEqual(timings['ORDER']['count'], 1)
+            self.assertEqual(timings['FILL']['count'], 1)
+            self.assertTrue(timings['on_bar']['time'] >= 0)
+
+        profiles = add_strategies(['BB.TEST-1.Minute'], [
+            {
+                'strategy': DemoStrategy('A1'),
+                'capital': 1000000.0,
+            }
+        ])
+        self.assertEqual(profiles[0].phase_timings(), {})
+
+
+class TestParallelLoad(unittest.TestCase):
+
+    def test_case(self):
+        """
+        测试：线程池和进程池并行读取的数据和顺序读取一致，并记录各合约的
+              读取耗时。
+        """
+        pcontracts = ['BB.TEST-1.Minute', 'AA.TEST-1.Minute',
+                      'FUTURE.TEST-1.Minute', 'FUTURE2.TEST-1.Minute']
+        expected = ExecuteUnit(pcontracts)._all_data
+        for executor in ('thread', 'process'):
+            ConfigUtil.set(load_workers=3, load_executor=executor)
+            try:
+                unit = ExecuteUnit(pcontracts)
+            finally:
+                ConfigUtil.set(load_workers=1, load_executor='thread')
+            self.assertEqual(list(unit._all_data.keys()),
+                             list(expected.keys()))
+            for key, data in six.iteritems(expected):
+                pd.testing.assert_frame_equal(unit._all_data[key], data)
+            self.assertEqual(list(unit.load_timings.keys()),
+                             list(expected.keys()))
+            self.assertTrue(all(t >= 0 for t in unit.load_timings.values()))
+
+
+class TestTimeline(unittest.TestCase):
+
+    def test_case(self):
+        """
+        测试：全局时间轴归并，每步只包含有新Bar的合约，且合约顺序不变。
+        """
+        def frame(dts):
+            return pd.DataFrame({'close': range(len(dts))},
+                                index=pd.to_datetime(dts))
+
+        all_data = OrderedDict([
+            ('B', frame(['2016-1-1', '2016-1-3', '2016-1-4'])),
+            ('A', frame(['2016-1-1', '2016-1-2', '2016-1-4'])),
+        ])
+        timeline = Timeline(all_data)
+        self.assertEqual(len(timeline), 4)
+        steps = [(str(dt.date()), pcons) for dt, pcons in timeline]
+        self.assertEqual(steps, [
+            ('2016-01-01', ['B', 'A']),
+            ('2016-01-02', ['A']),
+            ('2016-01-03', ['B']),
+            ('2016-01-04', ['B', 'A']),
+        ])
+        self.assertEqual(list(timeline.positions['A']), [0, 1, 3])
+        self.assertEqual(list(timeline.advancing(2)), [0])
+
+
+class TestRingSeries(unittest.TestCase):
+
+    def test_case(self):
+        """
+        测试：固定窗口的用户序列变量和普通序列变量的回溯结果一致。
+        """
+        full, ring, overflow = [], [], []
+        lengths = []
+
+        class DemoStrategy(Strategy):
+            def on_init(self, ctx):
+                ctx.full = NumberSeries()
+                ctx.ring = NumberSeries(window=5)
+
+            def on_symbol(self, ctx):
+                ctx.full.update(ctx.close[0] + ctx.full[1])
+                ctx.ring.update(ctx.close[0] + ctx.ring[1])
+                full.append([ctx.full[i] for i in range(5)])
+                ring.append([ctx.ring[i] for i in range(5)])
+                lengths.append(len(ctx.ring))
+                try:
+                    ctx.ring[5]
+                except SeriesIndexError:
+                    overflow.append(True)
+
+        add_strategies(['BB.TEST-1.Minute'], [
+            {
+                'strategy': DemoStrategy('A1'),
+                'capital': 1000000.0,
+            }
+        ])
+        self.assertTrue(len(full) > 5)
+        self.assertEqual(full, ring)
+        self.assertEqual(set(lengths), set([5]))
+        self.assertEqual(len(overflow), len(full) - 5)
+
+
+class TestStreaming(unittest.TestCase):
+
+    def test_case(self):
+        """
+        测试：流式模式下多合约的时间对齐、系统变量、用户变量回溯和
+              交易结果与预加载模式一致。
+        """
+        def run(**kwargs):
+            steps = []
+
+            class DemoStrategy(Strategy):
+                def on_init(self, ctx):
+                    ctx.acc = NumberSeries()
+
+                def on_symbol(self, ctx):
+                    ctx.acc.update(ctx.close[0] + ctx.acc[1])
+                    steps.append((str(ctx.pcontract), ctx.datetime[0],
+                                  ctx.curbar, ctx.open[3], ctx.acc[2]))
+
+                def on_bar(self, ctx):
+                    t = ctx['TWODAY.TEST-5.Second']
+                    if t.curbar == 0:
+                        return
+                    steps.append((ctx.datetime[0], t.datetime[0], t.curbar))
+                    if ctx.curbar % 10 == 0:
+                        ctx.buy(ctx.close, 1)
+                    elif ctx.curbar % 10 == 5 and ctx.pos() > 0:
+                        ctx.sell(ctx.close, ctx.pos())
+
+            unit = ExecuteUnit(['TWODAY.TEST-5.Second',
+                                'oneday.TEST-1.Minute'], **kwargs)
+            profiles = list(unit.add_strategies([{
+                'strategy': DemoStrategy('A1'),
+                'capital': 1000000.0,
+            }]))
+            unit.run()
+            equities = list(profiles[0].all_holdings()['equity'])
+            return steps, equities
+
+        steps, equities = run()
+        stream_steps, stream_equities = run(chunksize=7, window=10)
+        self.assertTrue(len(steps) > 100)
+        self.assertEqual(steps, stream_steps)
+        self.assertEqual(equities, stream_equities)
+
+    def test_timeline(self):
+        """
+        测试：流式时间轴按时间归并各合约，同一时间的合约保持原有顺序，
+              只重新查询本步有新Bar的合约。
+        """
+        class _Original(object):
+            def __init__(self, dts):
+                self.dts = dts
+                self.queries = 0
+
+            @property
+            def pending_datetime(self):
+                self.queries += 1
+                return self.dts[0] if self.dts else None
+
+        originals = OrderedDict([('A', _Original([1, 3, 4])),
+                                 ('B', _Original([])),
+                                 ('C', _Original([1, 2, 4, 5]))])
+        steps = []
+        for dt, pcons in StreamTimeline(originals):
+            steps.append((dt, pcons))
+            for pcon in pcons:
+                originals[pcon].dts.pop(0)
+        self.assertEqual(steps, [(1, ['A', 'C']), (2, ['C']), (3, ['A']),
+                                 (4, ['A', 'C']), (5, ['C'])])
+        # 建堆时查询一次，之后每根Bar查询一次。
+        self.assertEqual([o.queries for o in originals.values()], [4, 1, 5])
+
+    def test_technical(self):
+        """
+        测试：流式模式下在on_init中定义技术指标时报错。
+        """
+        class DemoStrategy(Strategy):
+            def on_init(self, ctx):
+                ctx.ma = MA(ctx.close, 2)
+
+        unit = ExecuteUnit(['TWODAY.TEST-5.Second'], chunksize=7, window=10)
+        list(unit.add_strategies([{'strategy': DemoStrategy('A1'),
+                                   'capital': 1000000.0}]))
+        with self.assertRaises(StreamTechnicalError) as cm:
+            unit.run()
+        self.assertIn('10', str(cm.exception))
+        self.assertIn('ma', str(cm.exception))
+
+
+class TestDirectTrading(unittest.TestCase):
+
+    def test_case(self):
+        """
+        测试：不经过事件池的直接调用方式和事件方式的成交、撤单和资金历史一致。
+        """
+        def run(direct):
+            cancels = []
+
+            class DemoStrategy(Strategy):
+                def on_bar(self, ctx):
+                    orders = [o for o in ctx.open_orders
+                              if o.side == TradeSide.OPEN]
+                    if orders and ctx.curbar % 7 == 3:
+                        ctx.cancel(min(orders, key=lambda o: o.id))
+                        cancels.append(ctx.curbar)
+                    for symbol in ('FUTURE.TEST', 'FUTURE2.TEST'):
+                        close = ctx[symbol + '-1.MINUTE'].close[0]
+                        pending = set(o.direction for o in ctx.open_orders
+                                      if str(o.contract) == symbol)
+                        long_pos = ctx.position('long', symbol)
+                        short_pos = ctx.position('short', symbol)
+                        if ctx.curbar % 5 == 0:
+                            if not long_pos and Direction.LONG not in pending:
+                                ctx.buy(close - 0.2, 1, symbol)
+                            if not short_pos and \
+                                    Direction.SHORT not in pending:
+                                ctx.short(close + 0.2, 1, symbol)
+                        elif ctx.curbar % 5 == 2:
+                            if long_pos and long_pos.closable > 0:
+                                ctx.sell(0, long_pos.closable, symbol)
+                            if short_pos and short_pos.closable > 0:
+                                ctx.cover(close, short_pos.closable, symbol)
+
+            unit = ExecuteUnit(['FUTURE.TEST-1.Minute',
+                                'FUTURE2.TEST-1.Minute'], direct=direct)
+            profile = list(unit.add_strategies([{
+                'strategy': DemoStrategy('A1'),
+                'capital': 1000000.0,
+            }]))[0]
+            unit.run()
+            trans = [(t.datetime, str(t.contract), t.side, t.direction,
+                      t.price, t.quantity) for t in profile.transactions()]
+            return trans, list(profile.holdings_history()), cancels
+
+        trans, holdings, cancels = run(False)
+        direct_trans, direct_holdings, direct_cancels = run(True)
+        self.assertTrue(len(trans) > 100 and len(cancels) > 0)
+        self.assertEqual(trans, direct_trans)
+        self.assertEqual(holdings, direct_holdings)
+        self.assertEqual(cancels, direct_cancels)
+
+
+class TestUniverse(unittest.TestCase):
+
+    def test_case(self):
+        """
+        测试：截面策略每步得到的各合约数据和指标与逐合约运行一致，
+              批量调整到目标仓位。
+        """
+        pcons = ['AA.TEST-1.Minute', 'CC.TEST-1.Minute',
+                 'FUTURE.TEST-1.Minute']
+        expected = {}
+        steps = []
+        contracts = []
+
+        class SymbolStrategy(Strategy):
+            def on_init(self, ctx):
+                ctx.ma = MA(ctx.close, 3)
+
+            def on_symbol(self, ctx):
+                expected[(str(ctx.contract), ctx.datetime[0])] = (
+                    ctx.close[0], ctx.volume[0], ctx.ma[0])
+
+        class DemoUniverse(UniverseStrategy):
+            def on_init(self, ctx):
+                ctx.ma = MA(ctx.close, 3)
+
+            def on_universe(self, ctx, universe):
+                ma = universe.indicator('ma')
+                contracts[:] = [str(c) for c in universe.contracts]
+                holdings = [ctx.pos('long', c) for c in universe.contracts]
+                steps.append((universe.mask.copy(), universe.valid.copy(),
+                              universe.datetime, universe.close,
+                              universe.volume, ma, holdings))
+                targets = np.where(universe.close > ma, 2, 0)
+                ctx.order_target(universe.contracts, targets, universe.close)
+
+        add_strategies(pcons, [{'strategy': SymbolStrategy('A1'),
+                                'capital': 1000000.0}])
+        add_strategies(pcons, [{'strategy': DemoUniverse('A2'),
+                                'capital': 1000000.0}])
+        self.assertTrue(len(steps) > 100)
+        self.assertEqual(sorted(contracts),
+                         ['AA.TEST', 'CC.TEST', 'FUTURE.TEST'])
+        prev_targets = None
+        for mask, valid, dts, closes, volumes, ma, holdings in steps:
+            self.assertTrue(mask.any())
+            self.assertTrue((valid >= mask).all())
+            for i, contract in enumerate(contracts):
+                if not valid[i]:
+                    self.assertTrue(np.isnan(closes[i]))
+                    continue
+                close, volume, ma_value = expected[(contract, dts[i])]
+                self.assertEqual(closes[i], close)
+                self.assertEqual(volumes[i], volume)
+                self.assertTrue(ma[i] == ma_value or
+                                (np.isnan(ma[i]) and np.isnan(ma_value)))
+            if prev_targets is not None:
+                # 以收盘价下的限价单在当根Bar成交。
+                self.assertEqual(holdings, prev_targets)
+            prev_targets = list(np.where(closes > ma, 2, 0))
+        self.assertTrue(any(h == 2 for step in steps for h in step[-1]))
+
+
+class TestRebalance(unittest.TestCase):
+
+    def test_case(self):
+        """
+        测试：按目标权重批量调仓，平仓释放的资金可用于同一批开仓，
+              超出可用资金的开仓单整体舍去。
+        """
+        checks = []
+        rejections = []
+
+        class DemoRebalance(UniverseStrategy):
+            def __init__(self, name):
+                super(DemoRebalance, self).__init__(name)
+                self.step = 0
+                self.expected = None
+
+            def on_universe(self, ctx, universe):
+                names = [str(c) for c in universe.contracts]
+                holdings = dict((name, ctx.pos('long', c) -
+                                 ctx.pos('short', c))
+                                for name, c in zip(names, universe.contracts))
+                if self.expected is not None:
+                    checks.append((holdings, self.expected))
+                    self.expected = None
+                self.step += 1
+                if self.step == 2:
+                    weights = dict([('AA.TEST', 0.3), ('BB.TEST', 0.2),
+                                    ('FUTURE.TEST', -0.3)])
+                    w = np.array([weights[name] for name in names])
+                    equity = ctx.equity()
+                    mult = np.array([3.0 if name == 'FUTURE.TEST' else 1.0
+                                     for name in names])
+                    rejections.append(
+                        ctx.rebalance(universe.contracts, weights=w))
+                    self.expected = dict(zip(names, np.trunc(
+                        w * equity / (universe.close * mult)).astype(int)))
+                elif self.step == 4:
+                    # 平掉期货空仓，释放的保证金用于两个股票加仓到满仓
+                    weights = dict([('AA.TEST', 0.55), ('BB.TEST', 0.45),
+                                    ('FUTURE.TEST', 0.0)])
+                    w = np.array([weights[name] for name in names])
+                    rejections.append(
+                        ctx.rebalance(universe.contracts, weights=w))
+                    self.expected = dict(
+                        (name, 0 if name == 'FUTURE.TEST' else
+                         int(w[i] * ctx.equity() / universe.close[i]))
+                        for i, name in enumerate(names))
+                elif self.step == 6:
+                    # 满仓后继续加仓超出可用资金，开仓单舍去
+                    weights = dict([('AA.TEST', 0.7), ('BB.TEST', np.nan),
+                                    ('FUTURE.TEST', np.nan)])
+                    w = np.array([weights[name] for name in names])
+                    rejections.append(
+                        ctx.rebalance(universe.contracts, weights=w))
+                    self.expected = holdings
+
+        add_strategies(['AA.TEST-1.Minute', 'BB.TEST-1.Minute',
+                        'FUTURE.TEST-1.Minute'],
+                       [{'strategy': DemoRebalance('A1'),
+                         'capital': 100000.0}])
+        self.assertEqual([[str(c) for c in r] for r in rejections],
+                         [[], [], ['AA.TEST']])
+        self.assertEqual(len(checks), 3)
+        for holdings, expected in checks:
+            self.assertEqual(holdings, expected)
+        self.assertTrue(checks[0][1]['FUTURE.TEST'] < 0)
+
+    def test_unfilled_close(self):
+        """
+        测试：普通平仓单登记时不释放资金，平仓单没有成交时同一根Bar的
+              开仓单因资金不足舍去，可用资金不为负。
+        """
+        records = []
+
+        class DemoStrategy(Strategy):
+            def on_bar(self, ctx):
+                aa = ctx['AA.TEST-1.MINUTE']
+                if ctx.curbar == 1:
+                    ctx.buy(ctx.close[0],
+                            int(ctx.cash() * 0.9 / (ctx.close[0] * 0.4 * 3)))
+                elif ctx.curbar == 3:
+                    # 限价远高于最高价，平仓单不会成交。
+                    ctx.sell(ctx.close[0] * 10, ctx.pos())
+                    ctx.buy(aa.close[0],
+                            int(ctx.equity() * 0.5 / aa.close[0]), 'AA.TEST')
+                elif 3 < ctx.curbar <= 6:
+                    # 未成交平仓单冻结了可平仓位，持仓数量不变。
+                    held = ctx.position('long', 'FUTURE.TEST')
+                    records.append((held is not None and held.quantity > 0,
+                                    ctx.pos('long', 'AA.TEST'),
+                                    ctx.cash() >= 0))
+
+        add_strategies(['FUTURE.TEST-1.Minute', 'AA.TEST-1.Minute'],
+                       [{'strategy': DemoStrategy('A1'),
+                         'capital': 100000.0}])
+        self.assertEqual(records, [(True, 0, True)] * 3)
+
+
+class TestTickReplay(unittest.TestCase):
+
+    def test_case(self):
+        """
+        测试：tick回放撮合中，收盘时的订单在下一根Bar内第一次穿越限价的tick
+              成交，没有tick数据的合约按Bar展开的 开-低-高-收 路径撮合。
+        """
+        data = OrderedDict([('AA.TEST-1.MINUTE', pd.DataFrame({
+            'open': [10.0, 10.0, 11.0], 'close': [10.0, 11.0, 11.0],
+            'high': [11.0, 12.0, 11.5], 'low': [9.0, 8.0, 10.5],
+            'volume': [1.0, 1.0, 1.0],
+        }, index=pd.to_datetime(['2016-1-4 9:00', '2016-1-4 9:01',
+                                 '2016-1-4 9:02'])))])
+        ticks = {'AA.TEST': pd.Series(
+            [9.0, 10.0, 9.4, 11.6, 11.0],
+            index=pd.to_datetime(['2016-1-4 9:00:30', '2016-1-4 9:01:00',
+                                  '2016-1-4 9:01:20', '2016-1-4 9:01:40',
+                                  '2016-1-4 9:02:00']))}
+
+        class DemoStrategy(Strategy):
+            def on_bar(self, ctx):
+                if ctx.curbar == 1:
+                    ctx.buy(9.5, 1)
+                    ctx.short(11.5, 1)
+                    ctx.buy(0, 2)
+                    ctx.short(13, 1)
+
+        def run(ticks, direct=False):
+            unit = ExecuteUnit(['AA.TEST-1.MINUTE'], data=data, ticks=ticks,
+                               direct=direct)
+            profile = list(unit.add_strategies([{
+                'strategy': DemoStrategy('A1'),
+                'capital': 1000000.0,
+            }]))[0]
+            unit.run()
+            return [(str(t.datetime), t.direction, t.price, t.quantity)
+                    for t in profile.transactions()
+                    if t.side == TradeSide.OPEN]
+
+        self.assertEqual(run({}), [
+            ('2016-01-04 09:01:00', Direction.LONG, 9.5, 1),
+            ('2016-01-04 09:01:00', Direction.SHORT, 11.5, 1),
+            ('2016-01-04 09:01:00', Direction.LONG, 10.0, 2),
+        ])
+        # 9:00:30 的tick早于下单时间，不参与撮合。
+        expected = [
+            ('2016-01-04 09:01:20', Direction.LONG, 9.5, 1),
+            ('2016-01-04 09:01:40', Direction.SHORT, 11.5, 1),
+            ('2016-01-04 09:01:00', Direction.LONG, 10.0, 2),
+        ]
+        self.assertEqual(run(ticks), expected)
+        self.assertEqual(run(ticks, direct=True), expected)
+        # 按Bar撮合时收盘即按当根Bar的最高最低价成交。
+        self.assertEqual(len(run(None)), 3)
+
+    def test_sparse_contract(self):
+        """
+        测试：tick回放撮合中，合约在下个时间步没有新Bar时，收盘时的订单
+              等到该合约的下一根Bar才撮合，不会按下单的那根Bar成交。
+        """
+        def frame(dts, low):
+            return pd.DataFrame({
+                'open': [100.0] * len(dts), 'close': [100.0] * len(dts),
+                'high': [101.0] * len(dts), 'low': low,
+                'volume': [1.0] * len(dts)}, index=pd.to_datetime(dts))
+
+        data = OrderedDict([
+            ('AA.TEST-1.MINUTE', frame(['2016-1-4 9:00', '2016-1-4 9:01',
+                                        '2016-1-4 9:02'], [99.0] * 3)),
+            ('BB.TEST-1.MINUTE', frame(['2016-1-4 9:00', '2016-1-4 9:02'],
+                                       [99.0, 99.8])),
+        ])
+
+        class DemoStrategy(Strategy):
+            def on_bar(self, ctx):
+                if ctx.curbar == 1:
+                    ctx.buy(99.5, 1, 'BB.TEST')
+
+        def run(direct):
+            unit = ExecuteUnit(['AA.TEST-1.MINUTE', 'BB.TEST-1.MINUTE'],
+                               data=data, ticks={}, direct=direct)
+            profile = list(unit.add_strategies([{
+                'strategy': DemoStrategy('A1'),
+                'capital': 1000000.0,
+            }]))[0]
+            unit.run()
+            return [t for t in profile.transactions()
+                    if t.side == TradeSide.OPEN]
+
+        # 9:00 的Bar最低价已经穿过限价，9:02 的Bar没有穿过。
+        self.assertEqual(run(False), [])
+        self.assertEqual(run(True), [])
+
+
+class TestBarStore(unittest.TestCase):
+
+    def test_case(self):
+        """
+        测试：列式Bar视图读取各合约最新Bar，同一合约多周期时读取最近更新的周期，
+              记录每个时间步有新Bar的合约。
+        """
+        def frame(dts, base):
+            n = len(dts)
+            return pd.DataFrame({
+                'open': np.arange(n) + base, 'close': np.arange(n) + base + 1,
+                'high': np.arange(n) + base + 2, 'low': np.arange(n) + base - 1,
+                'volume': np.arange(n) * 10,
+            }, index=pd.to_datetime(dts))
+
+        market_data = MarketData(OrderedDict([
+            ('AA.TEST-1.MINUTE', frame(['2016-1-1 9:00', '2016-1-1 9:01'], 100)),
+            ('AA.TEST-5.SECOND', frame(['2016-1-1 9:00:05'], 200)),
+        ]))
+        bars = market_data.bars
+        contract = market_data.originals['AA.TEST-1.MINUTE'].contract
+        self.assertFalse(contract in bars)
+        self.assertRaises(KeyError, bars.close, contract)
+
+        market_data.rolling_forward('AA.TEST-1.MINUTE')
+        market_data.update_system_vars('AA.TEST-1.MINUTE')
+        self.assertTrue(contract in bars)
+        self.assertEqual(bars.close(contract), 101.0)
+        self.assertEqual(bars.datetime(contract),
+                         datetime.datetime(2016, 1, 1, 9, 0))
+
+        self.assertEqual(bars.updated, [contract])
+
+        bars.new_step()
+        market_data.rolling_forward('AA.TEST-5.SECOND')
+        market_data.update_system_vars('AA.TEST-5.SECOND')
+        self.assertEqual(bars.open(contract), 200.0)
+        self.assertEqual(bars.updated, [contract])
+
+        market_data.rolling_forward('AA.TEST-1.MINUTE')
+        market_data.update_system_vars('AA.TEST-1.MINUTE')
+        bar = bars[contract]
+        self.assertEqual((bar.open, bar.close, bar.high, bar.low, bar.volume),
+                         (101.0, 102.0, 103.0, 100.0, 10.0))
+
+
+class TestOrderBook(unittest.TestCase):
+
+    def test_case(self):
+        """
+        测试：按价格排序的订单簿一次取出所有能成交的限价单。
+        """
+        contract = Contract('BB.TEST')
+
+        def order(side, direction, price):
+            return Order(None, contract, PriceType.LMT, side, direction,
+                         price, 1)
+
+        buys = [order(TradeSide.OPEN, Direction.LONG, p) for p in (9, 10, 11)]
+        sells = [order(TradeSide.CLOSE, Direction.LONG, p) for p in (9, 10, 11)]
+        cover = order(TradeSide.CLOSE, Direction.SHORT, 12)
+        book = OrderBook()
+        for o in buys + sells + [cover]:
+            book.add(o)
+        book.remove(buys[2])
+        self.assertEqual(len(book), 6)
+        # 开多和平空价格不低于10成交，平多价格不高于9.5成交。
+        crossed = book.pop_crossed(10, 9.5)
+        self.assertEqual(set(crossed), set([buys[1], cover, sells[0]]))
+        self.assertEqual(len(book), 3)
+        self.assertEqual(book.pop_crossed(100, 0), [])
+        self.assertEqual(set(book.pop_all()),
+                         set([buys[0], sells[1], sells[2]]))
+
+
+class TestHoldingsHistory(unittest.TestCase):
+
+    def test_case(self):
+        """
+        测试：列式资金历史自动扩容，DataFrame视图共享内存，按下标访问返回dict。
+        """
+        dts = pd.date_range('2016-1-1 9:00', periods=5, freq='min')
+        history = HoldingsHistory(2)
+        for i, dt in enumerate(dts):
+            history.append(dt, i, 100.0 + i, 90.0 + i, 0.0)
+        history.update_last(dts[-1], 4, 200.0, 190.0, 5.0)
+        self.assertEqual(len(history), 5)
+        self.assertEqual(history[-1], {
+            'datetime': dts[-1], 'commission': 4.0, 'equity': 200.0,
+            'cash': 190.0, 'position_profit': 5.0
+        })
+        self.assertEqual([hd['equity'] for hd in history],
+                         [100.0, 101.0, 102.0, 103.0, 200.0])
+        self.assertEqual(history[1:3], list(history)[1:3])
+        self.assertRaises(IndexError, history.__getitem__, 5)
+
+        frame = history.to_frame()
+        self.assertTrue((frame.index == dts).all())
+        self.assertTrue(np.shares_memory(frame['equity'].values,
+                                         history.equity))
+
+        total = HoldingsHistory.sum([history, history])
+        self.assertEqual(total[0]['cash'], 180.0)
+        self.assertEqual(total[0]['datetime'], dts[0])
+
+        # 长度或时间不一致的资金历史不能加总。
+        shorter = HoldingsHistory(10)
+        shifted = HoldingsHistory(10)
+        for i, dt in enumerate(dts):
+            if i < 4:
+                shorter.append(dt, 0, 100.0, 100.0, 0.0)
+            shifted.append(dt + pd.Timedelta('1min'), 0, 100.0, 100.0, 0.0)
+        self.assertRaises(DataAlignError, HoldingsHistory.sum,
+                          [history, shorter])
+        self.assertRaises(DataAlignError, HoldingsHistory.sum,
+                          [history, shifted])
+
+
+class TestProfileHoldings(unittest.TestCase):
+
+    def test_case(self):
+        """
+        测试：Profile.all_holdings返回共享内存的DataFrame，资金曲线和
+              统计结果和按旧的dict列表计算一致，且不修改资金历史。
+        """
+        class DemoStrategy(Strategy):
+            def on_bar(self, ctx):
+                if ctx.curbar % 10 == 1:
+                    ctx.buy(ctx.close, 1)
+                elif ctx.curbar % 10 == 6 and ctx.pos() > 0:
+                    ctx.sell(ctx.close, ctx.pos())
+
+        profiles = add_strategies(['BB.TEST-1.Minute'], [
+            {'strategy': DemoStrategy('A1'), 'capital': 1000000.0},
+            {'strategy': DemoStrategy('A2'), 'capital': 500000.0},
+        ])
+        frame = profiles[0].all_holdings()
+        history = profiles[0].holdings_history()
+        self.assertIsInstance(frame, pd.DataFrame)
+        self.assertEqual(list(frame.columns), list(HoldingsHistory.columns))
+        self.assertTrue(np.shares_memory(frame['equity'].values,
+                                         history.equity))
+        self.assertEqual(list(frame.index), [hd['datetime'] for hd in history])
+
+        curve = finance.create_equity_curve(frame)
+        expected = finance.create_equity_curve(list(history))
+        pd.testing.assert_frame_equal(curve[expected.columns], expected,
+                                      check_freq=False)
+        self.assertEqual(list(frame.columns), list(HoldingsHistory.columns))
+        self.assertEqual(finance.summary_stats(curve, 252),
+                         finance.summary_stats(expected, 252))
+
+        total = Profile.all_holdings_sum(profiles)
+        np.testing.assert_array_equal(
+            total['equity'].values,
+            frame['equity'].values + profiles[1].all_holdings()['equity'])
+        curve = finance.create_equity_curve(total)
+        self.assertAlmostEqual(curve['networth'].iloc[-1],
+                               total['equity'].iloc[-1] / 1500000.0)
+
+
+class TestContractSpec(unittest.TestCase):
+
+    def setUp(self):
+        self._saved = (Contract.info, Contract.source_type, Contract._specs)
+
+    def tearDown(self):
+        # 失败时也恢复合约信息，避免影响之后的测试。
+        Contract.info, Contract.source_type, Contract._specs = self._saved
+
+    def test_case(self):
+        """
+        测试：合约规格表的查询结果和合约信息表一致，规格缓存在合约对象上。
+        """
+        Contract.source_type = 'test'
+        Contract.set_info(pd.DataFrame({
+            'long_margin_ratio': [0.4, 1.0],
+            'short_margin_ratio': [0.3, 1.0],
+            'volume_multiple': [3, 1],
+        }, index=['FUTURE.TEST', 'STOCK.TEST']))
+        contract = Contract('future.TEST')
+        spec = contract.spec
+        self.assertEqual((spec.long_margin_ratio, spec.short_margin_ratio,
+                          spec.volume_multiple), (0.4, 0.3, 3))
+        self.assertTrue(contract.spec is spec)
+        self.assertEqual(spec.margin_ratio(Direction.SHORT), 0.3)
+        self.assertEqual(Contract.volume_multiple('future.test'), 3)
+        self.assertEqual(Contract.long_margin_ratio('AA.TEST'), 1)
+
+        order = Order(None, contract, PriceType.LMT, TradeSide.OPEN,
+                      Direction.LONG, 10.0, 2)
+        self.assertEqual(order.order_margin(10.0), 10.0 * 2 * 0.4 * 3)
+
+
+class TestContractIntern(unittest.TestCase):
+
+    def test_case(self):
+        """
+        测试：相同的合约和周期合约只有一个对象，复制和序列化后仍是同一个对象。
+        """
+        contract = Contract('aa.test')
+        self.assertTrue(contract is Contract('AA.TEST'))
+        self.assertTrue(copy.deepcopy(contract) is contract)
+        self.assertTrue(pickle.loads(pickle.dumps(contract)) is contract)
+        self.assertNotEqual(contract, Contract('BB.TEST'))
+        self.assertFalse(contract.is_stock)
+
+        pcontract = PContract.from_string('AA.TEST-1.Minute')
+        self.assertTrue(pcontract.contract is contract)
+        self.assertTrue(pcontract is PContract(contract, pcontract.period))
+        self.assertTrue(PContract.from_string('aa.test-1.MINUTE') is pcontract)
+        self.assertTrue(pickle.loads(pickle.dumps(pcontract)) is pcontract)
+
+        # 共享的对象不能修改。
+        self.assertRaises(AttributeError, setattr, contract, 'exchange', 'SH')
+        self.assertRaises(AttributeError, setattr, contract, 'is_stock', True)
+        self.assertRaises(AttributeError, delattr, contract, 'code')
+        self.assertRaises(AttributeError, setattr, pcontract, 'contract',
+                          Contract('BB.TEST'))
+        self.assertEqual((contract.exchange, contract.is_stock),
+                         ('TEST', False))
+        self.assertTrue(contract.spec is contract.spec)
+
+
 if __name__ == '__main__':
     unittest.main()
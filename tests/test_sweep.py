@@ -0,0 +1,62 @@
+# encoding: utf-8
+
+import unittest
+from quantdigger import (
+    add_strategies,
+    ParameterSweep,
+    Strategy,
+    MA,
+)
+
+
+class SweepStrategy(Strategy):
+    """ 均线交叉策略，用于参数扫描测试。 """
+
+    def __init__(self, name, fast=5, slow=10):
+        super(SweepStrategy, self).__init__(name)
+        self.fast = fast
+        self.slow = slow
+
+    def on_init(self, ctx):
+        ctx.ma_fast = MA(ctx.close, self.fast)
+        ctx.ma_slow = MA(ctx.close, self.slow)
+
+    def on_bar(self, ctx):
+        if ctx.curbar > self.slow:
+            if ctx.ma_fast[1] < ctx.ma_slow[1] and \
+                    ctx.ma_fast[0] > ctx.ma_slow[0]:
+                if ctx.pos() == 0:
+                    ctx.buy(ctx.close, 1)
+            elif ctx.ma_fast[1] > ctx.ma_slow[1] and \
+                    ctx.ma_fast[0] < ctx.ma_slow[0]:
+                if ctx.pos() > 0:
+                    ctx.sell(ctx.close, ctx.pos())
+
+
+class TestParameterSweep(unittest.TestCase):
+
+    def test_case(self):
+        """
+        测试：多进程参数扫描的结果和串行回测一致。
+        """
+        sweep = ParameterSweep(['BB.TEST-1.Minute'], SweepStrategy,
+                               {'fast': [3, 5], 'slow': [10, 20]},
+                               capital=1000000.0, processes=2)
+        self.assertEqual(len(sweep.combinations()), 4)
+        results = sweep.run()
+        self.assertEqual([r['params'] for r in results], sweep.combinations())
+
+        for result in results:
+            params = result['params']
+            profile = add_strategies(['BB.TEST-1.Minute'], [{
+                'strategy': SweepStrategy('serial', **params),
+                'capital': 1000000.0
+            }])[0]
+            equity = profile.all_holdings()['equity'].iloc[-1]
+            self.assertAlmostEqual(result['equity'], equity)
+            self.assertEqual(result['num_transactions'],
+                             len(profile.transactions()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+# encoding: utf-8
+
+import unittest
+import numpy as np
+import pandas as pd
+import talib
+from quantdigger import (
+    add_strategies,
+    add_vectorized_strategies,
+    Strategy,
+    VectorStrategy,
+    MA,
+)
+from quantdigger.engine.costs import (
+    FixedCommission,
+    TickSlippage,
+    adjust_equity,
+    fill_costs,
+    recost,
+)
+
+FAST, SLOW = 5, 20
+
+
+class EventMACross(Strategy):
+    """ 均线交叉反手策略，逐根Bar运行。 """
+
+    def on_init(self, ctx):
+        ctx.ma_fast = MA(ctx.close, FAST)
+        ctx.ma_slow = MA(ctx.close, SLOW)
+
+    def on_bar(self, ctx):
+        if ctx.curbar > SLOW:
+            if ctx.ma_fast[1] < ctx.ma_slow[1] and \
+                    ctx.ma_fast[0] > ctx.ma_slow[0]:
+                if ctx.pos('short') > 0:
+                    ctx.cover(ctx.close, ctx.pos('short'))
+                ctx.buy(ctx.close, 1)
+            elif ctx.ma_fast[1] > ctx.ma_slow[1] and \
+                    ctx.ma_fast[0] < ctx.ma_slow[0]:
+                if ctx.pos('long') > 0:
+                    ctx.sell(ctx.close, ctx.pos('long'))
+                ctx.short(ctx.close, 1)
+
+
+class VectorMACross(VectorStrategy):
+    """ 均线交叉反手策略，向量化运行。 """
+
+    def target_positions(self, data):
+        targets = {}
+        for strpcon, df in data.items():
+            close = df.close.values.astype(np.float64)
+            fast = talib.SMA(close, FAST)
+            slow = talib.SMA(close, SLOW)
+            up = np.zeros(len(close), dtype=bool)
+            down = np.zeros(len(close), dtype=bool)
+            up[1:] = (fast[:-1] < slow[:-1]) & (fast[1:] > slow[1:])
+            down[1:] = (fast[:-1] > slow[:-1]) & (fast[1:] < slow[1:])
+            up[:SLOW] = down[:SLOW] = False
+            signal = np.where(up, 1.0, np.where(down, -1.0, np.nan))
+            targets[strpcon] = pd.Series(signal).ffill().fillna(0).values
+        return targets
+
+
+class TestVectorized(unittest.TestCase):
+
+    def test_case(self):
+        """
+        测试：向量化回测的资金历史，成交明细与事件回测一致。
+        """
+        pcons = ['BB.TEST-1.Minute']
+        event = add_strategies(pcons, [{
+            'strategy': EventMACross('event'),
+            'capital': 1000000.0
+        }])[0]
+        vector = add_vectorized_strategies(pcons, [{
+            'strategy': VectorMACross('vector'),
+            'capital': 1000000.0
+        }])[0]
+        event_holdings = event.holdings_history()
+        vector_holdings = vector.holdings_history()
+        self.assertEqual(len(event_holdings), len(vector_holdings))
+        for ehd, vhd in zip(event_holdings, vector_holdings):
+            self.assertEqual(ehd['datetime'], vhd['datetime'])
+            self.assertAlmostEqual(ehd['equity'], vhd['equity'])
+            self.assertAlmostEqual(ehd['cash'], vhd['cash'])
+            self.assertAlmostEqual(ehd['commission'], vhd['commission'])
+
+        event_trans = event.transactions()
+        vector_trans = vector.transactions()
+        self.assertTrue(len(vector_trans) > 0)
+        self.assertEqual(len(event_trans), len(vector_trans))
+        for etrans, vtrans in zip(event_trans, vector_trans):
+            self.assertEqual(etrans.datetime, vtrans.datetime)
+            self.assertEqual(etrans.side, vtrans.side)
+            self.assertEqual(etrans.direction, vtrans.direction)
+            self.assertEqual(etrans.quantity, vtrans.quantity)
+            self.assertAlmostEqual(etrans.price, vtrans.price)
+        self.assertEqual(len(event.deals()), len(vector.deals()))
+
+    def test_costs(self):
+        """
+        测试：事件回测和向量化回测使用相同的佣金和滑点模型，结果一致；
+              事后按新的成本模型重算成本，调整后的资金曲线和用该模型
+              回测的结果一致。
+        """
+        pcons = ['BB.TEST-1.Minute']
+        costs = {'commission': FixedCommission(5.0),
+                 'slippage': TickSlippage(1, 0.2)}
+        event = add_strategies(pcons, [dict(costs, **{
+            'strategy': EventMACross('event'),
+            'capital': 1000000.0
+        })])[0]
+        vector = add_vectorized_strategies(pcons, [dict(costs, **{
+            'strategy': VectorMACross('vector'),
+            'capital': 1000000.0
+        })])[0]
+        event_trans = event.transactions()
+        self.assertTrue(len(event_trans) > 0)
+        for etrans, vtrans in zip(event_trans, vector.transactions()):
+            self.assertEqual(etrans.commission, 5.0)
+            # 最后的强平不计滑点。
+            self.assertEqual(etrans.slippage,
+                             0.0 if etrans is event_trans[-1] else 0.2)
+            self.assertAlmostEqual(etrans.price, vtrans.price)
+            self.assertAlmostEqual(etrans.commission, vtrans.commission)
+        for ehd, vhd in zip(event.holdings_history(),
+                            vector.holdings_history()):
+            self.assertAlmostEqual(ehd['equity'], vhd['equity'])
+
+        plain = add_strategies(pcons, [{
+            'strategy': EventMACross('plain'),
+            'capital': 1000000.0
+        }])[0]
+        before = fill_costs(plain.transactions())
+        after = recost(before, **costs)
+        np.testing.assert_allclose(after['price'].values,
+                                   fill_costs(event_trans)['price'].values)
+        # 重算时最后的强平也计滑点。
+        np.testing.assert_allclose(after['cost'].values[:-1],
+                                   fill_costs(event_trans)['cost'].values[:-1])
+        equity = plain.all_holdings()['equity']
+        np.testing.assert_allclose(
+            adjust_equity(equity, before, after).values[:-1],
+            event.all_holdings()['equity'].values[:-1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -89,13 +89,13 @@ class TestOneDataOneCombination(unittest.TestCase):
                                                                                               smg,
                                                                                               multi,
                                                                                               1)
-                for i, hd in enumerate(profiles[0].all_holdings()):
+                for i, hd in enumerate(profiles[0].holdings_history()):
                     test.assertAlmostEqual(self.open_equity[i], open_equity[i])
                     test.assertAlmostEqual(self.open_cash[i], open_cashes[i])
                     test.assertAlmostEqual(hd['equity'], close_equity[i])
                     test.assertAlmostEqual(hd['cash'], close_cash[i])
                     test.assertTrue(hd['datetime'] == dts[i], 'all_holdings接口测试失败！')
-                    test.assertTrue(len(profiles[0].all_holdings()) == len(close_equity) and
+                    test.assertTrue(len(profiles[0].holdings_history()) == len(close_equity) and
                                     len(close_equity) > 0, 'holdings接口测试失败！')
 
         class DemoStrategy2(Strategy):
@@ -136,15 +136,15 @@ class TestOneDataOneCombination(unittest.TestCase):
                 close_cash = [x + y for x, y in zip(c0, c1)]
                 open_equity = [x + y for x, y in zip(oe0, oe1)]
                 open_cash = [x + y for x, y in zip(oc0, oc1)]
-                test.assertTrue(len(close_equity) == len(profiles[1].all_holdings()))
+                test.assertTrue(len(close_equity) == len(profiles[1].holdings_history()))
                 for i in range(len(close_equity)):
-                    hd = profiles[1].all_holdings()[i]
+                    hd = profiles[1].holdings_history()[i]
                     test.assertAlmostEqual(self.open_equity[i], open_equity[i])
                     test.assertAlmostEqual(self.open_cash[i], open_cash[i])
                     test.assertAlmostEqual(hd['equity'], close_equity[i])
                     test.assertAlmostEqual(hd['cash'], close_cash[i])
                     test.assertTrue(hd['datetime'] == dts[i], 'all_holdings接口测试失败！')
-                    test.assertTrue(len(profiles[0].all_holdings()) == len(close_equity) and
+                    test.assertTrue(len(profiles[0].holdings_history()) == len(close_equity) and
                                     len(close_equity) > 0, 'holdings接口测试失败！')
 
         class DemoStrategy3(Strategy):
@@ -221,11 +221,11 @@ class TestOneDataOneCombination(unittest.TestCase):
         s2.test(self)
 
         # test all_holdings
-        for i in range(0, len(profiles[0].all_holdings())):
-            hd = all_holdings[i]
-            hd0 = profiles[0].all_holdings()[i]
-            hd1 = profiles[1].all_holdings()[i]
-            hd2 = profiles[2].all_holdings()[i]
+        for i in range(0, len(profiles[0].holdings_history())):
+            hd = all_holdings.iloc[i]
+            hd0 = profiles[0].holdings_history()[i]
+            hd1 = profiles[1].holdings_history()[i]
+            hd2 = profiles[2].holdings_history()[i]
             self.assertTrue(hd['cash'] == hd0['cash'] + hd1['cash'] + hd2['cash'],
                             'all_holdings接口测试失败！')
             self.assertTrue(hd['commission'] == hd0['commission'] +
@@ -266,8 +266,8 @@ class TestOneDataOneCombination2(unittest.TestCase):
             def test(self, test):
                 equities, cashes, open_equities, open_cashes, dts =\
                     in_closed_nextbar(source, buy_entries, capital / 4, lmg, smg, multi, 1)
-                test.assertTrue(len(profiles[0].all_holdings()) == len(equities) and len(equities) > 0, '模拟器测试失败！')
-                for i, hd in enumerate(profiles[0].all_holdings()):
+                test.assertTrue(len(profiles[0].holdings_history()) == len(equities) and len(equities) > 0, '模拟器测试失败！')
+                for i, hd in enumerate(profiles[0].holdings_history()):
                     test.assertTrue(hd['datetime'] == dts[i], '模拟器测试失败！')
                     test.assertAlmostEqual(hd['equity'], equities[i])
                     test.assertAlmostEqual(hd['cash'], cashes[i])
@@ -300,8 +300,8 @@ class TestOneDataOneCombination2(unittest.TestCase):
                 # short
                 equities, cashes, open_equities, open_cashes, dts =\
                     in_closed_nextbar(source, short_entries, capital / 4, lmg, smg, multi, -1)
-                test.assertTrue(len(profiles[2].all_holdings()) == len(equities) and len(equities) > 0, '模拟器测试失败！')
-                for i, hd in enumerate(profiles[2].all_holdings()):
+                test.assertTrue(len(profiles[2].holdings_history()) == len(equities) and len(equities) > 0, '模拟器测试失败！')
+                for i, hd in enumerate(profiles[2].holdings_history()):
                     test.assertTrue(hd['datetime'] == dts[i], '模拟器测试失败！')
                     test.assertAlmostEqual(hd['equity'], equities[i])
                     test.assertAlmostEqual(hd['cash'], cashes[i])
@@ -334,9 +334,9 @@ class TestOneDataOneCombination2(unittest.TestCase):
             def test(self, test):
                 target, cashes, open_equities, open_cashes, dts =\
                     out_closed_nextbar(source, sell_entries, capital / 4, lmg, smg, multi, 1)
-                test.assertTrue(len(profiles[1].all_holdings()) == len(target) and
+                test.assertTrue(len(profiles[1].holdings_history()) == len(target) and
                                 len(target) > 0, '模拟器测试失败！')
-                for i, hd in enumerate(profiles[1].all_holdings()):
+                for i, hd in enumerate(profiles[1].holdings_history()):
                     test.assertTrue(hd['datetime'] == dts[i], '模拟器测试失败！')
                     test.assertAlmostEqual(hd['equity'], target[i])
                     test.assertAlmostEqual(hd['cash'], cashes[i])
@@ -369,8 +369,8 @@ class TestOneDataOneCombination2(unittest.TestCase):
             def test(self, test):
                 target, cashes, open_equities, open_cashes, dts =\
                     out_closed_nextbar(source, cover_entries, capital / 4, lmg, smg, multi, -1)
-                test.assertTrue(len(profiles[3].all_holdings()) == len(target) and len(target) > 0, '模拟器测试失败！')
-                for i, hd in enumerate(profiles[3].all_holdings()):
+                test.assertTrue(len(profiles[3].holdings_history()) == len(target) and len(target) > 0, '模拟器测试失败！')
+                for i, hd in enumerate(profiles[3].holdings_history()):
                     test.assertTrue(hd['datetime'] == dts[i], '模拟器测试失败！')
                     test.assertAlmostEqual(hd['equity'], target[i])
                     test.assertAlmostEqual(hd['cash'], cashes[i])
@@ -447,7 +447,7 @@ class TestOneDataOneCombination3(unittest.TestCase):
             def test(self, test):
                 target, cashes, open_equities, open_cashes, dts =\
                     market_trade_closed_curbar(source, capital, lmg, smg, multi)
-                for i, hd in enumerate(profiles[0].all_holdings()):
+                for i, hd in enumerate(profiles[0].holdings_history()):
                     test.assertTrue(hd['datetime'] == dts[i], '模拟器测试失败！')
                     test.assertAlmostEqual(hd['equity'], target[i])
                     test.assertAlmostEqual(hd['cash'], cashes[i])
@@ -528,8 +528,9 @@ class TestOneDataOneCombination4(unittest.TestCase):
                     test.assertAlmostEqual(self.cashes[i], open_cashes[i])
                     test.assertAlmostEqual(self.equities[i], open_equities[i])
 
-                for i, hd in enumerate(Profile.all_holdings_sum(profiles)):
-                    test.assertTrue(hd['datetime'] == dts[i], 'all_holdings接口测试失败！')
+                for i, (dt, hd) in enumerate(
+                        Profile.all_holdings_sum(profiles).iterrows()):
+                    test.assertTrue(dt == dts[i], 'all_holdings接口测试失败！')
                     test.assertAlmostEqual(hd['equity'], target[i])
                     test.assertAlmostEqual(hd['cash'], cashes[i])
 
@@ -63,7 +63,7 @@ class TestOneDataOneCombinationStock(unittest.TestCase):
                     test.assertAlmostEqual(self.cashes[i], open_casheses[i])
                     test.assertAlmostEqual(self.equities[i], open_equities[i])
 
-                for i, hd in enumerate(profiles[0].all_holdings()):
+                for i, hd in enumerate(profiles[0].holdings_history()):
                     test.assertTrue(hd['datetime'] == dts[i], 'all_holdings接口测试失败！')
                     test.assertAlmostEqual(hd['equity'], equities[i])
                     test.assertAlmostEqual(hd['cash'], cashes[i])
@@ -99,7 +99,7 @@ class TestOneDataOneCombinationStock(unittest.TestCase):
                 e1, c1, oe1, oc1, dts = trade_closed_curbar(source, capital * 0.3 / 2, lmg, smg, multi, -1)
                 equities = [x + y for x, y in zip(e0, e1)]
                 cashes = [x + y for x, y in zip(c0, c1)]
-                for i, hd in enumerate(profiles[1].all_holdings()):
+                for i, hd in enumerate(profiles[1].holdings_history()):
                     test.assertTrue(hd['datetime'] == dts[i], 'all_holdings接口测试失败！')
                     test.assertAlmostEqual(hd['equity'], equities[i])
                 test.assertTrue(len(self.cashes) == len(cashes), 'cash接口测试失败！')
@@ -138,10 +138,10 @@ class TestOneDataOneCombinationStock(unittest.TestCase):
         all_holdings = Profile.all_holdings_sum(profiles)
         self.assertTrue(len(source) > 0 and len(source) == len(all_holdings), '模拟器测试失败！')
         for i in range(0, len(all_holdings)):
-            hd = all_holdings[i]
-            hd0 = profiles[0].all_holdings()[i]
-            hd1 = profiles[1].all_holdings()[i]
-            hd2 = profiles[2].all_holdings()[i]
+            hd = all_holdings.iloc[i]
+            hd0 = profiles[0].holdings_history()[i]
+            hd1 = profiles[1].holdings_history()[i]
+            hd2 = profiles[2].holdings_history()[i]
             self.assertTrue(hd['cash'] == hd0['cash'] + hd1['cash'] + hd2['cash'],
                             'all_holdings接口测试失败！')
             self.assertTrue(hd['commission'] == hd0['commission'] +
@@ -197,7 +197,7 @@ class TestMultiDataOneCombinationStock(object):
                 equities, cashes, open_equities, open_cashes, dts = \
                     buy_monday_sell_friday(source, capital * 0.3, lmg, multi)
                 count = 0
-                all_holdings0 = profiles[0].all_holdings()
+                all_holdings0 = profiles[0].holdings_history()
                 for i, hd in enumerate(all_holdings0):
                     dt = hd['datetime']
                     if dt in cashes: